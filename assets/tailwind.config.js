@@ -0,0 +1,36 @@
+// Only the classes used in these files end up in app.css. Class names built
+// in scripts must appear in full somewhere in them.
+module.exports = {
+    content: ['./lifetrack/templates/**/*.html'],
+    darkMode: 'class',
+    theme: {
+        extend: {
+            fontFamily: {
+                sans: ['Outfit', 'sans-serif'],
+            },
+            colors: {
+                dark: {
+                    900: '#0f172a', // Slate 900
+                    800: '#1e293b', // Slate 800
+                    700: '#334155', // Slate 700
+                },
+                accent: {
+                    cyan: '#06b6d4', // Cyan 500
+                    neon: '#22d3ee', // Cyan 400
+                    rose: '#f43f5e', // Rose 500
+                    green: '#10b981', // Emerald 500
+                }
+            },
+            animation: {
+                'float': 'float 6s ease-in-out infinite',
+                'pulse-slow': 'pulse 4s cubic-bezier(0.4, 0, 0.6, 1) infinite',
+            },
+            keyframes: {
+                float: {
+                    '0%, 100%': { transform: 'translateY(0)' },
+                    '50%': { transform: 'translateY(-10px)' },
+                }
+            }
+        }
+    }
+}
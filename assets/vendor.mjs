@@ -0,0 +1,21 @@
+// Copies the pinned icon, jQuery and font files from node_modules into the
+// static build directory (see package.json for the versions).
+import { copyFileSync, mkdirSync } from 'node:fs';
+import { dirname, join } from 'node:path';
+
+const BUILD = 'lifetrack/static/lifetrack/build';
+const FILES = {
+    'lucide.min.js': 'node_modules/lucide/dist/umd/lucide.min.js',
+    'jquery.min.js': 'node_modules/jquery/dist/jquery.min.js',
+};
+for (const weight of [300, 400, 600, 800]) {
+    const font = `outfit-latin-${weight}-normal.woff2`;
+    FILES[`fonts/${font}`] = `node_modules/@fontsource/outfit/files/${font}`;
+}
+
+for (const [target, source] of Object.entries(FILES)) {
+    const path = join(BUILD, target);
+    mkdirSync(dirname(path), { recursive: true });
+    copyFileSync(source, path);
+    console.log(`${source} -> ${path}`);
+}
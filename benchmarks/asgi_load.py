@@ -0,0 +1,213 @@
+"""
+Requests per second of one worker under concurrent clients: a sync WSGI worker
+(index.py, one request at a time) against one ASGI worker (lt/asgi.py, many
+requests on one event loop). In process, no server or network.
+
+    python benchmarks/asgi_load.py [--clients 16 --requests 320 --db-latency-ms 0 2 5 10] [--output load.json]
+
+Each client is its own user, so toggles don't contend on the same rows.
+A local SQLite file answers in microseconds. To emulate the round trip to a
+networked database, every query sleeps for each --db-latency-ms in turn.
+That wait is what the ASGI worker overlaps across requests; 0 measures the
+raw overhead of the async handler. SQLite has one writer, so concurrent
+toggles still queue on its write lock, where Postgres would only serialize
+toggles of the same user.
+
+Each worker gets its deployment's connection handling: WSGI keeps its
+connection, ASGI closes it after every request (see lt/asgi.py).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+
+from common import environment, setup_django
+import datagen
+
+_latency = {'seconds': 0.0}
+
+
+def install_db_latency():
+    """Sleep set_db_latency()'s value before every query on every connection."""
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        if _latency['seconds']:
+            time.sleep(_latency['seconds'])
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        # A wrapper object reconnects with the same wrapper list
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+    # SQLite's busy wait isn't fair; with every client writing, one toggle can
+    # wait past the app's 20s lock timeout, which Postgres row locks never would
+    connections.settings['default']['OPTIONS']['timeout'] = 300
+    connections.close_all()
+
+
+def set_db_latency(ms):
+    _latency['seconds'] = ms / 1000
+
+
+def set_conn_max_age(seconds):
+    from django.db import connections
+    connections.close_all()
+    connections.settings['default']['CONN_MAX_AGE'] = seconds
+
+
+def wsgi_request(app, method, path, cookie, body=b''):
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie['header'], 'HTTP_X_CSRFTOKEN': cookie['csrf'],
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    status = []
+    result = app(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+    try:
+        for _ in result:
+            pass
+    finally:
+        getattr(result, 'close', lambda: None)()
+    return status[0]
+
+
+async def asgi_request(app, method, path, cookie, body=b''):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [
+            (b'host', b'testserver'), (b'cookie', cookie['header'].encode()),
+            (b'x-csrftoken', cookie['csrf'].encode()),
+            (b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    done = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    done.set()
+    return status[0]
+
+
+def run_wsgi(app, jobs):
+    started = time.perf_counter()
+    statuses = [wsgi_request(app, *job) for job in jobs]
+    return time.perf_counter() - started, statuses
+
+
+def run_asgi(app, jobs, clients):
+    async def client(queue, statuses):
+        for job in queue:
+            statuses.append(await asgi_request(app, *job))
+
+    async def all_clients():
+        statuses = []
+        started = time.perf_counter()
+        await asyncio.gather(*(client(jobs[n::clients], statuses) for n in range(clients)))
+        return time.perf_counter() - started, statuses
+
+    return asyncio.run(all_clients())
+
+
+def run(clients, requests, latencies_ms):
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from lifetrack.models import Habit
+
+    dataset = datagen.generate(users=clients, habits=5, years=1, seed=0)
+    csrf = 'x' * 32
+    cookies = []
+    for user in User.objects.filter(username__startswith='bench').order_by('id'):
+        client = Client()
+        client.force_login(user)
+        cookies.append({
+            'header': f"sessionid={client.cookies['sessionid'].value}; csrftoken={csrf}",
+            'csrf': csrf,
+            'habit': Habit.objects.filter(user=user).order_by('id').values_list('id', flat=True).first(),
+        })
+
+    os.environ['LIFETRACK_STARTUP_MODE'] = 'off'
+    from django.core.handlers.wsgi import WSGIHandler
+    from lt.asgi import application as asgi_app
+    wsgi_app = WSGIHandler()
+    install_db_latency()
+
+    dashboard_url = reverse('lifetrack:dashboard')
+    toggle_url = reverse('lifetrack:toggle_habit')
+    cases = {
+        'dashboard': lambda c: ('GET', dashboard_url, c),
+        'toggle_habit': lambda c: ('POST', toggle_url, c, f"habit_id={c['habit']}".encode()),
+    }
+    results = {}
+    for name, job in cases.items():
+        jobs = [job(cookies[n % clients]) for n in range(requests)]
+        results[name] = {}
+        for ms in latencies_ms:
+            set_db_latency(ms)
+            # Warm up each handler first (URL resolver, templates, connections, dashboard cache)
+            set_conn_max_age(600)
+            run_wsgi(wsgi_app, jobs[:clients])
+            wsgi_seconds, wsgi_statuses = run_wsgi(wsgi_app, jobs)
+            set_conn_max_age(0)
+            run_asgi(asgi_app, jobs[:clients], clients)
+            asgi_seconds, asgi_statuses = run_asgi(asgi_app, jobs, clients)
+
+            bad = [s for s in wsgi_statuses + asgi_statuses if s != 200]
+            if bad:
+                raise SystemExit(f"{name}: {len(bad)} non-200 responses (first: {bad[0]})")
+            results[name][f'{ms:g}ms'] = {
+                'wsgi_rps': round(requests / wsgi_seconds, 1),
+                'asgi_rps': round(requests / asgi_seconds, 1),
+                'speedup': round(wsgi_seconds / asgi_seconds, 2),
+            }
+    return {
+        'environment': environment(), 'dataset': dataset,
+        'clients': clients, 'requests': requests, 'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16, help="Concurrent clients (and users)")
+    parser.add_argument('--requests', type=int, default=320, help="Requests per case, latency and worker type")
+    parser.add_argument(
+        '--db-latency-ms', type=float, nargs='+', default=[0, 2, 5, 10], help="Emulated round trips per query",
+    )
+    parser.add_argument('--output', help="Write the JSON here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        report = run(args.clients, args.requests, args.db_latency_ms)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Shared setup for the benchmark scripts: a throwaway SQLite database, the
+Django test environment (so the test client works) and timing helpers.
+"""
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_path):
+    """
+    Point Django at a fresh SQLite file and migrate it. Must run before any
+    lifetrack import.
+    """
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lt.settings')
+    os.environ.setdefault('LIFETRACK_CACHE_BACKEND', 'locmem')
+    # One process, so the per-process cache never serves another's stale entries
+    os.environ.setdefault('LIFETRACK_DASHBOARD_CACHE_TIMEOUT', '3600')
+    # Nothing is collected, so pages link the plain static names
+    os.environ.setdefault('LIFETRACK_STATIC_FALLBACK', '1')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    call_command('migrate', verbosity=0, interactive=False)
+
+
+def summarize(samples_ms):
+    samples = sorted(samples_ms)
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'min_ms': round(samples[0], 3),
+    }
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def environment():
+    """Metadata that makes two result files comparable (or shows why not)."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import django
+    import sqlite3
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+    }
@@ -0,0 +1,56 @@
+"""
+Compare two hotpaths.py result files.
+
+    python benchmarks/compare.py before.json after.json [--threshold 1.2]
+
+Exits non-zero if any case got slower by more than `threshold` (median time)
+or issues more queries than before.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(before, after, threshold):
+    rows = []
+    regressed = False
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if old is None:
+            rows.append((name, '-', f"{new['median_ms']:.3f}", '-', f"{new['queries']}"))
+            continue
+        ratio = new['median_ms'] / old['median_ms'] if old['median_ms'] else float('inf')
+        slower = ratio > threshold or new['queries'] > old['queries']
+        regressed = regressed or slower
+        rows.append((
+            name + (' !' if slower else ''),
+            f"{old['median_ms']:.3f}", f"{new['median_ms']:.3f}", f"{ratio:.2f}x",
+            f"{old['queries']} -> {new['queries']}",
+        ))
+    return rows, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2, help="Allowed median slowdown ratio")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before.get('dataset') != after.get('dataset'):
+        print("warning: the runs used different datasets", file=sys.stderr)
+
+    rows, regressed = compare(before, after, args.threshold)
+    header = ('case', 'before ms', 'after ms', 'ratio', 'queries')
+    widths = [max(len(str(r[i])) for r in rows + [header]) for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Reproducible synthetic data: N users x M habits x K years of Occurence history.
+
+    python benchmarks/datagen.py --users 100 --habits 5 --years 2 --density 0.6 --db data.sqlite3
+
+Each habit is completed on a day with probability `density`, drawn from a
+seeded RNG, so the same arguments always produce the same rows. Derived data
+(bitmaps, streaks, XP, levels, the activity rollup) is filled in the same way
+the app would have left it.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+
+from common import setup_django
+
+DIFFICULTIES = ['EASY', 'MEDIUM', 'HARD']
+CATEGORIES = ['Health', 'Coding', 'Mindfulness', 'Fitness', 'General']
+ACHIEVEMENT_CATALOG = [
+    ('STREAK', [3, 7, 30, 100, 365]),
+    ('TOTAL_COMPLETIONS', [10, 100, 1000, 5000]),
+    ('HABIT_COUNT', [1, 5, 10]),
+    ('LEVEL', [5, 10, 25]),
+]
+
+
+def seed_achievements():
+    from lifetrack.models import Achievement
+
+    Achievement.objects.bulk_create(
+        Achievement(
+            name=f'{kind.title()} {threshold}', description=f'{kind} reaches {threshold}',
+            condition_type=kind, threshold=threshold, xp_reward=threshold,
+        )
+        for kind, thresholds in ACHIEVEMENT_CATALOG for threshold in thresholds
+    )
+
+
+def generate(users=10, habits=5, years=1, density=0.7, seed=0, today=None, chunk_size=5000):
+    """
+    Populate the configured database. Returns a summary of what was written.
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from lifetrack.activity import rebuild_activity
+    from lifetrack.bitmap import CompletionBitmap
+    from lifetrack.leveling import level_for_xp
+    from lifetrack.models import Habit, Occurence, UserProfile
+    from lifetrack.streaks import streaks_from_history
+    from lifetrack.utils import calculate_xp_gain
+
+    rng = random.Random(seed)
+    today = today or date.today()
+    start = today - timedelta(days=365 * years)
+    days = [start + timedelta(days=n) for n in range((today - start).days + 1)]
+    occurrences = 0
+
+    seed_achievements()
+    for u in range(users):
+        with transaction.atomic():
+            user = User.objects.create(username=f'bench{u}', password='!')
+            profile = UserProfile.objects.get(user=user)
+            user_habits = Habit.objects.bulk_create(
+                Habit(
+                    user=user, name=f'Habit {h}', created_at=start,
+                    difficulty=DIFFICULTIES[h % len(DIFFICULTIES)], category=CATEGORIES[h % len(CATEGORIES)],
+                )
+                for h in range(habits)
+            )
+            batch = []
+            xp = completed = 0
+            for habit in user_habits:
+                dates = [day for day in days if rng.random() < density]
+                history = CompletionBitmap.from_dates(dates, start=start)
+                habit.set_history(history)
+                habit.current_streak, habit.longest_streak = streaks_from_history(history, today)
+                habit.last_completed_date = dates[-1] if dates else None
+                gained = calculate_xp_gain(habit, 0)
+                xp += gained * len(dates)
+                completed += len(dates)
+                batch.extend(Occurence(habit=habit, date=day, xp_gained=gained) for day in dates)
+                if len(batch) >= chunk_size:
+                    Occurence.objects.bulk_create(batch)
+                    occurrences += len(batch)
+                    batch = []
+            Occurence.objects.bulk_create(batch)
+            occurrences += len(batch)
+            Habit.objects.bulk_update(user_habits, [
+                'completion_bitmap', 'bitmap_start', 'current_streak', 'longest_streak', 'last_completed_date',
+            ])
+            profile.xp = xp
+            profile.level = level_for_xp(xp)
+            profile.total_habits_completed = completed
+            profile.save()
+    rebuild_activity()
+    return {'users': users, 'habits': users * habits, 'occurrences': occurrences, 'days': len(days)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=5, help="Habits per user")
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--density', type=float, default=0.7, help="Chance a habit is done on a given day")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', required=True, help="SQLite file to create")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    setup_django(os.path.abspath(args.db))
+    started = time.perf_counter()
+    summary = generate(args.users, args.habits, args.years, args.density, args.seed)
+    summary['seconds'] = round(time.perf_counter() - started, 1)
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Microbenchmarks for the lifetrack hot paths, on synthetic data in a throwaway
+SQLite database. Fully offline.
+
+    python benchmarks/hotpaths.py [--users 20 --habits 5 --years 2 --density 0.7] [--output results.json]
+    python benchmarks/compare.py before.json after.json
+
+Each case reports median/p95/min wall time and the SQL query count of one call.
+"""
+import argparse
+import json
+import os
+import tempfile
+from datetime import date
+
+from common import environment, setup_django, summarize
+import datagen
+
+
+def measure(fn, repeat, setup=None):
+    import time
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    samples = []
+    queries = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        queries.append(len(ctx.captured_queries))
+    result = summarize(samples)
+    result['queries'] = max(queries)
+    return result
+
+
+def run(repeat, **dataset):
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test import Client
+    from django.urls import reverse
+    from lifetrack.models import Habit, UserProfile
+    from lifetrack.streaks import streaks_from_history
+    from lifetrack.utils import calculate_xp_gain, check_achievements, check_level_up
+
+    summary = datagen.generate(**dataset)
+    user = User.objects.get(username='bench0')
+    habit = Habit.objects.filter(user=user).order_by('id').first()
+    client = Client()
+    client.force_login(user)
+
+    toggle_url = reverse('lifetrack:toggle_habit')
+    dashboard_url = reverse('lifetrack:dashboard')
+    achievements_url = reverse('lifetrack:achievements')
+
+    def profile():
+        return UserProfile.objects.get(user=user)
+
+    results = {
+        'toggle_habit': measure(lambda: client.post(toggle_url, {'habit_id': habit.id}), repeat),
+        'dashboard_cold': measure(lambda: client.get(dashboard_url), repeat, setup=cache.clear),
+        'dashboard_warm': measure(lambda: client.get(dashboard_url), repeat),
+        'achievements': measure(lambda: client.get(achievements_url), repeat),
+        'check_achievements': measure(
+            lambda: check_achievements(user, habit, habit.current_streak, profile()), repeat,
+        ),
+    }
+    # Pure functions: time a batch per sample so timer overhead doesn't dominate
+    batch = 1000
+    p = profile()
+    results['check_level_up_x1000'] = measure(lambda: [check_level_up(p) for _ in range(batch)], repeat)
+    # Streak reads straight from the bitmap, daily vs 3x-a-week buckets
+    history = habit.get_history()
+    today = date.today()
+    results['daily_streak_read'] = measure(lambda: streaks_from_history(history, today), repeat)
+    results['weekly_streak_read'] = measure(
+        lambda: streaks_from_history(history, today, frequency='WEEKLY', target=3), repeat,
+    )
+    results['calculate_xp_gain_x1000'] = measure(
+        lambda: [calculate_xp_gain(habit, n) for n in range(batch)], repeat,
+    )
+    return {'environment': environment(), 'dataset': dict(dataset, **summary), 'repeat': repeat, 'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--habits', type=int, default=5)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--density', type=float, default=0.7)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--output', help="Write the JSON here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        report = run(
+            args.repeat, users=args.users, habits=args.habits, years=args.years,
+            density=args.density, seed=args.seed,
+        )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Leaderboard benchmark: naive ORDER BY/OFFSET/COUNT queries against the
+materialized rank table, on a throwaway SQLite database of synthetic profiles.
+
+    python benchmarks/leaderboard.py [--profiles 1000000] [--repeat 20]
+
+Prints one JSON object with the median time (ms) of each query.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import median_ms, setup_django
+
+
+def populate(count, chunk_size=50_000):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from lifetrack.models import UserProfile
+
+    rng = random.Random(42)
+    # bulk_create skips the post_save signal, so profiles are created here
+    for start in range(1, count + 1, chunk_size):
+        ids = range(start, min(start + chunk_size, count + 1))
+        with transaction.atomic():
+            User.objects.bulk_create(User(id=i, username=f'user{i}', password='!') for i in ids)
+            UserProfile.objects.bulk_create(
+                UserProfile(user_id=i, xp=int(rng.paretovariate(1.2) * 100)) for i in ids
+            )
+
+
+def run(count, repeat):
+    from lifetrack import leaderboard
+    from lifetrack.models import UserProfile
+
+    results = {'profiles': count}
+
+    started = time.perf_counter()
+    populate(count)
+    results['populate_s'] = round(time.perf_counter() - started, 1)
+
+    started = time.perf_counter()
+    leaderboard.refresh_leaderboard()
+    results['refresh_s'] = round(time.perf_counter() - started, 2)
+
+    target = UserProfile.objects.get(user_id=count // 2)
+    deep = count // 2
+    by_xp = UserProfile.objects.order_by('-xp', 'user_id')
+
+    results['naive_ms'] = {
+        'top_50': median_ms(lambda: list(by_xp[:50]), repeat),
+        'page_at_middle': median_ms(lambda: list(by_xp[deep:deep + 50]), repeat),
+        'own_rank': median_ms(lambda: UserProfile.objects.filter(xp__gt=target.xp).count() + 1, repeat),
+    }
+
+    entry = leaderboard.entry_for(target.user)
+    results['materialized_ms'] = {
+        'top_50': median_ms(lambda: leaderboard.top(50), repeat),
+        'page_at_middle': median_ms(lambda: leaderboard.top(50, after=deep), repeat),
+        'own_rank': median_ms(lambda: leaderboard.entry_for(target.user), repeat),
+        'neighbours': median_ms(lambda: leaderboard.neighbours(entry), repeat),
+        'ranked_count': median_ms(leaderboard.ranked_count, repeat),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        print(json.dumps(run(args.profiles, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Reminder dispatch benchmark: a million habits whose reminders all fall in the
+same minute (the worst case), on a throwaway SQLite database.
+
+    python benchmarks/reminders.py [--habits 1000000] [--completed 0.1] [--spread 1]
+
+Times the lookahead load of the timing wheel (done during the minute before)
+and the dispatch of the due minute to the database outbox, which must finish
+within that minute. Prints one JSON object.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, time as clock
+
+from common import environment, setup_django
+
+HABITS_PER_USER = 100
+
+
+def populate(habits, completed, spread, day, chunk_size=50_000):
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from lifetrack.models import Habit, Occurence, UserProfile
+
+    users = -(-habits // HABITS_PER_USER)
+    with transaction.atomic():
+        User.objects.bulk_create(User(id=i, username=f'user{i}', password='!') for i in range(1, users + 1))
+        # bulk_create skips the post_save signal, so profiles are created here
+        UserProfile.objects.bulk_create(UserProfile(user_id=i) for i in range(1, users + 1))
+
+    every = round(1 / completed) if completed else 0
+    for start in range(1, habits + 1, chunk_size):
+        ids = range(start, min(start + chunk_size, habits + 1))
+        with transaction.atomic():
+            Habit.objects.bulk_create(
+                Habit(
+                    id=i, user_id=(i - 1) // HABITS_PER_USER + 1, name=f'Habit {i}',
+                    reminder_time=clock(9, i % spread),
+                )
+                for i in ids
+            )
+            if every:
+                Occurence.objects.bulk_create(Occurence(habit_id=i, date=day) for i in ids if i % every == 0)
+
+
+def run(habits, completed, spread):
+    from django.utils import timezone
+    from lifetrack.models import ReminderMessage
+    from lifetrack.reminders import DatabaseOutbox, ReminderDispatcher
+
+    day = timezone.localdate()
+    results = {'habits': habits, 'completed_today': completed, 'spread_minutes': spread}
+
+    started = time.perf_counter()
+    populate(habits, completed, spread, day)
+    results['populate_s'] = round(time.perf_counter() - started, 1)
+
+    dispatcher = ReminderDispatcher(outbox=DatabaseOutbox(), lookahead=spread)
+    started = time.perf_counter()
+    dispatcher.tick(timezone.make_aware(datetime.combine(day, clock(8, 59))))
+    results['wheel_load_s'] = round(time.perf_counter() - started, 2)
+
+    for minute in range(spread):
+        started = time.perf_counter()
+        sent = dispatcher.tick(timezone.make_aware(datetime.combine(day, clock(9, minute))))
+        results.setdefault('dispatch_s', []).append(round(time.perf_counter() - started, 2))
+        results.setdefault('reminders', []).append(sent)
+    results['outbox_rows'] = ReminderMessage.objects.count()
+    results['within_minute'] = max(results['dispatch_s']) < 60
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--habits', type=int, default=1_000_000)
+    parser.add_argument('--completed', type=float, default=0.1, help="Share of habits already done today")
+    parser.add_argument('--spread', type=int, default=1, help="Spread reminders over this many minutes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(os.path.join(tmp, 'bench.sqlite3'))
+        report = run(args.habits, args.completed, args.spread)
+    print(json.dumps({'environment': environment(), **report}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
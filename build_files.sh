@@ -3,5 +3,9 @@ set -o errexit
 set -o pipefail
 
 pip install -r requirements.txt
+# vercel.json runs this on every deploy; the app only checks the schema at cold start
 python3 manage.py migrate
+# Tailwind CSS (only the classes the templates use), icons, jQuery and fonts
+npm install --no-audit --no-fund
+npm run build
 python3 manage.py collectstatic --noinput
@@ -0,0 +1,94 @@
+"""
+Achievement evaluator.
+
+The achievement catalog is cached per process, bucketed by condition type with
+thresholds sorted, so a completion only looks at thresholds the user has
+actually crossed instead of scanning every unearned achievement.
+"""
+from bisect import bisect_right
+
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Achievement, UserAchievement, UserProfile, Habit, XpLedgerEntry
+
+# condition_type -> (sorted thresholds, achievements in the same order)
+_catalog = None
+
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        buckets = {}
+        for ach in Achievement.objects.order_by('threshold', 'id'):
+            buckets.setdefault(ach.condition_type, []).append(ach)
+        _catalog = {
+            condition_type: ([a.threshold for a in achs], achs)
+            for condition_type, achs in buckets.items()
+        }
+    return _catalog
+
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def invalidate_catalog(**kwargs):
+    global _catalog
+    _catalog = None
+
+
+def crossed(condition_type, value):
+    """
+    Achievements of a condition type whose threshold is <= value.
+    """
+    thresholds, achs = get_catalog().get(condition_type, ([], []))
+    return achs[:bisect_right(thresholds, value)]
+
+
+def evaluate_achievements(user, profile, streak, habit_count=None):
+    """
+    Return the achievements the user qualifies for but hasn't earned yet.
+    """
+    candidates = (
+        crossed('STREAK', streak)
+        + crossed('TOTAL_COMPLETIONS', profile.total_habits_completed)
+        + crossed('LEVEL', profile.level)
+    )
+    if 'HABIT_COUNT' in get_catalog():
+        if habit_count is None:
+            habit_count = Habit.objects.filter(user=user).count()
+        candidates += crossed('HABIT_COUNT', habit_count)
+
+    if not candidates:
+        return []
+
+    earned_ids = set(
+        UserAchievement.objects.filter(user=user, achievement__in=candidates)
+        .values_list('achievement_id', flat=True)
+    )
+    return [a for a in candidates if a.id not in earned_ids]
+
+
+def award_achievements(user, profile, achievements, update_profile=True):
+    """
+    Award achievements in one insert and add their XP in one profile update.
+    With update_profile=False the XP is only added to `profile` in memory and
+    the caller is responsible for persisting it and its ledger entries.
+    """
+    if not achievements:
+        return []
+
+    UserAchievement.objects.bulk_create(
+        [UserAchievement(user=user, achievement=a) for a in achievements],
+        ignore_conflicts=True,
+    )
+    reward = sum(a.xp_reward for a in achievements)
+    if reward:
+        if update_profile:
+            UserProfile.objects.filter(pk=profile.pk).update(xp=F('xp') + reward)
+            XpLedgerEntry.objects.bulk_create(
+                XpLedgerEntry(user=user, source=XpLedgerEntry.ACHIEVEMENT, amount=a.xp_reward, achievement=a)
+                for a in achievements if a.xp_reward
+            )
+        profile.xp += reward
+    return achievements
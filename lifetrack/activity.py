@@ -0,0 +1,85 @@
+"""
+Daily activity rollup.
+
+DailyActivity keeps completions per (user, date). Writers pass the per-day
+change they made, inside the transaction that holds the user's profile lock,
+so reads like the heatmap never have to GROUP BY Occurence.
+"""
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import DailyActivity, Occurence, OccurenceArchive
+
+HEATMAP_DAYS = 365
+
+
+def apply_activity_deltas(user_id, deltas):
+    """
+    Add {date: delta} to a user's rollup in at most three queries.
+    """
+    deltas = {day: delta for day, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    existing = {
+        row.date: row for row in DailyActivity.objects.filter(user_id=user_id, date__in=deltas)
+    }
+    to_update = []
+    to_create = []
+    for day, delta in deltas.items():
+        row = existing.get(day)
+        if row is None:
+            # Nothing to take a completion back from
+            if delta > 0:
+                to_create.append(DailyActivity(user_id=user_id, date=day, completions=delta))
+        else:
+            row.completions = max(row.completions + delta, 0)
+            to_update.append(row)
+    if to_update:
+        DailyActivity.objects.bulk_update(to_update, ['completions'])
+    if to_create:
+        DailyActivity.objects.bulk_create(to_create)
+
+
+def heatmap(user, end=None, days=HEATMAP_DAYS):
+    """
+    {date: completions} for the `days` days ending on `end` (one range scan).
+    """
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    rows = (
+        DailyActivity.objects.filter(user=user, date__range=(start, end), completions__gt=0)
+        .values_list('date', 'completions')
+    )
+    return start, end, dict(rows)
+
+
+def rebuild_activity(user=None):
+    """
+    Regenerate the rollup from Occurence and OccurenceArchive with one DELETE
+    and one INSERT ... SELECT. Returns the number of rows written.
+    """
+    targets = DailyActivity.objects.all()
+    sources = [Occurence.objects.all(), OccurenceArchive.objects.all()]
+    if user is not None:
+        targets = targets.filter(user=user)
+        sources = [source.filter(habit__user=user) for source in sources]
+
+    selects = [
+        source.annotate(uid=F('habit__user_id')).values('uid', 'date').order_by().query.sql_with_params()
+        for source in sources
+    ]
+    union_sql = ' UNION ALL '.join(sql for sql, _ in selects)
+    params = [param for _, source_params in selects for param in source_params]
+    table = connection.ops.quote_name(DailyActivity._meta.db_table)
+
+    with transaction.atomic():
+        targets.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, date, completions) "
+                f"SELECT done.uid, done.date, COUNT(*) FROM ({union_sql}) done GROUP BY done.uid, done.date",
+                params,
+            )
+            return cursor.rowcount
@@ -1,9 +1,21 @@
 from django.contrib import admin
 
-from .models import UserProfile, Habit, Occurence, Achievement, UserAchievement
+from .models import UserProfile, Habit, Occurence, Achievement, UserAchievement, StreakFreeze, RolloverRun, DailyActivity, LeaderboardEntry
+from .models import OccurenceArchive, HabitYearSummary, ReminderMessage, ChangeLogEntry
+from .models import XpLedgerEntry, XpSnapshot
 
 admin.site.register(UserProfile)
 admin.site.register(Habit)
 admin.site.register(Occurence)
 admin.site.register(Achievement)
 admin.site.register(UserAchievement)
+admin.site.register(StreakFreeze)
+admin.site.register(RolloverRun)
+admin.site.register(DailyActivity)
+admin.site.register(LeaderboardEntry)
+admin.site.register(OccurenceArchive)
+admin.site.register(HabitYearSummary)
+admin.site.register(ReminderMessage)
+admin.site.register(ChangeLogEntry)
+admin.site.register(XpLedgerEntry)
+admin.site.register(XpSnapshot)
@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 
 class LifetrackConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'lifetrack'
+
+    def ready(self):
+        from . import achievements  # noqa: F401 (registers catalog invalidation signals)
+        from . import auth  # noqa: F401 (registers cached user invalidation signals)
@@ -0,0 +1,126 @@
+"""
+Cold history.
+
+Occurence rows older than the archive horizon are moved to OccurenceArchive
+and folded into per-habit HabitYearSummary rows by compact_history, so the
+hot table (and its unique index) only holds recent history. Streaks never
+need the raw rows: they are read from the habit bitmap, which keeps every
+day. The helpers below are the read side: they merge archived and live data
+for the few places that need full history.
+
+Dates before the horizon are read-only; toggles only touch live rows.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Habit, Occurence, OccurenceArchive, HabitYearSummary
+
+ARCHIVE_FIELDS = ['id', 'habit_id', 'date', 'notes', 'mood', 'xp_gained', 'token_earned']
+COMPACT_HABIT_CHUNK = 200
+
+
+def archive_after_days():
+    return getattr(settings, 'LIFETRACK_ARCHIVE_AFTER_DAYS', 365)
+
+
+def live_horizon(today=None):
+    """
+    First day kept in the live table; everything before it may be archived.
+    """
+    return (today or date.today()) - timedelta(days=archive_after_days())
+
+
+def _fold_into_summaries(rows):
+    """
+    Add archived (habit_id, date, xp_gained, token_earned) rows to the yearly
+    summaries, skipping days a summary already has.
+    """
+    by_key = defaultdict(list)
+    for row in rows:
+        by_key[(row['habit_id'], row['date'].year)].append(row)
+
+    existing = {
+        (summary.habit_id, summary.year): summary
+        for summary in HabitYearSummary.objects.filter(
+            habit_id__in={habit_id for habit_id, _ in by_key}, year__in={year for _, year in by_key},
+        )
+    }
+
+    to_create = []
+    to_update = []
+    for (habit_id, year), year_rows in by_key.items():
+        summary = existing.get((habit_id, year))
+        if summary is None:
+            summary = HabitYearSummary(habit_id=habit_id, year=year)
+            to_create.append(summary)
+        else:
+            to_update.append(summary)
+        days = summary.get_days()
+        for row in year_rows:
+            if row['date'] in days:
+                continue
+            days.add(row['date'])
+            summary.completions += 1
+            summary.xp_total += row['xp_gained']
+            summary.tokens += 1 if row['token_earned'] else 0
+        summary.days = days.to_bytes()
+
+    HabitYearSummary.objects.bulk_create(to_create)
+    HabitYearSummary.objects.bulk_update(to_update, ['days', 'completions', 'xp_total', 'tokens'])
+
+
+def compact(today=None, chunk_size=COMPACT_HABIT_CHUNK):
+    """
+    Move live rows older than the horizon to the archive, a chunk of habits
+    per transaction. Each chunk reads and deletes through the (habit, date)
+    index. Returns the number of rows moved.
+    """
+    horizon = live_horizon(today)
+    moved = 0
+    last_id = 0
+    while True:
+        habit_ids = list(
+            Habit.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not habit_ids:
+            return moved
+        last_id = habit_ids[-1]
+
+        with transaction.atomic():
+            old = Occurence.objects.filter(habit_id__in=habit_ids, date__lt=horizon)
+            rows = list(old.values(*ARCHIVE_FIELDS))
+            if not rows:
+                continue
+            # A day can already be archived if it was re-imported later; the archive copy wins
+            OccurenceArchive.objects.bulk_create(
+                (OccurenceArchive(**row) for row in rows), ignore_conflicts=True,
+            )
+            _fold_into_summaries(rows)
+            old.delete()
+            moved += len(rows)
+
+
+def archived_dates(habit):
+    """Every archived completion day of a habit, from its yearly summaries."""
+    for summary in HabitYearSummary.objects.filter(habit=habit).order_by('year'):
+        yield from summary.get_days()
+
+
+def completion_dates(habit):
+    """All completion days of a habit, archived and live."""
+    live = Occurence.objects.filter(habit=habit).values_list('date', flat=True)
+    return [*archived_dates(habit), *live]
+
+
+def habit_totals(habit):
+    """
+    (completions, xp) over a habit's whole history: the yearly summaries plus
+    the live rows.
+    """
+    archived = HabitYearSummary.objects.filter(habit=habit).aggregate(n=Sum('completions'), xp=Sum('xp_total'))
+    live = Occurence.objects.filter(habit=habit).aggregate(n=Count('id'), xp=Sum('xp_gained'))
+    return (archived['n'] or 0) + live['n'], (archived['xp'] or 0) + (live['xp'] or 0)
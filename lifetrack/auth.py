@@ -0,0 +1,76 @@
+"""
+Per-request user loading.
+
+ProfileModelBackend loads the session's user together with its profile in
+one select_related query, so templates that read user.profile (the header
+level, the dashboard) don't add a query of their own. Django's auth
+middleware still does the session hash check on top of it. aget_user() is
+the same for async views (request.auser()), on the async ORM.
+
+With LIFETRACK_AUTH_CACHE_TTL > 0 the loaded user is also cached for that
+many seconds under the user's dashboard cache version (dashboard_cache.py).
+Every profile write already bumps that version, and User saves and deletes
+bump it below, so a cached user is never older than the last write (a
+password change included). That holds across processes only with a shared
+cache, so settings.py leaves the cache off with the per-process default.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import dashboard_cache
+
+
+class ProfileModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        ttl = getattr(settings, 'LIFETRACK_AUTH_CACHE_TTL', 0)
+        if ttl <= 0:
+            return self._load_user(user_id)
+
+        cache = caches[dashboard_cache.CACHE_ALIAS]
+        key = dashboard_cache.versioned_key('auth-user', user_id)
+        user = cache.get(key)
+        if user is None:
+            user = self._load_user(user_id)
+            if user is not None:
+                cache.set(key, user, ttl)
+        return user
+
+    async def aget_user(self, user_id):
+        ttl = getattr(settings, 'LIFETRACK_AUTH_CACHE_TTL', 0)
+        if ttl <= 0:
+            return await self._aload_user(user_id)
+
+        cache = caches[dashboard_cache.CACHE_ALIAS]
+        key = await sync_to_async(dashboard_cache.versioned_key)('auth-user', user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await self._aload_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, ttl)
+        return user
+
+    def _load_user(self, user_id):
+        try:
+            user = User._default_manager.select_related('profile').get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def _aload_user(self, user_id):
+        try:
+            user = await User._default_manager.select_related('profile').aget(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Password changes must reach the session hash check right away
+    dashboard_cache.invalidate_user(instance.pk)
@@ -0,0 +1,125 @@
+"""
+Compact per-habit completion history.
+
+One bit per day starting at `start` (bit 0 of byte 0 is `start`), so a year of
+history fits in 46 bytes and every history question is answered from one row.
+"""
+from datetime import timedelta
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+def run_ending_at(value, i):
+    """Length of the run of set bits in `value` ending at bit i."""
+    if i < 0 or not (value >> i) & 1:
+        return 0
+    # The highest unset bit at or below i marks where the run starts
+    gaps = ~value & ((1 << (i + 1)) - 1)
+    return i + 1 if not gaps else i - (gaps.bit_length() - 1)
+
+
+def longest_run_of(value):
+    """Length of the longest run of set bits in `value`."""
+    if not value:
+        return 0
+    return max(len(run) for run in bin(value)[2:].split('0'))
+
+
+class CompletionBitmap:
+    def __init__(self, start=None, data=b''):
+        self.start = start
+        self._bits = bytearray(data or b'')
+        if self.start is None:
+            self._bits = bytearray()
+
+    @classmethod
+    def from_dates(cls, dates, start=None):
+        bitmap = cls(start)
+        for day in sorted(dates):
+            bitmap.add(day)
+        return bitmap
+
+    def to_bytes(self):
+        return bytes(self._bits.rstrip(b'\x00'))
+
+    def _index(self, day):
+        return (day - self.start).days
+
+    def to_int(self):
+        """The history as an integer, bit i set if day start + i was completed."""
+        return int.from_bytes(self._bits, 'little')
+
+    def __contains__(self, day):
+        if self.start is None:
+            return False
+        i = self._index(day)
+        if i < 0 or i >= len(self._bits) * 8:
+            return False
+        return bool(self._bits[i >> 3] & (1 << (i & 7)))
+
+    def __len__(self):
+        """Number of completed days."""
+        return popcount(self.to_int())
+
+    def __iter__(self):
+        """Yield completed days in ascending order."""
+        for byte_index, byte in enumerate(self._bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield self.start + timedelta(days=byte_index * 8 + bit)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompletionBitmap):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def add(self, day):
+        if self.start is None:
+            self.start = day
+        i = self._index(day)
+        if i < 0:
+            # Prepend whole bytes so existing bits keep their byte alignment
+            shift = (-i + 7) // 8
+            self._bits[:0] = bytes(shift)
+            self.start -= timedelta(days=shift * 8)
+            i = self._index(day)
+        if i >= len(self._bits) * 8:
+            self._bits.extend(bytes((i >> 3) + 1 - len(self._bits)))
+        self._bits[i >> 3] |= 1 << (i & 7)
+
+    def discard(self, day):
+        if day in self:
+            i = self._index(day)
+            self._bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def union(self, other):
+        """
+        New bitmap with the days of both (meant for small `other`s).
+        """
+        combined = CompletionBitmap(self.start, self.to_bytes())
+        for day in other:
+            combined.add(day)
+        return combined
+
+    def count_between(self, first, last):
+        """Number of completed days in [first, last]."""
+        if self.start is None:
+            return 0
+        lo = max(self._index(first), 0)
+        hi = self._index(last)
+        if hi < lo:
+            return 0
+        return popcount((self.to_int() >> lo) & ((1 << (hi - lo + 1)) - 1))
+
+    def run_length_ending(self, day):
+        """Number of consecutive completed days ending on (and including) `day`."""
+        if day not in self:
+            return 0
+        return run_ending_at(self.to_int(), self._index(day))
+
+    def longest_run(self):
+        return longest_run_of(self.to_int())
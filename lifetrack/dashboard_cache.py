@@ -0,0 +1,127 @@
+"""
+Per-user dashboard cache.
+
+The habit cards and profile numbers are cached under a key that includes a
+per-user version, a global version and today's date. Writers bump the user's
+version (toggle, create, delete, import) or the global one (rollover), so a
+hit never needs a database query and stale entries simply stop being read.
+
+The versions live in the cache too, so a write only reaches the processes
+sharing it. With the per-process default, entries expire after a few seconds
+(LIFETRACK_DASHBOARD_CACHE_TIMEOUT) to bound how long another worker serves
+a dashboard from before the write.
+"""
+import threading
+import time
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'default'
+
+HABIT_FIELDS = [
+    'id', 'name', 'category', 'difficulty', 'frequency', 'times_per_period',
+    'current_streak', 'longest_streak', 'completed_today',
+]
+PROFILE_FIELDS = ['id', 'xp', 'level', 'freeze_tokens', 'avatar_url', 'total_habits_completed']
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _user_version_key(user_id):
+    return f'dashboard:v:{user_id}'
+
+
+GLOBAL_VERSION_KEY = 'dashboard:v:global'
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Start from the clock so an evicted counter never reuses an old version
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_user(user_id):
+    """
+    Drop a user's cached dashboard once the current transaction commits.
+    """
+    transaction.on_commit(lambda: _bump(_user_version_key(user_id)))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: _bump(GLOBAL_VERSION_KEY))
+
+
+def versioned_key(prefix, user_id):
+    """
+    Cache key for per-user data that must be dropped whenever the user's (or
+    the global) version is bumped.
+    """
+    cache = _cache()
+    user_key = _user_version_key(user_id)
+    versions = cache.get_many([user_key, GLOBAL_VERSION_KEY])
+    for key in (user_key, GLOBAL_VERSION_KEY):
+        if key not in versions:
+            versions[key] = time.time_ns()
+            cache.add(key, versions[key], None)
+            versions[key] = cache.get(key, versions[key])
+    return f'{prefix}:{user_id}:{versions[user_key]}:{versions[GLOBAL_VERSION_KEY]}'
+
+
+def _data_key(user_id):
+    return f'{versioned_key("dashboard", user_id)}:{date.today().isoformat()}'
+
+
+def get_dashboard_data(user_id, build):
+    """
+    Return the cached dashboard data for a user, calling build() on a miss.
+    build() must return {'habits': [dict], 'profile': dict}.
+    """
+    cache = _cache()
+    key = _data_key(user_id)
+    data = cache.get(key)
+    _count(data is not None)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.LIFETRACK_DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+async def aget_dashboard_data(user_id, build):
+    """
+    get_dashboard_data() for async views; build is a coroutine function.
+    """
+    cache = _cache()
+    key = await sync_to_async(_data_key)(user_id)
+    data = await cache.aget(key)
+    _count(data is not None)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, settings.LIFETRACK_DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+def _count(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,82 @@
+"""
+Streaming export of a user's history.
+
+Each table is walked in primary-key order one page at a time (keyset
+pagination), so memory stays flat and no single query runs for the whole
+export, however much history the user has.
+"""
+import csv
+import json
+
+from .models import Habit, Occurence, OccurenceArchive, UserAchievement
+
+EXPORT_CHUNK_SIZE = 2000
+
+HABIT_FIELDS = [
+    'id', 'name', 'description', 'difficulty', 'category', 'frequency',
+    'current_streak', 'longest_streak', 'last_completed_date', 'reminder_time', 'created_at',
+]
+OCCURRENCE_FIELDS = ['id', 'habit_id', 'date', 'notes', 'mood', 'xp_gained', 'token_earned']
+ACHIEVEMENT_FIELDS = ['id', 'achievement_id', 'achievement__name', 'date_earned']
+
+CSV_COLUMNS = ['type'] + list(dict.fromkeys(HABIT_FIELDS + OCCURRENCE_FIELDS + ACHIEVEMENT_FIELDS))
+
+
+def keyset_iter(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield dicts of `fields` for every row of `queryset`, one page of
+    `chunk_size` rows at a time, ordered by primary key.
+    """
+    last_pk = None
+    while True:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        count = 0
+        for row in page.values(*fields)[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last_pk = row['id']
+            yield row
+        if count < chunk_size:
+            return
+
+
+def export_records(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield (type, row) for all of a user's habits, occurrences and achievements.
+    """
+    for row in keyset_iter(Habit.objects.filter(user=user), HABIT_FIELDS, chunk_size):
+        yield 'habit', row
+    # Archived rows (see archive.py) first, then live ones; ids are unique across both
+    for model in (OccurenceArchive, Occurence):
+        for row in keyset_iter(model.objects.filter(habit__user=user), OCCURRENCE_FIELDS, chunk_size):
+            yield 'occurrence', row
+    for row in keyset_iter(UserAchievement.objects.filter(user=user), ACHIEVEMENT_FIELDS, chunk_size):
+        yield 'achievement', row
+
+
+def _plain(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Echo:
+    """File-like object whose write() just returns the line for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(user):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record_type, row in export_records(user):
+        row = {k: _plain(v) for k, v in row.items()}
+        row['type'] = record_type
+        yield writer.writerow([row.get(column, '') for column in CSV_COLUMNS])
+
+
+def stream_ndjson(user):
+    for record_type, row in export_records(user):
+        row = {k: _plain(v) for k, v in row.items()}
+        row['type'] = record_type
+        yield json.dumps(row) + '\n'
@@ -0,0 +1,90 @@
+"""
+Global XP leaderboard.
+
+Ranking live profiles means sorting every row (and a COUNT(*) for "your
+rank"), so ranks are materialized into LeaderboardEntry by refresh_leaderboard
+instead. Reads then only touch the unique indexes on rank and user:
+
+    top N / next page   rank > cursor ORDER BY rank LIMIT N
+    own rank            lookup by user
+    neighbours          rank BETWEEN r - k AND r + k
+
+Ranks are positions: ties on XP are broken by user id, so every rank is unique
+and can be used as a keyset cursor.
+"""
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import LeaderboardEntry, UserProfile
+
+PAGE_SIZE = 50
+NEIGHBOUR_RADIUS = 2
+
+Page = namedtuple('Page', ['entries', 'next_after'])
+
+
+def refresh_leaderboard():
+    """
+    Rebuild the rank table with one DELETE and one INSERT ... SELECT ranked by a
+    window function. Readers see the old table until the transaction commits.
+    Returns the number of ranked profiles.
+    """
+    ranked = (
+        UserProfile.objects.annotate(
+            position=Window(RowNumber(), order_by=[F('xp').desc(), F('user_id').asc()])
+        )
+        .values('user_id', 'user__username', 'xp', 'level', 'position')
+        .order_by()
+    )
+    select_sql, params = ranked.query.sql_with_params()
+    qn = connection.ops.quote_name
+    table = qn(LeaderboardEntry._meta.db_table)
+
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({qn('rank')}, user_id, username, xp, level, refreshed_at) "
+                f"SELECT ranked.position, ranked.user_id, ranked.user__username, ranked.xp, ranked.level, %s "
+                f"FROM ({select_sql}) ranked",
+                [connection.ops.adapt_datetimefield_value(timezone.now()), *params],
+            )
+            return cursor.rowcount
+
+
+def top(limit=PAGE_SIZE, after=0):
+    """
+    One page of the leaderboard starting after rank `after`.
+    """
+    entries = list(LeaderboardEntry.objects.filter(rank__gt=after).order_by('rank')[:limit])
+    next_after = entries[-1].rank if len(entries) == limit else None
+    return Page(entries, next_after)
+
+
+def entry_for(user):
+    """
+    The user's entry, or None if they signed up after the last refresh.
+    """
+    return LeaderboardEntry.objects.filter(user=user).first()
+
+
+def neighbours(entry, radius=NEIGHBOUR_RADIUS):
+    """
+    Entries ranked within `radius` places of `entry` (including it).
+    """
+    return list(
+        LeaderboardEntry.objects.filter(rank__range=(entry.rank - radius, entry.rank + radius))
+        .order_by('rank')
+    )
+
+
+def ranked_count():
+    """
+    Number of ranked profiles, read off the end of the rank index.
+    """
+    last = LeaderboardEntry.objects.order_by('-rank').values_list('rank', flat=True).first()
+    return last or 0
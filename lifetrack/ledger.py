@@ -0,0 +1,151 @@
+"""
+XP ledger.
+
+Every change to UserProfile.xp is also appended to XpLedgerEntry in the same
+transaction: completions and undos (toggles), achievement rewards and
+imports. UserProfile.xp stays the number pages read. The ledger is the audit
+trail, and it answers questions the running total can't ("XP this week").
+
+snapshot_xp stores each user's ledger total through one entry in XpSnapshot,
+so a total is the snapshot plus a short tail of entries. Snapshots only
+cover entries older than SNAPSHOT_LAG. An entry written by a transaction
+that hasn't committed yet may carry a lower id than one that has, and
+leaving a margin means the snapshot never steps over it. No profile row is
+locked for this.
+
+reconcile() compares each profile's xp with its ledger total in a single
+statement, which sees either both halves of a write or neither.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import UserProfile, XpLedgerEntry, XpSnapshot
+
+SNAPSHOT_LAG = timedelta(minutes=5)
+SNAPSHOT_BATCH = 5000
+
+
+def _with_ledger(profiles):
+    """
+    Annotate profiles with their ledger total: snapshot plus the entries after
+    it (a range scan on xpledger_user_idx per profile).
+    """
+    snapshot = XpSnapshot.objects.filter(user=OuterRef('user'))
+    tail = (
+        XpLedgerEntry.objects.filter(user=OuterRef('user'), id__gt=OuterRef('snapshot_through'))
+        .order_by().values('user').annotate(total=Sum('amount')).values('total')
+    )
+    return profiles.alias(
+        snapshot_total=Coalesce(Subquery(snapshot.values('total')), Value(0)),
+        snapshot_through=Coalesce(Subquery(snapshot.values('through_entry_id')), Value(0)),
+    ).annotate(ledger=F('snapshot_total') + Coalesce(Subquery(tail), Value(0), output_field=IntegerField()))
+
+
+def xp_total(user):
+    """
+    The user's ledger total, in one query.
+    """
+    return _with_ledger(UserProfile.objects.filter(user=user)).values_list('ledger', flat=True).first() or 0
+
+
+def xp_between(user, start, end=None):
+    """
+    XP the user gained (net of undos) from `start` up to `end` (default now),
+    a range scan on xpledger_user_time_idx.
+    """
+    entries = XpLedgerEntry.objects.filter(user=user, created_at__gte=start)
+    if end is not None:
+        entries = entries.filter(created_at__lt=end)
+    return entries.aggregate(total=Sum('amount'))['total'] or 0
+
+
+def xp_this_week(user, now=None):
+    """XP since Monday 00:00 (local time)."""
+    now = timezone.localtime(now)
+    start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return xp_between(user, start)
+
+
+def xp_this_month(user, now=None):
+    """XP since the 1st of the month 00:00 (local time)."""
+    start = timezone.localtime(now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return xp_between(user, start)
+
+
+def take_snapshots(now=None, lag=SNAPSHOT_LAG, batch_size=SNAPSHOT_BATCH):
+    """
+    Move the snapshots up to the last entry older than `lag`, reading only
+    the entries since the previous run. Returns the number of snapshots
+    written.
+    """
+    now = now or timezone.now()
+    # Every snapshot is good through the last run's cutoff, which is the
+    # highest through_entry_id (that entry's owner was snapshotted through it)
+    since = XpSnapshot.objects.aggregate(last=Max('through_entry_id'))['last'] or 0
+    cutoff = XpLedgerEntry.objects.filter(id__gt=since, created_at__lt=now - lag).aggregate(last=Max('id'))['last']
+    if cutoff is None:
+        return 0
+
+    tails = (
+        XpLedgerEntry.objects.filter(id__gt=since, id__lte=cutoff)
+        .order_by().values('user').annotate(amount=Sum('amount'), through=Max('id'))
+        .values_list('user', 'amount', 'through')
+    )
+    written = 0
+    chunk = []
+    # One transaction: a run stopped halfway would leave `since` past users it never reached
+    with transaction.atomic():
+        for row in tails.iterator(chunk_size=batch_size):
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                written += _advance(chunk, now)
+                chunk = []
+        if chunk:
+            written += _advance(chunk, now)
+    return written
+
+
+def _advance(chunk, now):
+    snapshots = XpSnapshot.objects.in_bulk([user_id for user_id, _, _ in chunk], field_name='user_id')
+    created = []
+    for user_id, amount, through in chunk:
+        snapshot = snapshots.get(user_id)
+        if snapshot is None:
+            created.append(XpSnapshot(user_id=user_id, through_entry_id=through, total=amount, taken_at=now))
+        else:
+            snapshot.total += amount
+            snapshot.through_entry_id = through
+            snapshot.taken_at = now
+    XpSnapshot.objects.bulk_create(created)
+    XpSnapshot.objects.bulk_update(snapshots.values(), ['total', 'through_entry_id', 'taken_at'])
+    return len(chunk)
+
+
+def reconcile():
+    """
+    Profiles whose xp doesn't match their ledger, as (user_id, xp, ledger)
+    rows. One statement, so a toggle committing meanwhile is seen whole.
+    """
+    return (
+        _with_ledger(UserProfile.objects.all())
+        .exclude(xp=F('ledger'))
+        .order_by('user_id')
+        .values_list('user_id', 'xp', 'ledger')
+    )
+
+
+def adjust(user_id):
+    """
+    Append an ADJUSTMENT entry that brings the user's ledger to their
+    profile's xp, under the profile lock. Returns the amount (0 if none).
+    """
+    with transaction.atomic():
+        profile = UserProfile.objects.select_for_update().get(user_id=user_id)
+        difference = profile.xp - xp_total(profile.user_id)
+        if difference:
+            XpLedgerEntry.objects.create(user_id=user_id, source=XpLedgerEntry.ADJUSTMENT, amount=difference)
+    return difference
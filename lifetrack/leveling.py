@@ -0,0 +1,64 @@
+"""
+Level math.
+
+Reaching level N (N >= 2) takes a cumulative 100 * N^1.5 XP. Thresholds are
+precomputed once so a level lookup is a bisect instead of a level-by-level
+walk; past the end of the table the closed-form inverse is used.
+"""
+from bisect import bisect_right
+from collections import namedtuple
+
+TABLE_LEVELS = 1000
+
+LevelProgress = namedtuple('LevelProgress', ['level', 'xp_into_level', 'xp_for_level', 'percent'])
+
+
+def _threshold(level):
+    return 0 if level <= 1 else int(100 * (level ** 1.5))
+
+
+# THRESHOLDS[i] is the XP needed to reach level i + 1
+THRESHOLDS = [_threshold(level) for level in range(1, TABLE_LEVELS + 1)]
+
+
+def xp_threshold(level):
+    """
+    Total XP needed to reach `level`.
+    """
+    if 1 <= level <= TABLE_LEVELS:
+        return THRESHOLDS[level - 1]
+    return _threshold(level)
+
+
+def level_for_xp(xp):
+    """
+    Highest level whose threshold is <= xp.
+    """
+    if xp < THRESHOLDS[-1]:
+        return bisect_right(THRESHOLDS, xp)
+    # Closed-form inverse, then correct for int() truncation in the thresholds
+    level = int((xp / 100) ** (2 / 3))
+    while _threshold(level + 1) <= xp:
+        level += 1
+    while level > 1 and _threshold(level) > xp:
+        level -= 1
+    return level
+
+
+def level_progress(xp, level=None):
+    """
+    Progress through the current level. `level` defaults to the level for `xp`
+    (pass the stored level, since levels never go down).
+    """
+    level = level or level_for_xp(xp)
+    floor = xp_threshold(level)
+    span = xp_threshold(level + 1) - floor
+    into = min(max(xp - floor, 0), span)
+    return LevelProgress(level, into, span, int(100 * into / span))
+
+
+def levels_for_xp(xps):
+    """
+    Levels for many XP totals in one pass (for bulk recomputation).
+    """
+    return [level_for_xp(xp) for xp in xps]
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lifetrack.archive import COMPACT_HABIT_CHUNK, archive_after_days, compact
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completions older than LIFETRACK_ARCHIVE_AFTER_DAYS from the live Occurence "
+        "table to the archive and fold them into per-habit yearly summaries. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=COMPACT_HABIT_CHUNK, help="Habits per transaction")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moved = compact(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} completions older than {archive_after_days()} days "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from lifetrack.reminders import LOOKAHEAD_MINUTES, ReminderDispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Hand reminders to the outbox (LIFETRACK_REMINDER_OUTBOX) for habits whose reminder time "
+        "has come and that aren't completed today. Runs once a minute until stopped, "
+        "or for the current minute only with --once (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Dispatch the current minute and exit")
+        parser.add_argument(
+            '--lookahead', type=int, default=LOOKAHEAD_MINUTES, help="Minutes of reminders to load ahead",
+        )
+        parser.add_argument(
+            '--catch-up', type=int, default=0, help="Also dispatch this many minutes before the first one",
+        )
+
+    def handle(self, *args, **options):
+        dispatcher = ReminderDispatcher(lookahead=options['lookahead'], catch_up=options['catch_up'])
+        while True:
+            started = time.perf_counter()
+            sent = dispatcher.tick()
+            if sent or options['once']:
+                self.stdout.write(
+                    f"{timezone.localtime():%H:%M}: {sent} reminders in {time.perf_counter() - started:.1f}s"
+                )
+            if options['once']:
+                return
+            # Sleep to the start of the next minute
+            now = timezone.localtime()
+            time.sleep(60 - now.second - now.microsecond / 1_000_000)
+            # A connection idle for a minute may have been dropped by the server
+            close_old_connections()
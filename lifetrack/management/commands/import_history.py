@@ -0,0 +1,207 @@
+import csv
+import json
+import sys
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+
+from lifetrack.models import Habit, Occurence, UserProfile, ChangeLogEntry, XpLedgerEntry
+from lifetrack.sync import record_changes
+from lifetrack.streaks import streaks_from_history, streak_ending
+from lifetrack.utils import calculate_xp_gain, check_level_up
+from lifetrack.activity import apply_activity_deltas
+from lifetrack import dashboard_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical completions from CSV (habit_id,date[,notes,mood]) or "
+        "JSONL ({\"habit_id\": .., \"date\": ..}) without loading the file into memory. "
+        "Streaks, XP and completion counts are recomputed once per user at the end, under the "
+        "same locks as a toggle; each imported day stores the XP it awarded, so undoing it "
+        "takes that XP back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension")
+        parser.add_argument('--user', help="Only accept habits owned by this username")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.batch_size = options['batch_size']
+        self.owner_id = None
+        if options['user']:
+            profile = UserProfile.objects.filter(user__username=options['user']).first()
+            if profile is None:
+                raise CommandError(f"No such user: {options['user']}")
+            self.owner_id = profile.user_id
+
+        # habit_id -> owner (None for unknown habits), and the first and last imported day
+        self.owners = {}
+        self.spans = {}
+        self.read = self.skipped = 0
+        started = time.monotonic()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            rows = csv.DictReader(stream) if fmt == 'csv' else self.jsonl_rows(stream)
+            batch = []
+            for row in rows:
+                self.read += 1
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    self.insert_batch(batch)
+                    batch = []
+                    self.report_progress(started)
+            if batch:
+                self.insert_batch(batch)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        inserted = self.recompute()
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {self.read} rows, inserted {inserted}, skipped {self.skipped} "
+            f"in {elapsed:.1f}s ({self.read / elapsed:,.0f} rows/s)"
+        ))
+
+    def jsonl_rows(self, stream):
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {}
+
+    def report_progress(self, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write(f"  {self.read} rows ({self.read / elapsed:,.0f} rows/s)")
+
+    def load_habits(self, habit_ids):
+        """
+        Remember the owner of habits seen for the first time.
+        """
+        new_ids = habit_ids - self.owners.keys()
+        if not new_ids:
+            return
+        habits = Habit.objects.filter(id__in=new_ids)
+        if self.owner_id is not None:
+            habits = habits.filter(user_id=self.owner_id)
+        self.owners.update(habits.values_list('id', 'user_id'))
+        for habit_id in new_ids - self.owners.keys():
+            self.owners[habit_id] = None
+
+    def insert_batch(self, rows):
+        parsed = []
+        for row in rows:
+            try:
+                parsed.append((int(row['habit_id']), date.fromisoformat(str(row['date']).strip()), row))
+            except (KeyError, TypeError, ValueError):
+                self.skipped += 1
+        self.load_habits({habit_id for habit_id, _, _ in parsed})
+
+        occurrences = []
+        for habit_id, day, row in parsed:
+            if self.owners[habit_id] is None or day > date.today():
+                self.skipped += 1
+                continue
+            first, last = self.spans.get(habit_id, (day, day))
+            self.spans[habit_id] = (min(first, day), max(last, day))
+            occurrences.append(Occurence(
+                habit_id=habit_id,
+                date=day,
+                notes=row.get('notes') or None,
+                mood=row.get('mood') or None,
+            ))
+        Occurence.objects.bulk_create(occurrences, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def recompute(self):
+        """
+        Apply streaks, XP and completion counts once per user. Returns the
+        number of newly inserted days.
+        """
+        habits_by_user = defaultdict(list)
+        for habit_id in self.spans:
+            habits_by_user[self.owners[habit_id]].append(habit_id)
+        return sum(self.recompute_user(user_id, habit_ids) for user_id, habit_ids in habits_by_user.items())
+
+    def recompute_user(self, user_id, habit_ids):
+        """
+        Credit one user's imported days in one transaction, locking the profile
+        and then the habits like a toggle does. A day is new if it has an
+        Occurence row but isn't in the habit's bitmap yet; toggles keep the
+        bitmap current, so a day toggled during the import isn't credited twice.
+        """
+        today = date.today()
+        with transaction.atomic():
+            profile, _ = UserProfile.objects.select_for_update().get_or_create(user_id=user_id)
+            habits = list(Habit.objects.select_for_update().filter(id__in=habit_ids).order_by('id'))
+            rows = defaultdict(list)
+            for habit_id, day in Occurence.objects.filter(
+                habit_id__in=habit_ids,
+                date__range=(min(self.spans[h][0] for h in habit_ids), max(self.spans[h][1] for h in habit_ids)),
+            ).values_list('habit_id', 'date'):
+                rows[habit_id].append(day)
+
+            xp_total = completions = 0
+            activity = defaultdict(int)
+            changes = []
+            changed = []
+            for habit in habits:
+                history = habit.get_history()
+                new_days = sorted(day for day in rows[habit.id] if day not in history)
+                if not new_days:
+                    continue
+                for day in new_days:
+                    history.add(day)
+                habit.set_history(history)
+                frozen = habit.get_freezes()
+
+                rule = (habit.frequency, habit.period_target)
+                streak, longest = streaks_from_history(history, today, frozen, *rule)
+                habit.current_streak = streak
+                habit.longest_streak = max(habit.longest_streak, longest)
+                habit.last_completed_date = max(new_days[-1], habit.last_completed_date or date.min)
+                # XP for the streak reached on each day, stored on the rows (one UPDATE per amount)
+                days_by_xp = defaultdict(list)
+                for day in new_days:
+                    days_by_xp[calculate_xp_gain(habit, streak_ending(history, day, frozen, *rule))].append(day)
+                for xp, days in days_by_xp.items():
+                    Occurence.objects.filter(habit=habit, date__in=days).update(xp_gained=xp)
+                    xp_total += xp * len(days)
+                completions += len(new_days)
+                for day in new_days:
+                    activity[day] += 1
+                changes += [(ChangeLogEntry.HABIT, habit.id, None)] + [
+                    (ChangeLogEntry.OCCURENCE, habit.id, day) for day in new_days
+                ]
+                changed.append(habit)
+            if not completions:
+                return 0
+
+            Habit.objects.bulk_update(changed, [
+                'current_streak', 'longest_streak', 'last_completed_date',
+                'completion_bitmap', 'bitmap_start',
+            ])
+            profile.xp += xp_total
+            check_level_up(profile)
+            UserProfile.objects.filter(pk=profile.pk).update(
+                xp=F('xp') + xp_total,
+                total_habits_completed=F('total_habits_completed') + completions,
+                level=profile.level,
+            )
+            if xp_total:
+                XpLedgerEntry.objects.create(user_id=user_id, source=XpLedgerEntry.IMPORT, amount=xp_total)
+            apply_activity_deltas(user_id, activity)
+            record_changes(user_id, changes + [(ChangeLogEntry.PROFILE, user_id, None)])
+            dashboard_cache.invalidate_user(user_id)
+        return completions
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from lifetrack.activity import rebuild_activity
+
+
+class Command(BaseCommand):
+    help = "Regenerate the DailyActivity rollup from Occurence in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this username")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No such user: {options['user']}")
+        rows = rebuild_activity(user)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily activity rows"))
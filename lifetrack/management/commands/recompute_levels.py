@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from lifetrack import dashboard_cache
+from lifetrack.leveling import levels_for_xp
+from lifetrack.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every profile's level from its XP (e.g. after a formula change) "
+        "in one pass, writing only the profiles whose level changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        seen = changed = 0
+        rows = UserProfile.objects.order_by('pk').values_list('pk', 'xp', 'level').iterator(chunk_size=batch_size)
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= batch_size:
+                changed += self.apply(chunk, options['dry_run'])
+                seen += len(chunk)
+                chunk = []
+        if chunk:
+            changed += self.apply(chunk, options['dry_run'])
+            seen += len(chunk)
+
+        if changed and not options['dry_run']:
+            dashboard_cache.invalidate_all()
+        verb = "Would update" if options['dry_run'] else "Updated"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {changed} of {seen} profiles"))
+
+    def apply(self, chunk, dry_run):
+        levels = levels_for_xp([xp for _, xp, _ in chunk])
+        updates = [
+            UserProfile(pk=pk, level=new_level)
+            for (pk, _, old_level), new_level in zip(chunk, levels)
+            if new_level != old_level
+        ]
+        if updates and not dry_run:
+            UserProfile.objects.bulk_update(updates, ['level'])
+        return len(updates)
@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lifetrack.leaderboard import refresh_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized XP leaderboard ranks in one set-based rebuild."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = refresh_leaderboard()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Ranked {rows} profiles in {elapsed:.2f}s"))
@@ -0,0 +1,118 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from lifetrack import dashboard_cache
+from lifetrack.models import Habit, Occurence, UserProfile, StreakFreeze, RolloverRun, ChangeLogEntry
+from lifetrack.sync import record_changes_from
+
+
+def missed_habits(day):
+    """
+    Habits with a live streak whose period ended on `day` short of its target
+    and without a freeze: daily habits every day, weekly habits when `day` is
+    a Sunday (the end of the ISO week).
+    """
+    def done(first):
+        return Occurence.objects.filter(habit=OuterRef('pk'), date__range=(first, day))
+
+    def frozen(first):
+        return StreakFreeze.objects.filter(habit=OuterRef('pk'), date__range=(first, day))
+
+    candidates = Habit.objects.filter(current_streak__gt=0, created_at__lte=day)
+    missed_daily = Q(frequency='DAILY') & ~Exists(done(day)) & ~Exists(frozen(day))
+    if day.weekday() != 6:
+        return candidates.filter(missed_daily)
+
+    week_start = day - timedelta(days=6)
+    week_done = done(week_start).order_by().values('habit').annotate(n=Count('pk')).values('n')
+    candidates = candidates.filter(frequency__in=['DAILY', 'WEEKLY'])
+    return candidates.alias(week_done=Coalesce(Subquery(week_done), 0)).filter(
+        missed_daily
+        | Q(frequency='WEEKLY', week_done__lt=F('times_per_period')) & ~Exists(frozen(week_start))
+    )
+
+
+def freeze_missed(day):
+    """
+    INSERT ... SELECT a StreakFreeze for missed habits, as many per user as
+    they have freeze tokens (longest streaks first). Returns the number of
+    rows inserted.
+    """
+    candidates = (
+        missed_habits(day).filter(user__profile__freeze_tokens__gt=0)
+        .annotate(rank=Window(RowNumber(), partition_by=F('user'), order_by=[F('current_streak').desc(), F('id')]))
+        .filter(rank__lte=F('user__profile__freeze_tokens'))
+        .values('id')
+    )
+    select_sql, params = candidates.query.sql_with_params()
+    table = connection.ops.quote_name(StreakFreeze._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (habit_id, date) SELECT frozen.id, %s FROM ({select_sql}) frozen",
+            [connection.ops.adapt_datefield_value(day), *params],
+        )
+        return cursor.rowcount
+
+
+def rollover(today=None):
+    """
+    Close out yesterday for every daily habit in a few set-based statements.
+    Returns the RolloverRun, or None if this day was already rolled over.
+    """
+    today = today or date.today()
+    yesterday = today - timedelta(days=1)
+
+    with transaction.atomic():
+        run, created = RolloverRun.objects.get_or_create(date=today)
+        if not created:
+            return None
+
+        # Lock the profiles of everyone affected, in id order like the toggle
+        # path, so the change log below commits in order for each of them
+        list(
+            UserProfile.objects.select_for_update()
+            .filter(user__in=missed_habits(yesterday).values('user')).order_by('pk').values_list('pk', flat=True)
+        )
+
+        # 1. Freeze the streaks users can pay for (one token per habit)
+        run.streaks_frozen = freeze_missed(yesterday)
+        frozen = StreakFreeze.objects.filter(date=yesterday)
+        spent = frozen.filter(habit__user=OuterRef('user')).order_by().values('habit__user').annotate(n=Count('pk'))
+        paying = UserProfile.objects.filter(user__in=frozen.values('habit__user'))
+        record_changes_from(ChangeLogEntry.PROFILE, paying.values('user_id', object_id=F('user_id')))
+        paying.update(freeze_tokens=F('freeze_tokens') - Subquery(spent.values('n')))
+        run.tokens_consumed = run.streaks_frozen
+
+        # 2. Break everything else that was missed
+        record_changes_from(ChangeLogEntry.HABIT, missed_habits(yesterday).values('user_id', object_id=F('id')))
+        run.streaks_broken = missed_habits(yesterday).update(current_streak=0)
+
+        run.save(update_fields=['streaks_frozen', 'tokens_consumed', 'streaks_broken'])
+        dashboard_cache.invalidate_all()
+    return run
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll streaks over to a new day: spend a freeze token on each habit that missed "
+        "yesterday (or, on Mondays, last week's target for weekly habits) while its owner "
+        "has tokens left, and reset the streaks of every other habit that missed it. "
+        "Safe to re-run; each day is only processed once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Day to roll into (default: today)")
+
+    def handle(self, *args, **options):
+        run = rollover(options['date'])
+        if run is None:
+            self.stdout.write("Already rolled over; nothing to do.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled into {run.date}: {run.streaks_broken} streaks broken, "
+            f"{run.streaks_frozen} frozen, {run.tokens_consumed} tokens consumed"
+        ))
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lifetrack import ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Move each user's XP snapshot up to the latest ledger entries, so totals only sum a short tail. "
+        "With --reconcile, also list profiles whose xp doesn't match their ledger "
+        "(and with --fix, append an adjustment entry for each)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lag-minutes', type=int, default=int(ledger.SNAPSHOT_LAG.total_seconds() // 60),
+            help="Leave entries newer than this out of the snapshots",
+        )
+        parser.add_argument('--reconcile', action='store_true', help="Compare every profile with its ledger")
+        parser.add_argument('--fix', action='store_true', help="With --reconcile: adjust the ledgers that differ")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = ledger.take_snapshots(lag=timedelta(minutes=options['lag_minutes']))
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {written} XP snapshots in {time.perf_counter() - started:.1f}s"
+        ))
+        if not options['reconcile']:
+            return
+
+        mismatched = 0
+        for user_id, xp, total in ledger.reconcile().iterator():
+            mismatched += 1
+            if options['fix']:
+                amount = ledger.adjust(user_id)
+                self.stdout.write(f"user {user_id}: profile {xp} XP, ledger {total}; adjusted by {amount:+d}")
+            else:
+                self.stdout.write(f"user {user_id}: profile {xp} XP, ledger {total}")
+        if mismatched and not options['fix']:
+            raise CommandError(f"{mismatched} profiles don't match their XP ledger")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled: {mismatched} profiles differed"))
@@ -0,0 +1,246 @@
+"""
+Per-request metrics.
+
+RequestMetricsMiddleware samples requests and, for each sampled one, records
+query count, DB time, template render time and total latency per view. The
+numbers go out in a Server-Timing header and into process-level histograms
+that the staff-only /metrics/ endpoint renders as Prometheus text.
+
+With LIFETRACK_METRICS_SAMPLE_RATE = 0 the middleware removes itself from the
+handler chain and TimedDjangoTemplates only does a context variable lookup
+per render, so there is nothing to pay when sampling is off. Metrics are
+per process, like the dashboard cache counters they are reported next to.
+
+Under ASGI the middleware runs async. The ORM then runs in the request's
+thread-sensitive worker thread, so the query wrapper is installed on that
+thread's connection rather than the event loop's. Work a view sends to the
+thread pool instead (sync_to_async(..., thread_sensitive=False)) wraps
+itself in measure_pool_queries().
+"""
+import contextvars
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from . import dashboard_cache
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+_current = contextvars.ContextVar('lifetrack_request_metrics', default=None)
+
+
+class RequestStats:
+    """Counters for one sampled request."""
+    __slots__ = ('queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per view."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.get(view, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._series[view] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {view: (list(counts), total) for view, (counts, total) in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for view, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('lifetrack_request_duration_seconds', 'Total request latency.', SECONDS_BUCKETS)
+DB_SECONDS = Histogram('lifetrack_db_duration_seconds', 'Time spent in SQL per request.', SECONDS_BUCKETS)
+TEMPLATE_SECONDS = Histogram(
+    'lifetrack_template_duration_seconds', 'Template render time per request (includes SQL run from templates).',
+    SECONDS_BUCKETS,
+)
+QUERIES = Histogram('lifetrack_db_queries', 'SQL queries per request.', QUERY_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, DB_SECONDS, TEMPLATE_SECONDS, QUERIES)
+
+
+def reset_metrics():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def render_prometheus():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    stats = dashboard_cache.cache_stats()
+    for key in ('hits', 'misses'):
+        name = f'lifetrack_dashboard_cache_{key}_total'
+        lines += [f'# TYPE {name} counter', f'{name} {stats[key]}']
+    return '\n'.join(lines) + '\n'
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def _push_wrapper(stats):
+    connections['default'].execute_wrappers.append(stats)
+
+
+def _pop_wrapper(stats):
+    connections['default'].execute_wrappers.remove(stats)
+
+
+@contextmanager
+def measure_pool_queries():
+    """
+    Count the queries run inside this block on a pool thread's connection
+    toward the current sampled request, if any. The request's stats arrive
+    with the context sync_to_async copies to the thread.
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    with connections['default'].execute_wrapper(stats):
+        yield
+
+
+class RequestMetricsMiddleware:
+    """
+    Records a sampled request's query count, DB time, template time and
+    latency (see module docstring).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'LIFETRACK_METRICS_SAMPLE_RATE', 0.0)
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with connections['default'].execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        await sync_to_async(_push_wrapper)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_pop_wrapper)(stats)
+            _current.reset(token)
+        return self._record(request, response, stats, time.perf_counter() - started)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _record(self, request, response, stats, total):
+        view = _view_name(request)
+        REQUEST_SECONDS.observe(view, total)
+        DB_SECONDS.observe(view, stats.db_seconds)
+        TEMPLATE_SECONDS.observe(view, stats.template_seconds)
+        QUERIES.observe(view, stats.queries)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_seconds * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+        return response
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render time added to the current
+    request's metrics when it is being sampled.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:21
+
+from django.db import migrations, models
+
+from lifetrack.bitmap import CompletionBitmap
+
+
+def backfill_bitmaps(apps, schema_editor):
+    Habit = apps.get_model('lifetrack', 'Habit')
+    Occurence = apps.get_model('lifetrack', 'Occurence')
+    for habit in Habit.objects.only('id', 'created_at').iterator():
+        dates = Occurence.objects.filter(habit=habit).values_list('date', flat=True)
+        bitmap = CompletionBitmap.from_dates(dates, start=habit.created_at)
+        Habit.objects.filter(pk=habit.pk).update(
+            completion_bitmap=bitmap.to_bytes(),
+            bitmap_start=bitmap.start,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifetrack', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='bitmap_start',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='completion_bitmap',
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(backfill_bitmaps, migrations.RunPython.noop),
+    ]
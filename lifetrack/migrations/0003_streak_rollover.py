@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifetrack', '0002_habit_completion_bitmap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RolloverRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('ran_at', models.DateTimeField(auto_now_add=True)),
+                ('streaks_broken', models.IntegerField(default=0)),
+                ('streaks_frozen', models.IntegerField(default=0)),
+                ('tokens_consumed', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StreakFreeze',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lifetrack.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_activity(apps, schema_editor):
+    # The INSERT ... SELECT of activity.rebuild_activity(), before there was an archive
+    DailyActivity = apps.get_model('lifetrack', 'DailyActivity')
+    Occurence = apps.get_model('lifetrack', 'Occurence')
+    connection = schema_editor.connection
+    select_sql, params = (
+        Occurence.objects.annotate(uid=models.F('habit__user_id')).values('uid', 'date').order_by()
+        .query.sql_with_params()
+    )
+    table = connection.ops.quote_name(DailyActivity._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, date, completions) "
+            f"SELECT done.uid, done.date, COUNT(*) FROM ({select_sql}) done GROUP BY done.uid, done.date",
+            params,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifetrack', '0003_streak_rollover'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completions', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
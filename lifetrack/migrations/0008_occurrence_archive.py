@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifetrack', '0007_habit_times_per_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitYearSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('days', models.BinaryField(default=bytes)),
+                ('completions', models.IntegerField(default=0)),
+                ('xp_total', models.IntegerField(default=0)),
+                ('tokens', models.IntegerField(default=0)),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lifetrack.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='OccurenceArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('mood', models.CharField(blank=True, max_length=20, null=True)),
+                ('xp_gained', models.IntegerField(default=0)),
+                ('token_earned', models.BooleanField(default=False)),
+                ('habit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lifetrack.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    # XP earned before the ledger existed, so every profile starts reconciled
+    UserProfile = apps.get_model('lifetrack', 'UserProfile')
+    XpLedgerEntry = apps.get_model('lifetrack', 'XpLedgerEntry')
+    balances = UserProfile.objects.exclude(xp=0).values_list('user_id', 'xp').iterator(chunk_size=5000)
+    XpLedgerEntry.objects.bulk_create(
+        (XpLedgerEntry(user_id=user_id, source='OPENING', amount=xp) for user_id, xp in balances), batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lifetrack', '0010_changelog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XpSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('through_entry_id', models.BigIntegerField()),
+                ('total', models.IntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='xp_snapshot', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='XpLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('COMPLETION', 'Habit completed'), ('UNDO', 'Completion undone'), ('ACHIEVEMENT', 'Achievement reward'), ('IMPORT', 'Imported history'), ('OPENING', 'Balance before the ledger'), ('ADJUSTMENT', 'Reconciliation adjustment')], max_length=12)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('achievement', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='lifetrack.achievement')),
+                ('habit', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='lifetrack.habit')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='xpledger_user_idx'), models.Index(fields=['user', 'created_at'], name='xpledger_user_time_idx')],
+            },
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
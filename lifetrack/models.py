@@ -1,9 +1,13 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
 from datetime import date
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .bitmap import CompletionBitmap
+
 # --- User Profile & Gamification ---
 
 class UserProfile(models.Model):
@@ -15,6 +19,11 @@ class UserProfile(models.Model):
     
     # Quick Stats Cache (Optional but good for performance)
     total_habits_completed = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-xp', 'user'], name='profile_xp_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - Lvl {self.level}"
@@ -83,6 +92,8 @@ class Habit(models.Model):
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES, default='MEDIUM')
     category = models.CharField(max_length=50, default='General') # e.g. Health, Coding, Mindfulness
     frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='DAILY')
+    # Completions needed per period for it to count towards the streak (WEEKLY only, e.g. 3x a week)
+    times_per_period = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1), MaxValueValidator(7)])
     
     # Streak Tracking
     current_streak = models.IntegerField(default=0)
@@ -93,12 +104,65 @@ class Habit(models.Model):
     reminder_time = models.TimeField(null=True, blank=True)
     
     created_at = models.DateField(default=date.today)
+    
+    # Completion History (one bit per day, see bitmap.py)
+    completion_bitmap = models.BinaryField(default=bytes, editable=False)
+    bitmap_start = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Dashboard: a user's habits, newest first, without a sort step
+            models.Index(fields=['user', '-created_at'], name='habit_user_created_idx'),
+            # Rollover: only habits with a live streak can be broken or frozen
+            models.Index(fields=['frequency'], condition=models.Q(current_streak__gt=0), name='habit_live_streak_idx'),
+            # Reminders: habits due in a minute range, without the ones that have no reminder
+            models.Index(
+                fields=['reminder_time'], condition=models.Q(reminder_time__isnull=False), name='habit_reminder_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+    @property
+    def period_target(self):
+        """Completions per period that keep the streak going (a day only holds one)."""
+        return self.times_per_period if self.frequency == 'WEEKLY' else 1
+
+    def get_history(self):
+        return CompletionBitmap(self.bitmap_start, self.completion_bitmap)
+
+    def set_history(self, bitmap):
+        self.bitmap_start = bitmap.start
+        self.completion_bitmap = bitmap.to_bytes()
+
+    def save_history(self, bitmap):
+        """
+        Store the bitmap on this instance and persist only the history columns.
+        """
+        self.set_history(bitmap)
+        Habit.objects.filter(pk=self.pk).update(
+            completion_bitmap=self.completion_bitmap,
+            bitmap_start=self.bitmap_start,
+        )
+
+    def rebuild_history(self):
+        """
+        Regenerate the bitmap from Occurence rows and the archived yearly
+        summaries (e.g. after bulk inserts).
+        """
+        from .archive import completion_dates
+        self.save_history(CompletionBitmap.from_dates(completion_dates(self), start=self.created_at))
+
+    def get_freezes(self):
+        """
+        Days on which a freeze token kept this habit's streak alive.
+        """
+        return set(self.streakfreeze_set.values_list('date', flat=True))
+
 class Occurence(models.Model):
-    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    # No separate habit index: (habit, date) below serves lookups by habit alone
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, db_index=False)
     date = models.DateField(default=date.today)
     
     # New: Rich Logging
@@ -115,3 +179,264 @@ class Occurence(models.Model):
     def __str__(self):
         return f'{self.habit.name} @ {self.date}'
 
+    # Keep the habit's completion bitmap in sync. Queryset operations
+    # (bulk_create, cascades, queryset.delete) bypass this; call
+    # Habit.rebuild_history() afterwards. Callers that already maintain the
+    # bitmap on a locked habit pass sync_history=False.
+    def save(self, *args, sync_history=True, **kwargs):
+        if not (self._state.adding and sync_history):
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            habit = self._lock_habit()
+            super().save(*args, **kwargs)
+            history = habit.get_history()
+            history.add(self.date)
+            self._save_history(habit, history)
+
+    def delete(self, *args, sync_history=True, **kwargs):
+        if not sync_history:
+            return super().delete(*args, **kwargs)
+        with transaction.atomic():
+            habit = self._lock_habit()
+            result = super().delete(*args, **kwargs)
+            history = habit.get_history()
+            history.discard(self.date)
+            self._save_history(habit, history)
+        return result
+
+    def _lock_habit(self):
+        # Re-read the bitmap under the row lock: self.habit may be stale
+        return Habit.objects.select_for_update().only('id', 'completion_bitmap', 'bitmap_start').get(pk=self.habit_id)
+
+    def _save_history(self, habit, history):
+        habit.save_history(history)
+        if Occurence.habit.is_cached(self):
+            self.habit.set_history(history)
+
+
+# --- Cold History (see archive.py) ---
+
+class OccurenceArchive(models.Model):
+    """
+    Occurence rows older than the archive horizon, moved out of the hot table
+    by compact_history. Keeps the original id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, db_index=False)
+    date = models.DateField()
+    notes = models.TextField(blank=True, null=True)
+    mood = models.CharField(max_length=20, blank=True, null=True)
+    xp_gained = models.IntegerField(default=0)
+    token_earned = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('habit', 'date')
+
+    def __str__(self):
+        return f'{self.habit_id} @ {self.date} (archived)'
+
+
+class HabitYearSummary(models.Model):
+    """
+    One habit's archived completions in one calendar year: a day bitmap
+    starting on January 1st plus totals.
+    """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, db_index=False)
+    year = models.IntegerField()
+    days = models.BinaryField(default=bytes)
+    completions = models.IntegerField(default=0)
+    xp_total = models.IntegerField(default=0)
+    tokens = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('habit', 'year')
+
+    def get_days(self):
+        return CompletionBitmap(date(self.year, 1, 1), self.days)
+
+    def __str__(self):
+        return f'{self.habit_id} {self.year}: {self.completions}'
+
+
+
+class DailyActivity(models.Model):
+    """
+    Completions per user per day, maintained incrementally by the toggle
+    write path (see activity.py) so the heatmap is a single range scan.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    completions = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        return f'{self.user.username} @ {self.date}: {self.completions}'
+
+
+class LeaderboardEntry(models.Model):
+    """
+    Materialized XP ranking, rebuilt by refresh_leaderboard (see leaderboard.py).
+    Ranks are unique positions (ties broken by user id) so they work as keyset
+    pagination cursors.
+    """
+    rank = models.IntegerField(unique=True)
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    username = models.CharField(max_length=150)
+    xp = models.IntegerField()
+    level = models.IntegerField()
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'#{self.rank} {self.username} ({self.xp} XP)'
+
+
+# --- Streak Rollover ---
+
+class StreakFreeze(models.Model):
+    """
+    A missed day bridged by a freeze token (written by rollover_streaks).
+    """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE)
+    date = models.DateField()
+
+    class Meta:
+        unique_together = ('habit', 'date')
+
+    def __str__(self):
+        return f'{self.habit.name} frozen @ {self.date}'
+
+class RolloverRun(models.Model):
+    """
+    One nightly rollover; the unique date makes re-runs a no-op.
+    """
+    date = models.DateField(unique=True) # The day being rolled into (yesterday was checked)
+    ran_at = models.DateTimeField(auto_now_add=True)
+    streaks_broken = models.IntegerField(default=0)
+    streaks_frozen = models.IntegerField(default=0)
+    tokens_consumed = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'Rollover {self.date}: {self.streaks_broken} broken, {self.streaks_frozen} frozen'
+
+
+# --- Reminders (see reminders.py) ---
+
+class ReminderMessage(models.Model):
+    """
+    The database outbox: a due reminder handed over by dispatch_reminders for
+    delivery. Unique per habit and day, so a re-run never reminds twice.
+    """
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    due_at = models.DateTimeField()
+    habit_name = models.CharField(max_length=128)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('habit', 'date')
+
+    def __str__(self):
+        return f'Remind {self.user_id} about {self.habit_name} @ {self.due_at}'
+
+
+# --- Sync (see sync.py) ---
+
+class ChangeLogEntry(models.Model):
+    """
+    One change to a row a sync client holds, written in the same transaction
+    as the change. Writers hold the user's profile lock, so a user's entries
+    commit in id order and an id works as a change token.
+    """
+    HABIT = 'H'
+    OCCURENCE = 'O'
+    PROFILE = 'P'
+    ACHIEVEMENT = 'A'
+    KIND_CHOICES = [
+        (HABIT, 'Habit'),
+        (OCCURENCE, 'Occurence'),
+        (PROFILE, 'Profile'),
+        (ACHIEVEMENT, 'Achievement'),
+    ]
+
+    # No separate user index: (user, id) below serves it
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    # Habit id (habits and completions), achievement id or user id (profile)
+    object_id = models.IntegerField()
+    # The completed day, for completions
+    date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Sync: a user's entries after a token, in order
+            models.Index(fields=['user', 'id'], name='changelog_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} #{self.id}: {self.get_kind_display()} {self.object_id}'
+
+
+# --- XP Ledger (see ledger.py) ---
+
+class XpLedgerEntry(models.Model):
+    """
+    One change to a user's XP, written in the same transaction as the change
+    to UserProfile.xp. Append-only: a correction is a new ADJUSTMENT entry.
+    """
+    COMPLETION = 'COMPLETION'
+    UNDO = 'UNDO'
+    ACHIEVEMENT = 'ACHIEVEMENT'
+    IMPORT = 'IMPORT'
+    OPENING = 'OPENING'
+    ADJUSTMENT = 'ADJUSTMENT'
+    SOURCE_CHOICES = [
+        (COMPLETION, 'Habit completed'),
+        (UNDO, 'Completion undone'),
+        (ACHIEVEMENT, 'Achievement reward'),
+        (IMPORT, 'Imported history'),
+        (OPENING, 'Balance before the ledger'),
+        (ADJUSTMENT, 'Reconciliation adjustment'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    source = models.CharField(max_length=12, choices=SOURCE_CHOICES)
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+    # What earned it, where there is one. No constraint: entries are never
+    # updated, so they keep the id of a habit or achievement deleted since
+    habit = models.ForeignKey(
+        Habit, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, db_index=False,
+    )
+    date = models.DateField(null=True, blank=True)
+    achievement = models.ForeignKey(
+        Achievement, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, db_index=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Totals: a user's entries after their snapshot
+            models.Index(fields=['user', 'id'], name='xpledger_user_idx'),
+            # XP this week/month: a user's entries in a time range
+            models.Index(fields=['user', 'created_at'], name='xpledger_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.amount:+d} XP ({self.source})'
+
+
+class XpSnapshot(models.Model):
+    """
+    A user's ledger total through one entry, refreshed by snapshot_xp. The
+    current total is this plus the entries after it.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='xp_snapshot')
+    through_entry_id = models.BigIntegerField()
+    total = models.IntegerField()
+    taken_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.user_id}: {self.total} XP through #{self.through_entry_id}'
+
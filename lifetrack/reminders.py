@@ -0,0 +1,203 @@
+"""
+Habit reminders.
+
+dispatch_reminders reminds users of habits whose reminder_time falls in the
+current minute and that aren't completed today. Habits aren't looked up
+minute by minute. A ReminderWheel (a timing wheel with one slot per minute
+of the day) is filled ahead of time from range scans of the partial
+reminder_time index. Dispatching a slot re-checks its habits by primary key,
+a chunk at a time. That drops any habit completed or moved to another
+reminder time since it was loaded, and hands the rest to the outbox as a
+queryset.
+
+Reminder times are wall-clock times in TIME_ZONE. A reminder moved less than
+the lookahead before it's due may be skipped for that day. The outbox is
+pluggable (LIFETRACK_REMINDER_OUTBOX):
+- DatabaseOutbox writes ReminderMessage rows for a delivery worker, with
+  one INSERT ... SELECT per chunk.
+- FileOutbox appends JSON lines to a file.
+"""
+import json
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Habit, Occurence, ReminderMessage
+
+MINUTES_PER_DAY = 24 * 60
+LOOKAHEAD_MINUTES = 5
+DISPATCH_CHUNK = 2000
+
+
+def minute_of(value):
+    """Minute of the day (0-1439) of a time or datetime."""
+    return value.hour * 60 + value.minute
+
+
+def in_minutes(first, last):
+    """
+    Habits with a reminder in minutes first..last of the day (an index range
+    scan on habit_reminder_idx).
+    """
+    habits = Habit.objects.filter(reminder_time__isnull=False, reminder_time__gte=time(*divmod(first, 60)))
+    if last + 1 < MINUTES_PER_DAY:
+        habits = habits.filter(reminder_time__lt=time(*divmod(last + 1, 60)))
+    return habits
+
+
+class ReminderWheel:
+    """
+    Ids of the habits with a reminder in each minute of one day, loaded ahead
+    of the clock.
+    """
+
+    def __init__(self, day):
+        self.day = day
+        self.slots = [[] for _ in range(MINUTES_PER_DAY)]
+        self.loaded_through = -1
+
+    def load_through(self, minute):
+        """
+        Load every slot up to `minute` that isn't loaded yet, with one query.
+        Returns the number of habits added.
+        """
+        minute = min(minute, MINUTES_PER_DAY - 1)
+        first = self.loaded_through + 1
+        if first > minute:
+            return 0
+        added = 0
+        rows = in_minutes(first, minute).values_list('id', 'reminder_time')
+        for habit_id, reminder_time in rows.iterator(chunk_size=DISPATCH_CHUNK):
+            self.slots[minute_of(reminder_time)].append(habit_id)
+            added += 1
+        self.loaded_through = minute
+        return added
+
+    def pop(self, minute):
+        habit_ids, self.slots[minute] = self.slots[minute], []
+        return habit_ids
+
+
+def due_habits(day, minute, habit_ids, chunk_size=DISPATCH_CHUNK):
+    """
+    The habits in `habit_ids` that are still due at `minute` of `day`:
+    reminder still in that minute and not completed that day. Yields one
+    queryset per chunk of ids.
+    """
+    completed = Occurence.objects.filter(habit=OuterRef('pk'), date=day)
+    hour, minute = divmod(minute, 60)
+    for start in range(0, len(habit_ids), chunk_size):
+        # Hour and minute rather than a time range: with a range the planner
+        # scans the whole minute in the reminder index for every chunk
+        yield Habit.objects.filter(
+            id__in=habit_ids[start:start + chunk_size], reminder_time__hour=hour, reminder_time__minute=minute,
+        ).filter(~Exists(completed))
+
+
+class ReminderDispatcher:
+    """
+    Drives a ReminderWheel from the clock. Each tick(now) dispatches every
+    minute up to `now` that hasn't been dispatched yet, finishing the previous
+    day first after midnight. The first tick starts `catch_up` minutes back.
+    """
+
+    def __init__(self, outbox=None, lookahead=LOOKAHEAD_MINUTES, catch_up=0, chunk_size=DISPATCH_CHUNK):
+        self.outbox = outbox or get_outbox()
+        self.lookahead = lookahead
+        self.catch_up = catch_up
+        self.chunk_size = chunk_size
+        self.wheel = None
+        self.next_minute = 0
+
+    def tick(self, now=None):
+        """
+        Returns the number of reminders handed to the outbox.
+        """
+        now = timezone.localtime(now)
+        day, minute = now.date(), minute_of(now)
+        sent = 0
+        if self.wheel is not None and self.wheel.day != day:
+            if self.wheel.day < day:
+                sent += self._dispatch_through(MINUTES_PER_DAY - 1)
+            self.wheel = ReminderWheel(day)
+            self.next_minute = 0
+        elif self.wheel is None:
+            self.wheel = ReminderWheel(day)
+            self.next_minute = max(0, minute - self.catch_up)
+
+        sent += self._dispatch_through(minute)
+        # Load the next minutes now, so their dispatch only needs the re-check
+        self.wheel.load_through(minute + self.lookahead)
+        return sent
+
+    def _dispatch_through(self, minute):
+        self.wheel.load_through(minute)
+        sent = 0
+        while self.next_minute <= minute:
+            day = self.wheel.day
+            due_at = timezone.make_aware(datetime.combine(day, time(*divmod(self.next_minute, 60))))
+            for habits in due_habits(day, self.next_minute, self.wheel.pop(self.next_minute), self.chunk_size):
+                sent += self.outbox.send(day, due_at, habits)
+            self.next_minute += 1
+        return sent
+
+
+# --- Outboxes ---
+
+def get_outbox():
+    return import_string(getattr(settings, 'LIFETRACK_REMINDER_OUTBOX', 'lifetrack.reminders.DatabaseOutbox'))()
+
+
+class DatabaseOutbox:
+    """
+    ReminderMessage rows. A reminder already in the outbox (same habit and
+    day) is ignored, so overlapping dispatchers and re-runs are harmless.
+    """
+
+    def send(self, day, due_at, habits):
+        """
+        INSERT ... SELECT the habits' reminders. Returns the number of new rows.
+        """
+        select_sql, params = habits.values('id', 'user_id', 'name').query.sql_with_params()
+        qn = connection.ops.quote_name
+        insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+        on_conflict = connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"{insert} {qn(ReminderMessage._meta.db_table)} "
+                f"(habit_id, user_id, habit_name, date, due_at, created_at) "
+                f"SELECT due.id, due.user_id, due.name, %s, %s, %s FROM ({select_sql}) due {on_conflict}",
+                [
+                    connection.ops.adapt_datefield_value(day),
+                    connection.ops.adapt_datetimefield_value(due_at),
+                    connection.ops.adapt_datetimefield_value(timezone.now()),
+                    *params,
+                ],
+            )
+            return cursor.rowcount
+
+
+class FileOutbox:
+    """
+    One JSON line per reminder, appended to LIFETRACK_REMINDER_OUTBOX_PATH.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'LIFETRACK_REMINDER_OUTBOX_PATH', 'reminders.jsonl')
+
+    def send(self, day, due_at, habits):
+        lines = [
+            json.dumps({
+                'habit_id': habit_id, 'user_id': user_id, 'habit_name': name,
+                'date': day.isoformat(), 'due_at': due_at.isoformat(),
+            }) + '\n'
+            for habit_id, user_id, name in habits.values_list('id', 'user_id', 'name')
+        ]
+        with open(self.path, 'a') as f:
+            f.writelines(lines)
+        return len(lines)
@@ -0,0 +1,56 @@
+"""
+Schema check.
+
+At cold start we compare the migrations shipped with this code to the
+django_migrations table (one query) instead of running `migrate` in the
+request path. The migration files are listed from each app's migrations
+package without importing them, so the check stays cheap on every instance.
+"""
+import pkgutil
+from importlib import import_module
+
+from django.apps import apps
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+
+def migrations_on_disk():
+    """
+    Sorted "app.name" for every migration in the codebase. Reads the package
+    listings only, the way MigrationLoader finds them before importing.
+    """
+    names = []
+    for app_config in apps.get_app_configs():
+        module_name, _ = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            module = import_module(module_name)
+        except ModuleNotFoundError:
+            continue
+        if not hasattr(module, '__path__'):
+            continue
+        names += [
+            f'{app_config.label}.{name}'
+            for _, name, is_pkg in pkgutil.iter_modules(module.__path__)
+            if not is_pkg and name[0] not in '_~'
+        ]
+    return sorted(names)
+
+
+def applied_migrations():
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table():
+        return set()
+    return {f'{app}.{name}' for app, name in recorder.migration_qs.values_list('app', 'name')}
+
+
+def missing_migrations(expected=None):
+    """
+    Migrations in this codebase (or `expected`) that haven't been applied to
+    the database.
+    """
+    if expected is None:
+        expected = migrations_on_disk()
+    return sorted(set(expected) - applied_migrations())
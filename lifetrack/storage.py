@@ -0,0 +1,29 @@
+"""
+Static files storage.
+
+collectstatic (build_files.sh) gives every file a content-hashed name, writes
+gzip and brotli copies and records the names in a manifest. Pages link the
+hashed names, which WhiteNoise (or the CDN) serves with far-future cache
+headers. The deployed lambda reads the same manifest: vercel.json ships
+STATIC_ROOT/staticfiles.json with it, and a missing entry is an error there,
+as it is for ManifestStaticFilesStorage.
+
+Where nothing was collected (DEBUG, tests, benchmarks, `runserver`) turn on
+LIFETRACK_STATIC_FALLBACK and pages link the plain names instead of failing;
+collectstatic keeps a plain copy of every file for those links.
+"""
+from django.conf import settings
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class AssetStorage(CompressedManifestStaticFilesStorage):
+    def stored_name(self, name):
+        if not settings.LIFETRACK_STATIC_FALLBACK:
+            return super().stored_name(name)
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Added since the last collectstatic
+            return name
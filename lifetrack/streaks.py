@@ -0,0 +1,120 @@
+"""
+Streak engine.
+
+Streaks are computed from a habit's completion bitmap instead of walking back
+day by day with a query per day.
+
+Streaks count periods: days for DAILY habits, ISO weeks (Monday to Sunday)
+for WEEKLY ones. A period counts once it reaches the habit's target
+(Habit.period_target, e.g. 3 for "3 times a week"). Weekly histories are
+bucketed from the same bitmap integer, so reading a weekly streak costs
+about the same as reading a daily one.
+"""
+from datetime import date, timedelta
+
+from .bitmap import popcount, run_ending_at, longest_run_of
+
+
+PERIOD_DAYS = {'DAILY': 1, 'WEEKLY': 7}
+
+
+def period_start(day, frequency='DAILY'):
+    """
+    First day of the period containing `day`: the day itself, or the Monday
+    of its ISO week.
+    """
+    return day - timedelta(days=day.weekday()) if frequency == 'WEEKLY' else day
+
+
+def period_bounds(day, frequency='DAILY'):
+    first = period_start(day, frequency)
+    return first, first + timedelta(days=PERIOD_DAYS[frequency] - 1)
+
+
+def _met_periods(history, frequency, target):
+    """
+    Bucket the history into periods. Returns (anchor, met) where bit k of the
+    integer `met` is set if the k-th period from `anchor` reached `target`
+    completions. Works on the bitmap's integer in a single pass.
+    """
+    if history.start is None:
+        return None, 0
+    anchor = period_start(history.start, frequency)
+    days = history.to_int() << (history.start - anchor).days
+    span = PERIOD_DAYS[frequency]
+    if span == 1:
+        return anchor, days
+
+    # One pass over the bits as text (lowest day first), one flag per period
+    bits = format(days, 'b')[::-1]
+    flags = ''.join(
+        '1' if bits.count('1', k, k + span) >= target else '0' for k in range(0, len(bits), span)
+    )
+    return anchor, int(flags[::-1] or '0', 2)
+
+
+def _period_index(day, anchor, frequency):
+    return (period_start(day, frequency) - anchor).days // PERIOD_DAYS[frequency]
+
+
+def _frozen_periods(frozen, anchor, frequency):
+    bits = 0
+    for day in frozen or ():
+        k = _period_index(day, anchor, frequency)
+        if k >= 0:
+            bits |= 1 << k
+    return bits
+
+
+def _streak_at(met, frozen_bits, k):
+    """
+    Met periods in the run ending at period k. Frozen periods keep a run
+    alive without adding to it.
+    """
+    run = run_ending_at(met | frozen_bits, k)
+    if not run:
+        return 0
+    return popcount((met >> (k - run + 1)) & ((1 << run) - 1))
+
+
+def streak_ending(history, day, frozen=None, frequency='DAILY', target=1):
+    """
+    Streak (in periods) of the run ending with the period containing `day`.
+    A period that hasn't reached its target yet doesn't end a run, so the
+    streak is the one it would be building on.
+    """
+    anchor, met = _met_periods(history, frequency, target)
+    if anchor is None:
+        return 0
+    k = _period_index(day, anchor, frequency)
+    if k < 0:
+        return 0
+    if frequency != 'DAILY' and not (met >> k) & 1:
+        k -= 1
+    return _streak_at(met, _frozen_periods(frozen, anchor, frequency), k)
+
+
+def streaks_from_history(history, today, frozen=None, frequency='DAILY', target=1):
+    """
+    Return (current_streak, longest_streak) in periods from a CompletionBitmap.
+    The current period is still in progress, so if it hasn't reached its
+    target the streak ending with the previous period is still alive.
+    """
+    anchor, met = _met_periods(history, frequency, target)
+    if anchor is None:
+        return 0, 0
+    k = _period_index(today, anchor, frequency)
+    if not (met >> k) & 1:
+        k -= 1
+    current = _streak_at(met, _frozen_periods(frozen, anchor, frequency), k) if k >= 0 else 0
+    return current, max(longest_run_of(met), current)
+
+
+def get_habit_streaks(habit, today=None):
+    """
+    Return (current_streak, longest_streak) for a habit without touching Occurence.
+    """
+    today = today or date.today()
+    return streaks_from_history(
+        habit.get_history(), today, habit.get_freezes(), habit.frequency, habit.period_target,
+    )
@@ -0,0 +1,181 @@
+"""
+Delta sync for mobile and offline clients.
+
+Every write to a user's habits, completions, profile or achievements appends
+ChangeLogEntry rows in the same transaction, while holding the user's profile
+lock (select_for_update). So a user's entries commit in id order, and the id
+of the last entry a client has seen is its change token.
+
+changes_since(user, token) reads the entries after the token (a range scan
+on changelog_user_idx, at most SYNC_PAGE of them). It then loads the current
+state of each distinct row they name, with one query per table. A row that
+no longer exists comes back as a tombstone. The work and the payload follow
+the number of changes, not the size of the user's history. Token 0 (a new
+client) gets a snapshot of every row instead, archived completions (see
+archive.py) included.
+
+Completions made offline are applied as explicit completed/not completed
+toggles, so sending the same batch twice is harmless.
+"""
+from django.db import connection
+from django.db.models import F
+
+from .models import Habit, Occurence, OccurenceArchive, UserProfile, UserAchievement, ChangeLogEntry
+
+SYNC_PAGE = 500
+
+HABIT_FIELDS = [
+    'id', 'name', 'description', 'difficulty', 'category', 'frequency', 'times_per_period',
+    'current_streak', 'longest_streak', 'last_completed_date', 'reminder_time', 'created_at',
+]
+OCCURENCE_FIELDS = ['habit_id', 'date', 'notes', 'mood', 'xp_gained', 'token_earned']
+PROFILE_FIELDS = ['xp', 'level', 'freeze_tokens', 'avatar_url', 'total_habits_completed']
+ACHIEVEMENT_FIELDS = {'name': F('achievement__name'), 'icon': F('achievement__icon')}
+
+
+# --- Write side ---
+
+def record_changes(user_id, changes):
+    """
+    Append (kind, object_id, date) changes to a user's log. Call inside the
+    transaction that makes them, holding the user's profile lock.
+    """
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(user_id=user_id, kind=kind, object_id=object_id, date=day)
+        for kind, object_id, day in changes
+    )
+
+
+def record_changes_from(kind, rows):
+    """
+    INSERT ... SELECT one change per row of `rows`, a values() queryset with
+    user_id and object_id columns. For set-based writers (rollover_streaks),
+    which must lock the users' profiles first.
+    """
+    select_sql, params = rows.query.sql_with_params()
+    table = connection.ops.quote_name(ChangeLogEntry._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (user_id, kind, object_id) "
+            f"SELECT changed.user_id, %s, changed.object_id FROM ({select_sql}) changed",
+            [kind, *params],
+        )
+        return cursor.rowcount
+
+
+def apply_completions(user, items):
+    """
+    Apply ToggleItems queued by an offline client. Items for habits deleted
+    since then are skipped; their tombstones are in the changes. Returns the
+    toggle results and the skipped habit ids.
+    """
+    from .toggles import apply_toggles
+    known = set(Habit.objects.filter(user=user, id__in={i.habit_id for i in items}).values_list('id', flat=True))
+    skipped = sorted({i.habit_id for i in items} - known)
+    items = [i for i in items if i.habit_id in known]
+    if not items:
+        return [], skipped
+    return apply_toggles(user, items)['results'], skipped
+
+
+# --- Read side ---
+
+def _occurrences(user, **filters):
+    """
+    The user's completions matching `filters`, from the archive and the live
+    table, by habit and date. An archived day wins over a live copy, as in
+    compact_history.
+    """
+    rows = {}
+    for model in (Occurence, OccurenceArchive):
+        for row in model.objects.filter(habit__user=user, **filters).values(*OCCURENCE_FIELDS):
+            rows[(row['habit_id'], row['date'])] = row
+    return [rows[key] for key in sorted(rows)]
+
+
+def latest_token(user):
+    return ChangeLogEntry.objects.filter(user=user).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def snapshot(user):
+    """
+    Every live row of the user, with the token to sync from afterwards.
+    """
+    # Read the token first: a change committed in between is sent again next time
+    token = latest_token(user)
+    return {
+        'token': token,
+        'has_more': False,
+        'habits': list(Habit.objects.filter(user=user).order_by('id').values(*HABIT_FIELDS)),
+        'occurrences': _occurrences(user),
+        'profile': UserProfile.objects.filter(user=user).values(*PROFILE_FIELDS).first(),
+        'achievements': list(
+            UserAchievement.objects.filter(user=user).order_by('achievement_id')
+            .values('achievement_id', 'date_earned', **ACHIEVEMENT_FIELDS)
+        ),
+        'deleted': {'habits': [], 'occurrences': [], 'achievements': []},
+    }
+
+
+def changes_since(user, token, page=SYNC_PAGE):
+    """
+    The current state of every row changed after `token`, tombstones for the
+    ones deleted, and the token to sync from next. has_more is set when more
+    than `page` entries were waiting.
+    """
+    if not token:
+        return snapshot(user)
+
+    entries = list(
+        ChangeLogEntry.objects.filter(user=user, id__gt=token).order_by('id')
+        .values_list('id', 'kind', 'object_id', 'date')[:page + 1]
+    )
+    has_more = len(entries) > page
+    entries = entries[:page]
+
+    habit_ids, completions, achievement_ids = set(), set(), set()
+    profile_changed = False
+    for _, kind, object_id, day in entries:
+        if kind == ChangeLogEntry.HABIT:
+            habit_ids.add(object_id)
+        elif kind == ChangeLogEntry.OCCURENCE:
+            completions.add((object_id, day))
+        elif kind == ChangeLogEntry.ACHIEVEMENT:
+            achievement_ids.add(object_id)
+        else:
+            profile_changed = True
+
+    habits = []
+    if habit_ids:
+        habits = list(Habit.objects.filter(user=user, id__in=habit_ids).order_by('id').values(*HABIT_FIELDS))
+    deleted_habits = habit_ids - {h['id'] for h in habits}
+
+    occurrences = []
+    completions = {(h, d) for h, d in completions if h not in deleted_habits}
+    if completions:
+        # Every changed day of every changed habit, then only the logged pairs
+        # (a day archived since it changed is still there, not deleted)
+        rows = _occurrences(user, habit_id__in={h for h, _ in completions}, date__in={d for _, d in completions})
+        occurrences = [o for o in rows if (o['habit_id'], o['date']) in completions]
+    deleted_occurrences = completions - {(o['habit_id'], o['date']) for o in occurrences}
+
+    achievements = []
+    if achievement_ids:
+        achievements = list(
+            UserAchievement.objects.filter(user=user, achievement_id__in=achievement_ids).order_by('achievement_id')
+            .values('achievement_id', 'date_earned', **ACHIEVEMENT_FIELDS)
+        )
+
+    return {
+        'token': entries[-1][0] if entries else token,
+        'has_more': has_more,
+        'habits': habits,
+        'occurrences': occurrences,
+        'profile': UserProfile.objects.filter(user=user).values(*PROFILE_FIELDS).first() if profile_changed else None,
+        'achievements': achievements,
+        'deleted': {
+            'habits': sorted(deleted_habits),
+            'occurrences': [{'habit_id': h, 'date': d} for h, d in sorted(deleted_occurrences)],
+            'achievements': sorted(achievement_ids - {a['achievement_id'] for a in achievements}),
+        },
+    }
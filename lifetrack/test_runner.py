@@ -0,0 +1,17 @@
+"""
+Test runner. The suite renders pages without running collectstatic, so it
+links the plain static names (LIFETRACK_STATIC_FALLBACK, lifetrack/storage.py).
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class LifetrackTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._static_fallback = override_settings(LIFETRACK_STATIC_FALLBACK=True)
+        self._static_fallback.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._static_fallback.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,9 +1,75 @@
-from django.test import TestCase, Client
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import tracemalloc
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, Client, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, close_old_connections
 from django.contrib.auth.models import User
-from .models import Habit, Occurence
-from datetime import date, timedelta
+from .models import Habit, Occurence, UserProfile, Achievement, UserAchievement, StreakFreeze, RolloverRun, DailyActivity, LeaderboardEntry
+from .models import OccurenceArchive, HabitYearSummary, ReminderMessage, XpLedgerEntry, XpSnapshot
+from .archive import compact, live_horizon, habit_totals, archive_after_days
+from .streaks import streaks_from_history, streak_ending, get_habit_streaks
+from .bitmap import CompletionBitmap
+from .achievements import invalidate_catalog, get_catalog
+from .management.commands.rollover_streaks import rollover, missed_habits
+from .schema import missing_migrations, migrations_on_disk
+from .activity import rebuild_activity, heatmap
+from . import dashboard_cache
+from . import leaderboard
+from . import metrics
+from . import reminders
+from . import sync
+from . import ledger
+from .leveling import level_for_xp, level_progress, xp_threshold, THRESHOLDS
+from .utils import check_level_up, check_achievements
+from datetime import date, datetime, time, timedelta
 
 from django.urls import reverse
+from django.core.management import call_command, CommandError
+from django.db.models import F
+from django.core.cache import cache
+from django.utils import timezone
+
+# The session engine settings.py picks with a shared cache (the test cache is
+# per process, so the default there is db)
+CACHED_DB_SESSIONS = 'django.contrib.sessions.backends.cached_db'
+
+
+def compute_streaks(dates, today):
+    """
+    Reference for the streak engine: (current_streak, longest_streak) of a
+    daily habit, worked out from a plain list of completion dates.
+
+    The current streak is the run ending today, or the run ending yesterday if
+    today hasn't been completed yet (the day isn't over, so it is still alive).
+    Dates after `today` are ignored.
+    """
+    today_ord = today.toordinal()
+    ordinals = sorted({d.toordinal() for d in dates if d.toordinal() <= today_ord})
+
+    longest = 0
+    run = 0
+    prev = None
+    for o in ordinals:
+        if prev is not None and o == prev + 1:
+            run += 1
+        else:
+            run = 1
+        if run > longest:
+            longest = run
+        prev = o
+
+    current = run if prev is not None and prev >= today_ord - 1 else 0
+    return current, longest
+
 
 class StreakTests(TestCase):
     def setUp(self):
@@ -50,3 +116,1788 @@ class StreakTests(TestCase):
         
         self.habit.refresh_from_db()
         self.assertEqual(self.habit.current_streak, 2)
+
+
+class StreakEngineTests(TestCase):
+    def setUp(self):
+        self.today = date(2024, 3, 10)
+
+    def days_ago(self, *offsets):
+        return [self.today - timedelta(days=n) for n in offsets]
+
+    def assertStreaks(self, dates, expected):
+        self.assertEqual(compute_streaks(dates, self.today), expected)
+        self.assertEqual(streaks_from_history(CompletionBitmap.from_dates(dates), self.today), expected)
+
+    def test_empty_history(self):
+        self.assertStreaks([], (0, 0))
+
+    def test_current_streak_ending_today(self):
+        self.assertStreaks(self.days_ago(0, 1, 2), (3, 3))
+
+    def test_current_streak_ending_yesterday_is_alive(self):
+        self.assertStreaks(self.days_ago(1, 2), (2, 2))
+
+    def test_gap_breaks_current_but_keeps_longest(self):
+        self.assertStreaks(self.days_ago(0, 5, 6, 7, 8), (1, 4))
+
+    def test_stale_streak_is_zero(self):
+        self.assertStreaks(self.days_ago(2, 3), (0, 2))
+
+    def test_future_dates_ignored(self):
+        # Only the reference: toggles and imports never store a future day
+        self.assertEqual(compute_streaks(self.days_ago(0, -1, -2), self.today), (1, 1))
+
+
+class ToggleQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queryuser', password='password')
+        self.client = Client()
+        self.client.login(username='queryuser', password='password')
+        self.url = reverse('lifetrack:toggle_habit')
+
+    def make_habit_with_streak(self, length):
+        habit = Habit.objects.create(user=self.user, name=f"Streak {length}")
+        today = date.today()
+        Occurence.objects.bulk_create(
+            Occurence(habit=habit, date=today - timedelta(days=n)) for n in range(1, length + 1)
+        )
+        habit.rebuild_history()
+        return habit
+
+    def count_toggle_queries(self, habit):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'habit_id': habit.id})
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_streak_length(self):
+        short_data, short_queries = self.count_toggle_queries(self.make_habit_with_streak(3))
+        long_data, long_queries = self.count_toggle_queries(self.make_habit_with_streak(400))
+
+        self.assertEqual(short_data['streak'], 4)
+        self.assertEqual(long_data['streak'], 401)
+        self.assertEqual(short_queries, long_queries)
+
+
+@override_settings(SESSION_ENGINE=CACHED_DB_SESSIONS)
+class DashboardQueryBudgetTests(TestCase):
+    # Cache miss: user with profile + habits (with completion annotation);
+    # the session comes from the cache
+    QUERY_BUDGET = 2
+    # Cache hit: user with profile
+    CACHED_QUERY_BUDGET = 1
+
+    def setUp(self):
+        cache.clear()
+        dashboard_cache.reset_cache_stats()
+        self.user = User.objects.create_user(username='dashuser', password='password')
+        self.client = Client()
+        self.client.login(username='dashuser', password='password')
+        self.url = reverse('lifetrack:dashboard')
+
+    def add_habits(self, count):
+        today = date.today()
+        habits = Habit.objects.bulk_create(
+            Habit(user=self.user, name=f"Habit {n}") for n in range(count)
+        )
+        # Complete every other habit today so both branches of the template render
+        Occurence.objects.bulk_create(Occurence(habit=h, date=today) for h in habits[::2])
+
+    def test_dashboard_query_budget_with_few_habits(self):
+        self.add_habits(1)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_query_budget_with_many_habits(self):
+        self.add_habits(60)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['habits']), 60)
+
+    def test_completed_today_annotation(self):
+        habit = Habit.objects.create(user=self.user, name="Done")
+        Habit.objects.create(user=self.user, name="Pending")
+        Occurence.objects.create(habit=habit, date=date.today())
+
+        response = self.client.get(self.url)
+        status = {h['name']: h['completed_today'] for h in response.context['habits']}
+        self.assertEqual(status, {'Done': True, 'Pending': False})
+
+    def test_cache_hit_needs_no_queries_beyond_auth(self):
+        self.add_habits(60)
+        self.client.get(self.url)
+        with self.assertNumQueries(self.CACHED_QUERY_BUDGET):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['habits']), 60)
+        self.assertEqual(dashboard_cache.cache_stats(), {'hits': 1, 'misses': 1})
+
+    @override_settings(LIFETRACK_DASHBOARD_CACHE_TIMEOUT=0)
+    def test_cache_timeout_comes_from_settings(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(dashboard_cache.cache_stats(), {'hits': 0, 'misses': 2})
+
+    def test_writes_invalidate_the_cached_dashboard(self):
+        habit = Habit.objects.create(user=self.user, name="Cached")
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habit.id})
+        response = self.client.get(self.url)
+        self.assertTrue(response.context['habits'][0]['completed_today'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lifetrack:create_habit'), {'name': "Second"})
+        self.assertEqual(len(self.client.get(self.url).context['habits']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('lifetrack:delete_habit', args=[habit.id]))
+        self.assertEqual(len(self.client.get(self.url).context['habits']), 1)
+        self.assertEqual(dashboard_cache.cache_stats(), {'hits': 0, 'misses': 4})
+
+
+class CompletionBitmapTests(TestCase):
+    def setUp(self):
+        self.start = date(2024, 1, 1)
+
+    def day(self, n):
+        return self.start + timedelta(days=n)
+
+    def test_membership_and_runs(self):
+        bitmap = CompletionBitmap.from_dates([self.day(n) for n in (0, 1, 2, 5, 6)], start=self.start)
+        self.assertIn(self.day(1), bitmap)
+        self.assertNotIn(self.day(3), bitmap)
+        self.assertEqual(len(bitmap), 5)
+        self.assertEqual(bitmap.run_length_ending(self.day(2)), 3)
+        self.assertEqual(bitmap.run_length_ending(self.day(6)), 2)
+        self.assertEqual(bitmap.run_length_ending(self.day(4)), 0)
+        self.assertEqual(bitmap.longest_run(), 3)
+
+    def test_add_before_start_rebases(self):
+        bitmap = CompletionBitmap(self.start)
+        bitmap.add(self.day(0))
+        bitmap.add(self.day(-20))
+        self.assertEqual(list(bitmap), [self.day(-20), self.day(0)])
+        restored = CompletionBitmap(bitmap.start, bitmap.to_bytes())
+        self.assertEqual(restored, bitmap)
+
+    def test_year_of_history_is_compact(self):
+        bitmap = CompletionBitmap.from_dates([self.day(n) for n in range(365)], start=self.start)
+        self.assertEqual(len(bitmap.to_bytes()), 46)
+        self.assertEqual(bitmap.longest_run(), 365)
+
+    def test_occurence_writes_keep_habit_bitmap_in_sync(self):
+        user = User.objects.create_user(username='bitmapuser', password='password')
+        habit = Habit.objects.create(user=user, name="Bitmap")
+        today = date.today()
+        occurrence = Occurence.objects.create(habit=habit, date=today)
+        Occurence.objects.create(habit=habit, date=today - timedelta(days=1))
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.get_history().run_length_ending(today), 2)
+
+        occurrence.delete()
+        habit.refresh_from_db()
+        self.assertNotIn(today, habit.get_history())
+        self.assertIn(today - timedelta(days=1), habit.get_history())
+
+    def test_occurence_writes_through_a_stale_habit_keep_other_days(self):
+        user = User.objects.create_user(username='staleuser', password='password')
+        habit = Habit.objects.create(user=user, name="Stale")
+        stale = Habit.objects.get(pk=habit.pk)
+        today = date.today()
+        Occurence.objects.create(habit=habit, date=today - timedelta(days=1))
+
+        # `stale` was loaded before yesterday was added; its writes must not drop it
+        occurrence = Occurence.objects.create(habit=stale, date=today)
+        self.assertEqual(stale.get_history().run_length_ending(today), 2)
+        occurrence.delete()
+        habit.refresh_from_db()
+        self.assertEqual(list(habit.get_history()), [today - timedelta(days=1)])
+
+
+class AchievementEvaluatorTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.addCleanup(invalidate_catalog)
+        self.user = User.objects.create_user(username='achuser', password='password')
+        self.client = Client()
+        self.client.login(username='achuser', password='password')
+        self.url = reverse('lifetrack:toggle_habit')
+
+    def make_catalog(self, size):
+        Achievement.objects.bulk_create(
+            Achievement(name=f"{kind} {n}", description="", condition_type=kind, threshold=n + 2, xp_reward=5)
+            for kind in ('STREAK', 'TOTAL_COMPLETIONS', 'LEVEL', 'HABIT_COUNT')
+            for n in range(size)
+        )
+        Achievement.objects.create(name="First Step", description="", condition_type='STREAK', threshold=1, xp_reward=50)
+
+    def toggle_new_habit(self, name):
+        habit = Habit.objects.create(user=self.user, name=name)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, {'habit_id': habit.id})
+        return response.json(), len(ctx.captured_queries)
+
+    def test_awards_crossed_thresholds_once(self):
+        self.make_catalog(3)
+        data, _ = self.toggle_new_habit("One")
+        # streak 1 and habit count 1 only cross "First Step"
+        self.assertEqual(data['unlocked_achievements'], ["First Step"])
+        self.assertEqual(UserProfile.objects.get(user=self.user).xp, data['xp_gained'] + 50)
+
+        data, _ = self.toggle_new_habit("Two")
+        # 2 completions and 2 habits cross the threshold-2 entries; "First Step" is already earned
+        self.assertEqual(data['unlocked_achievements'], ["TOTAL_COMPLETIONS 0", "HABIT_COUNT 0"])
+        self.assertEqual(UserAchievement.objects.filter(user=self.user).count(), 3)
+
+    def test_query_count_is_independent_of_catalog_size(self):
+        self.make_catalog(2)
+        self.toggle_new_habit("Warm up")  # populates the catalog cache
+        _, small_queries = self.toggle_new_habit("Small")
+
+        Achievement.objects.all().delete()
+        self.make_catalog(200)
+        self.toggle_new_habit("Warm up again")
+        _, large_queries = self.toggle_new_habit("Large")
+
+        self.assertEqual(small_queries, large_queries)
+
+    def test_catalog_invalidated_on_achievement_changes(self):
+        self.assertEqual(get_catalog(), {})
+        ach = Achievement.objects.create(name="Streaker", description="", condition_type='STREAK', threshold=3)
+        self.assertEqual(get_catalog()['STREAK'][0], [3])
+        ach.delete()
+        self.assertEqual(get_catalog(), {})
+
+
+class ConcurrentToggleTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='raceuser', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Contended")
+        self.url = reverse('lifetrack:toggle_habit')
+
+    def test_parallel_toggles_keep_totals_consistent(self):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def worker():
+            client = Client()
+            client.force_login(self.user)
+            barrier.wait()
+            try:
+                statuses.append(client.post(self.url, {'habit_id': self.habit.id}).status_code)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(statuses, [200] * self.THREADS)
+        # An even number of toggles ends uncompleted with everything revoked
+        occurrences = Occurence.objects.filter(habit=self.habit)
+        self.assertEqual(occurrences.count(), self.THREADS % 2)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.xp, sum(o.xp_gained for o in occurrences))
+        self.assertEqual(profile.total_habits_completed, occurrences.count())
+
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, occurrences.count())
+        self.assertEqual(len(self.habit.get_history()), occurrences.count())
+
+
+class BatchToggleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='batchuser', password='password')
+        self.client = Client()
+        self.client.login(username='batchuser', password='password')
+        self.url = reverse('lifetrack:toggle_habits_batch')
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def make_habits(self, count):
+        return [Habit.objects.create(user=self.user, name=f"Habit {n}") for n in range(count)]
+
+    def test_completes_many_habits_in_one_request(self):
+        habits = self.make_habits(12)
+        response = self.post({'habit_ids': [h.id for h in habits]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(all(r['completed'] and r['streak'] == 1 for r in data['results']))
+        self.assertEqual(Occurence.objects.filter(habit__user=self.user).count(), 12)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.xp, data['xp_gained'])
+        self.assertEqual(profile.total_habits_completed, 12)
+
+    def test_query_count_is_independent_of_batch_size(self):
+        small = self.make_habits(2)
+        large = self.make_habits(12)
+        with CaptureQueriesContext(connection) as small_ctx:
+            self.post({'habit_ids': [h.id for h in small]})
+        with CaptureQueriesContext(connection) as large_ctx:
+            self.post({'habit_ids': [h.id for h in large]})
+        self.assertEqual(len(small_ctx.captured_queries), len(large_ctx.captured_queries))
+
+    def test_backfilling_past_dates_extends_streak(self):
+        habit, = self.make_habits(1)
+        today = date.today()
+        items = [
+            {'habit_id': habit.id, 'date': (today - timedelta(days=n)).isoformat(), 'completed': True}
+            for n in range(3)
+        ]
+        data = self.post({'items': items}).json()
+        self.assertEqual(data['results'][-1]['streak'], 3)
+
+        # Explicit completed=true is idempotent
+        data = self.post({'items': items[:1]}).json()
+        self.assertFalse(data['results'][0]['changed'])
+        self.assertEqual(Occurence.objects.filter(habit=habit).count(), 3)
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.current_streak, 3)
+        self.assertEqual(habit.last_completed_date, today)
+
+    def test_repeated_items_for_one_day_apply_in_order(self):
+        habit, = self.make_habits(1)
+        today = date.today().isoformat()
+        self.post({'habit_ids': [habit.id]})
+        occurrence = Occurence.objects.get(habit=habit)
+        xp = UserProfile.objects.get(user=self.user).xp
+
+        # Off then on (explicitly, or as two plain toggles) leaves the completion as it was
+        for items in (
+            [{'habit_id': habit.id, 'date': today, 'completed': False},
+             {'habit_id': habit.id, 'date': today, 'completed': True}],
+            [{'habit_id': habit.id, 'date': today}, {'habit_id': habit.id, 'date': today}],
+        ):
+            response = self.post({'items': items})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['xp_gained'], 0)
+            self.assertEqual(list(Occurence.objects.filter(habit=habit)), [occurrence])
+        self.assertEqual(UserProfile.objects.get(user=self.user).xp, xp)
+
+        # On then off on an open day writes nothing
+        other, = self.make_habits(1)
+        self.post({'items': [{'habit_id': other.id, 'date': today}, {'habit_id': other.id, 'date': today}]})
+        self.assertFalse(Occurence.objects.filter(habit=other).exists())
+
+    def test_rejects_other_users_habits(self):
+        other = User.objects.create_user(username='otherbatch', password='password')
+        habit = Habit.objects.create(user=other, name="Not yours")
+        mine, = self.make_habits(1)
+        response = self.post({'habit_ids': [mine.id, habit.id]})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Occurence.objects.exists())
+
+    def test_rejects_malformed_payloads(self):
+        habit, = self.make_habits(1)
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        for payload in ({}, {'items': [{'date': tomorrow}]}, {'items': [{'habit_id': habit.id, 'date': tomorrow}]}):
+            self.assertEqual(self.post(payload).status_code, 400)
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='application/json').status_code, 400)
+
+
+class ImportHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Imported", difficulty='EASY')
+        self.today = date.today()
+
+    def write_file(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_history', path, *args, '--batch-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_csv_import_recomputes_streaks_and_xp(self):
+        days = [self.today - timedelta(days=n) for n in range(1, 6)]
+        rows = "\n".join(f"{self.habit.id},{d.isoformat()},note {n}," for n, d in enumerate(days))
+        path = self.write_file('.csv', "habit_id,date,notes,mood\n" + rows + "\n999999,2020-01-01,,\n")
+
+        output = self.run_import(path)
+        self.assertIn("inserted 5, skipped 1", output)
+
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, 5)
+        self.assertEqual(self.habit.longest_streak, 5)
+        self.assertEqual(len(self.habit.get_history()), 5)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_habits_completed, 5)
+        # EASY: 10 XP per day, with the 1.1x streak bonus on the fifth day
+        self.assertEqual(profile.xp, 4 * 10 + 11)
+        self.assertEqual(Occurence.objects.get(habit=self.habit, date=days[0]).notes, "note 0")
+
+    def test_undoing_an_imported_day_takes_its_xp_back(self):
+        self.client.force_login(self.user)
+        days = [self.today - timedelta(days=n) for n in range(1, 6)]
+        path = self.write_file('.csv', "habit_id,date\n" + "".join(f"{self.habit.id},{d.isoformat()}\n" for d in days))
+        self.run_import(path)
+        self.assertEqual(
+            dict(Occurence.objects.filter(habit=self.habit).values_list('date', 'xp_gained')),
+            {days[0]: 11, **{d: 10 for d in days[1:]}},
+        )
+        self.assertEqual(ledger.xp_total(self.user), UserProfile.objects.get(user=self.user).xp)
+
+        # Undo and redo the last day: no XP is left over either way
+        url = reverse('lifetrack:toggle_habits_batch')
+        for completed, xp in ((False, 4 * 10), (True, 4 * 10 + 11)):
+            item = {'habit_id': self.habit.id, 'date': days[0].isoformat(), 'completed': completed}
+            self.client.post(url, json.dumps({'items': [item]}), content_type='application/json')
+            self.assertEqual(UserProfile.objects.get(user=self.user).xp, xp)
+        self.assertEqual(ledger.xp_total(self.user), 4 * 10 + 11)
+
+    def test_day_toggled_during_the_import_is_credited_once(self):
+        from .management.commands.import_history import Command
+
+        self.client.force_login(self.user)
+        days = [self.today - timedelta(days=n) for n in range(3, -1, -1)]
+        path = self.write_file('.csv', "habit_id,date\n" + "".join(f"{self.habit.id},{d.isoformat()}\n" for d in days))
+
+        # The user ticks today off after the first batch, before the import inserts it
+        insert_batch = Command.insert_batch
+        batches = []
+
+        def toggle_between_batches(command, rows):
+            if batches:
+                item = {'habit_id': self.habit.id, 'completed': True}
+                url = reverse('lifetrack:toggle_habits_batch')
+                self.client.post(url, json.dumps({'items': [item]}), content_type='application/json')
+            batches.append(rows)
+            insert_batch(command, rows)
+
+        with patch.object(Command, 'insert_batch', toggle_between_batches):
+            output = self.run_import(path)
+        self.assertIn("inserted 3", output)
+
+        self.habit.refresh_from_db()
+        self.assertEqual(len(self.habit.get_history()), 4)
+        self.assertEqual(self.habit.current_streak, 4)
+        self.assertEqual(self.habit.last_completed_date, self.today)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_habits_completed, 4)
+        row_xp = sum(Occurence.objects.filter(habit=self.habit).values_list('xp_gained', flat=True))
+        credited = XpLedgerEntry.objects.filter(
+            user=self.user, source__in=[XpLedgerEntry.COMPLETION, XpLedgerEntry.IMPORT],
+        ).values_list('amount', flat=True)
+        self.assertEqual(sum(credited), row_xp)
+        self.assertEqual(ledger.xp_total(self.user), profile.xp)
+        self.assertEqual(DailyActivity.objects.get(user=self.user, date=self.today).completions, 1)
+
+    def test_jsonl_import_is_idempotent(self):
+        lines = [json.dumps({'habit_id': self.habit.id, 'date': (self.today - timedelta(days=n)).isoformat()})
+                 for n in range(3)]
+        path = self.write_file('.jsonl', "\n".join(lines + ["not json"]))
+
+        self.run_import(path)
+        xp = UserProfile.objects.get(user=self.user).xp
+        output = self.run_import(path)
+
+        self.assertIn("inserted 0", output)
+        self.assertEqual(UserProfile.objects.get(user=self.user).xp, xp)
+        self.assertEqual(Occurence.objects.filter(habit=self.habit).count(), 3)
+
+    def test_user_filter_skips_other_users_habits(self):
+        other = User.objects.create_user(username='notimporter', password='password')
+        other_habit = Habit.objects.create(user=other, name="Other")
+        path = self.write_file('.csv', f"habit_id,date\n{other_habit.id},{self.today.isoformat()}\n")
+        output = self.run_import(path, '--user', 'importer')
+        self.assertIn("inserted 0, skipped 1", output)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='password')
+        self.client = Client()
+        self.client.login(username='exporter', password='password')
+        self.url = reverse('lifetrack:export_history')
+
+    def make_history(self, habits, days):
+        start = date.today() - timedelta(days=days)
+        habit_objs = Habit.objects.bulk_create(
+            Habit(user=self.user, name=f"Habit {n}") for n in range(habits)
+        )
+        Occurence.objects.bulk_create(
+            (Occurence(habit=h, date=start + timedelta(days=d), notes="x" * 40) for h in habit_objs for d in range(days)),
+            batch_size=2000,
+        )
+
+    def test_ndjson_export_contains_every_record(self):
+        self.make_history(2, 3)
+        ach = Achievement.objects.create(name="Starter", description="", condition_type='STREAK')
+        UserAchievement.objects.create(user=self.user, achievement=ach)
+        other = User.objects.create_user(username='otherexporter', password='password')
+        Habit.objects.create(user=other, name="Private")
+
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        types = [r['type'] for r in records]
+        self.assertEqual(types, ['habit'] * 2 + ['occurrence'] * 6 + ['achievement'])
+        self.assertEqual(records[-1]['achievement__name'], "Starter")
+        self.assertNotIn("Private", [r.get('name') for r in records])
+
+    def test_csv_export_has_header_and_rows(self):
+        self.make_history(1, 2)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('type,id,name'))
+        self.assertEqual(len(lines), 1 + 1 + 2)
+
+    def test_unknown_format_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, 400)
+
+    def test_memory_ceiling_for_large_user(self):
+        # 30 habits x 1000 days = 30,000 occurrences
+        self.make_history(30, 1000)
+        response = self.client.get(self.url, {'format': 'ndjson'})
+
+        tracemalloc.start()
+        try:
+            total_bytes = 0
+            lines = 0
+            for chunk in response.streaming_content:
+                total_bytes += len(chunk)
+                lines += 1
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(lines, 30 + 30000)
+        # The export itself is several MB; streaming keeps the peak far below it
+        self.assertGreater(total_bytes, 4 * 1024 * 1024)
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.frozen_user = User.objects.create_user(username='hasfreeze', password='password')
+        self.broken_user = User.objects.create_user(username='nofreeze', password='password')
+        UserProfile.objects.filter(user=self.frozen_user).update(freeze_tokens=2)
+
+    def habit_with_streak(self, user, last_day_offset, length=3):
+        habit = Habit.objects.create(user=user, name="Rolling", created_at=self.today - timedelta(days=30))
+        for n in range(last_day_offset, last_day_offset + length):
+            Occurence.objects.create(habit=habit, date=self.today - timedelta(days=n))
+        Habit.objects.filter(pk=habit.pk).update(current_streak=length)
+        return habit
+
+    def test_breaks_missed_streaks_and_spends_one_token_per_habit(self):
+        frozen_a = self.habit_with_streak(self.frozen_user, 2)
+        frozen_b = self.habit_with_streak(self.frozen_user, 2)
+        broken = self.habit_with_streak(self.broken_user, 2)
+        kept = self.habit_with_streak(self.broken_user, 1)
+
+        run = rollover(self.today)
+        self.assertEqual((run.streaks_frozen, run.tokens_consumed, run.streaks_broken), (2, 2, 1))
+
+        streaks = dict(Habit.objects.values_list('id', 'current_streak'))
+        self.assertEqual(streaks[frozen_a.id], 3)
+        self.assertEqual(streaks[frozen_b.id], 3)
+        self.assertEqual(streaks[broken.id], 0)
+        self.assertEqual(streaks[kept.id], 3)
+        self.assertEqual(UserProfile.objects.get(user=self.frozen_user).freeze_tokens, 0)
+        self.assertEqual(StreakFreeze.objects.filter(date=self.today - timedelta(days=1)).count(), 2)
+
+    def test_freezes_no_more_habits_than_tokens(self):
+        UserProfile.objects.filter(user=self.frozen_user).update(freeze_tokens=1)
+        short = self.habit_with_streak(self.frozen_user, 2, length=2)
+        longest = self.habit_with_streak(self.frozen_user, 2, length=5)
+        other = self.habit_with_streak(self.frozen_user, 2, length=3)
+
+        run = rollover(self.today)
+        self.assertEqual((run.streaks_frozen, run.tokens_consumed, run.streaks_broken), (1, 1, 2))
+
+        # The token goes to the longest streak
+        self.assertEqual(list(StreakFreeze.objects.values_list('habit_id', flat=True)), [longest.id])
+        streaks = dict(Habit.objects.values_list('id', 'current_streak'))
+        self.assertEqual((streaks[short.id], streaks[longest.id], streaks[other.id]), (0, 5, 0))
+        self.assertEqual(UserProfile.objects.get(user=self.frozen_user).freeze_tokens, 0)
+
+    def test_rerun_is_a_no_op(self):
+        habit = self.habit_with_streak(self.frozen_user, 2)
+        rollover(self.today)
+        self.assertIsNone(rollover(self.today))
+        self.assertEqual(RolloverRun.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.frozen_user).freeze_tokens, 1)
+        self.assertEqual(StreakFreeze.objects.filter(habit=habit).count(), 1)
+
+    def test_frozen_day_bridges_streak_on_next_toggle(self):
+        habit = self.habit_with_streak(self.frozen_user, 2)
+        rollover(self.today)
+
+        client = Client()
+        client.force_login(self.frozen_user)
+        response = client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habit.id})
+        self.assertEqual(response.json()['streak'], 4)
+
+    def test_statement_count_is_independent_of_habit_count(self):
+        def count_for(habits, day):
+            for _ in range(habits):
+                self.habit_with_streak(self.frozen_user, 2)
+                self.habit_with_streak(self.broken_user, 2)
+            with CaptureQueriesContext(connection) as ctx:
+                rollover(day)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_for(2, self.today), count_for(20, self.today + timedelta(days=1)))
+
+
+class SchemaCheckTests(TestCase):
+    def test_lists_the_same_migrations_as_the_loader(self):
+        from django.db.migrations.loader import MigrationLoader
+
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        names = migrations_on_disk()
+        self.assertIn('lifetrack.0001_initial', names)
+        self.assertEqual(names, sorted(f'{app}.{name}' for app, name in loader.disk_migrations))
+        self.assertEqual(missing_migrations(), [])
+
+    def test_reports_unapplied_migrations(self):
+        expected = ['lifetrack.0001_initial', 'lifetrack.9999_not_applied']
+        self.assertEqual(missing_migrations(expected), ['lifetrack.9999_not_applied'])
+
+    def test_check_reports_missing_migrations_without_migrating(self):
+        from lt import startup
+
+        with patch('lifetrack.schema.migrations_on_disk', return_value=['lifetrack.9999_not_applied']), \
+                patch.object(startup, 'run_migrations') as run_migrations:
+            with self.assertRaisesMessage(startup.SchemaError, 'lifetrack.9999_not_applied'):
+                startup.check_schema()
+        run_migrations.assert_not_called()
+
+    def test_requests_get_503_until_the_schema_is_ready(self):
+        import index
+
+        app = index.StartupMiddleware(index.django_app)
+        statuses = []
+        with patch.object(index, 'ensure_schema', side_effect=RuntimeError("migrate failed")), \
+                patch('sys.stderr', new=StringIO()):
+            body = app({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}, lambda status, headers: statuses.append(status))
+        self.assertEqual(statuses, ['503 Service Unavailable'])
+        self.assertIn(b'not up to date', b''.join(body))
+
+
+class LevelingTests(TestCase):
+    def walk_levels(self, xp, level=1):
+        # The original level-by-level loop, as a reference
+        while xp >= int(100 * ((level + 1) ** 1.5)):
+            level += 1
+        return level
+
+    def test_matches_reference_loop(self):
+        for xp in list(range(0, 3000, 7)) + [THRESHOLDS[-1] - 1, THRESHOLDS[-1], 10 ** 8 + 3]:
+            self.assertEqual(level_for_xp(xp), self.walk_levels(xp), xp)
+
+    def test_thresholds(self):
+        self.assertEqual(xp_threshold(1), 0)
+        self.assertEqual(xp_threshold(2), 282)
+        self.assertEqual(level_for_xp(281), 1)
+        self.assertEqual(level_for_xp(282), 2)
+
+    def test_progress(self):
+        progress = level_progress(282 + 100)
+        self.assertEqual(progress.level, 2)
+        self.assertEqual(progress.xp_into_level, 100)
+        self.assertEqual(progress.xp_for_level, xp_threshold(3) - 282)
+        self.assertEqual(progress.percent, int(100 * 100 / progress.xp_for_level))
+
+    def test_check_level_up_never_levels_down(self):
+        user = User.objects.create_user(username='leveler', password='password')
+        profile = user.profile
+        profile.xp, profile.level = 600, 2
+        self.assertEqual(check_level_up(profile), (True, 3))
+        profile.xp = 0
+        self.assertEqual(check_level_up(profile), (False, 3))
+
+    def test_recompute_levels_command(self):
+        users = [User.objects.create_user(username=f'recompute{n}', password='password') for n in range(3)]
+        UserProfile.objects.filter(user=users[0]).update(xp=5000, level=1)
+        UserProfile.objects.filter(user=users[1]).update(xp=0, level=7)
+
+        out = StringIO()
+        call_command('recompute_levels', stdout=out)
+        self.assertIn("Updated 2 of 3 profiles", out.getvalue())
+        levels = dict(UserProfile.objects.filter(user__in=users).values_list('user_id', 'level'))
+        self.assertEqual(levels, {users[0].id: level_for_xp(5000), users[1].id: 1, users[2].id: 1})
+
+    def test_dashboard_shows_progress(self):
+        cache.clear()
+        user = User.objects.create_user(username='progressuser', password='password')
+        client = Client()
+        client.force_login(user)
+        UserProfile.objects.filter(user=user).update(xp=282 + 100, level=2)
+        response = client.get(reverse('lifetrack:dashboard'))
+        self.assertEqual(response.context['progress'].xp_into_level, 100)
+        self.assertContains(response, f"width: {response.context['progress'].percent}%")
+
+
+class ActivityRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='heatmapuser', password='password')
+        self.client = Client()
+        self.client.login(username='heatmapuser', password='password')
+        self.today = date.today()
+
+    def rollup(self):
+        return dict(DailyActivity.objects.filter(user=self.user, completions__gt=0).values_list('date', 'completions'))
+
+    def test_toggles_maintain_rollup(self):
+        habits = [Habit.objects.create(user=self.user, name=f"Habit {n}") for n in range(3)]
+        yesterday = self.today - timedelta(days=1)
+        self.client.post(reverse('lifetrack:toggle_habits_batch'), json.dumps({'items': [
+            {'habit_id': habits[0].id}, {'habit_id': habits[1].id},
+            {'habit_id': habits[2].id, 'date': yesterday.isoformat()},
+        ]}), content_type='application/json')
+        self.assertEqual(self.rollup(), {self.today: 2, yesterday: 1})
+
+        self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habits[0].id})
+        self.assertEqual(self.rollup(), {self.today: 1, yesterday: 1})
+
+        self.client.get(reverse('lifetrack:delete_habit', args=[habits[2].id]))
+        self.assertEqual(self.rollup(), {self.today: 1})
+
+    def test_heatmap_endpoint_is_one_range_scan(self):
+        DailyActivity.objects.create(user=self.user, date=self.today, completions=4)
+        DailyActivity.objects.create(user=self.user, date=self.today - timedelta(days=400), completions=9)
+
+        with self.assertNumQueries(1):
+            start, end, days = heatmap(self.user, self.today)
+        self.assertEqual(days, {self.today: 4})
+        self.assertEqual((end - start).days, 364)
+
+        data = self.client.get(reverse('lifetrack:activity_heatmap')).json()
+        self.assertEqual(data['days'], {self.today.isoformat(): 4})
+
+    def test_migration_backfills_existing_history(self):
+        from importlib import import_module
+        from types import SimpleNamespace
+        from django.apps import apps
+
+        migration = import_module('lifetrack.migrations.0004_daily_activity')
+        habits = [Habit.objects.create(user=self.user, name=f"Habit {n}") for n in range(2)]
+        Occurence.objects.bulk_create(
+            Occurence(habit=h, date=self.today - timedelta(days=d)) for h in habits for d in range(2)
+        )
+        migration.backfill_activity(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.rollup(), {self.today: 2, self.today - timedelta(days=1): 2})
+
+        # Deleting a habit only lowers days that have a row; it never adds empty ones
+        old = Habit.objects.create(user=self.user, name="Old")
+        old.save_history(CompletionBitmap.from_dates([self.today - timedelta(days=30)]))
+        self.client.get(reverse('lifetrack:delete_habit', args=[old.id]))
+        self.assertFalse(DailyActivity.objects.filter(user=self.user, completions=0).exists())
+
+    def test_rebuild_matches_occurrences(self):
+        habits = [Habit.objects.create(user=self.user, name=f"Habit {n}") for n in range(2)]
+        Occurence.objects.bulk_create(
+            Occurence(habit=h, date=self.today - timedelta(days=d)) for h in habits for d in range(3)
+        )
+        Occurence.objects.create(habit=habits[0], date=self.today - timedelta(days=5))
+        DailyActivity.objects.create(user=self.user, date=self.today - timedelta(days=50), completions=7)
+
+        out = StringIO()
+        call_command('rebuild_activity', stdout=out)
+        self.assertIn("Wrote 4 daily activity rows", out.getvalue())
+        expected = {self.today - timedelta(days=d): 2 for d in range(3)}
+        expected[self.today - timedelta(days=5)] = 1
+        self.assertEqual(self.rollup(), expected)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'player{n}', password='password') for n in range(12)]
+        # player0 has the least XP; player5 and player6 tie
+        for n, user in enumerate(self.users):
+            UserProfile.objects.filter(user=user).update(xp=100 * n if n != 6 else 500, level=n + 1)
+        leaderboard.refresh_leaderboard()
+
+    def test_refresh_ranks_by_xp_then_user(self):
+        ranked = list(LeaderboardEntry.objects.order_by('rank').values_list('rank', 'username', 'xp'))
+        self.assertEqual(len(ranked), 12)
+        self.assertEqual(ranked[0], (1, 'player11', 1100))
+        self.assertEqual(ranked[-1], (12, 'player0', 0))
+        # Ties keep distinct positions, lower user id first
+        self.assertEqual([r[1] for r in ranked if r[2] == 500], ['player5', 'player6'])
+        self.assertEqual(leaderboard.ranked_count(), 12)
+
+    def test_refresh_replaces_previous_ranks(self):
+        UserProfile.objects.filter(user=self.users[0]).update(xp=5000)
+        self.users[11].delete()
+        self.assertEqual(leaderboard.refresh_leaderboard(), 11)
+        self.assertEqual(leaderboard.entry_for(self.users[0]).rank, 1)
+        self.assertEqual(leaderboard.ranked_count(), 11)
+
+    def test_keyset_pages_cover_everything_once(self):
+        seen = []
+        after = 0
+        while after is not None:
+            with self.assertNumQueries(1):
+                page = leaderboard.top(limit=5, after=after)
+            seen.extend(e.rank for e in page.entries)
+            after = page.next_after
+        self.assertEqual(seen, list(range(1, 13)))
+
+    def test_own_rank_and_neighbours_use_index_lookups(self):
+        with self.assertNumQueries(2):
+            me = leaderboard.entry_for(self.users[3])
+            around = leaderboard.neighbours(me)
+        self.assertEqual(me.rank, 9)
+        self.assertEqual([e.rank for e in around], [7, 8, 9, 10, 11])
+
+        # Rank lookups hit the unique indexes rather than scanning the table
+        sql, params = LeaderboardEntry.objects.filter(rank__gt=10).order_by('rank')[:5].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING INDEX', plan)
+
+    def test_page_and_json(self):
+        client = Client()
+        client.login(username='player3', password='password')
+        response = client.get(reverse('lifetrack:leaderboard'))
+        self.assertContains(response, '#9')
+        self.assertContains(response, 'player11')
+
+        data = client.get(reverse('lifetrack:leaderboard'), {'format': 'json', 'after': 10}).json()
+        self.assertEqual([e['rank'] for e in data['entries']], [11, 12])
+        self.assertIsNone(data['next_after'])
+        self.assertEqual(data['me']['rank'], 9)
+
+        self.assertEqual(client.get(reverse('lifetrack:leaderboard'), {'after': 'x'}).status_code, 400)
+
+    def test_new_user_is_unranked_until_refresh(self):
+        User.objects.create_user(username='newcomer', password='password')
+        client = Client()
+        client.login(username='newcomer', password='password')
+        response = client.get(reverse('lifetrack:leaderboard'))
+        self.assertContains(response, "after the next leaderboard refresh")
+
+        out = StringIO()
+        call_command('refresh_leaderboard', stdout=out)
+        self.assertIn("Ranked 13 profiles", out.getvalue())
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the hot paths issue and fail on a full table scan, so
+    a dropped index or a reshaped query shows up here rather than in
+    production once Occurence holds tens of millions of rows.
+    """
+    # Small, fixed-size tables that are fine to read whole
+    SCAN_ALLOWED = {'lifetrack_achievement'}
+    EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='planuser', password='password')
+        self.client = Client()
+        self.client.login(username='planuser', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Planned")
+        Achievement.objects.create(name="First", description="", condition_type='STREAK', threshold=1, xp_reward=5)
+        invalidate_catalog()
+        self.addCleanup(invalidate_catalog)
+
+    def full_scans(self, sql):
+        """Tables a statement reads in full, according to the database's planner."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                details = [row[-1] for row in cursor.fetchall()]
+                aliases = dict(
+                    (alias, table) for table, alias in
+                    re.findall(r'"(\w+)" (U\d+|T\d+)', sql)
+                )
+                scans = []
+                for detail in details:
+                    if not detail.startswith('SCAN '):
+                        continue
+                    name = aliases.get(detail.split()[1], detail.split()[1])
+                    # Walking an index in order is fine when the query stops early
+                    if ' INDEX ' in detail and ' LIMIT ' in sql:
+                        continue
+                    scans.append(name)
+                return scans
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                nodes = [cursor.fetchone()[0][0]['Plan']]
+                scans = []
+                while nodes:
+                    node = nodes.pop()
+                    if node['Node Type'] == 'Seq Scan':
+                        scans.append(node['Relation Name'])
+                    nodes.extend(node.get('Plans', []))
+                return scans
+        self.skipTest(f'No plan inspection for {connection.vendor}')
+
+    def assertNoFullScans(self, run):
+        with CaptureQueriesContext(connection) as ctx:
+            run()
+        statements = [q['sql'] for q in ctx.captured_queries if q['sql'].split()[0] in self.EXPLAINED]
+        self.assertTrue(statements)
+        for sql in statements:
+            scans = [t for t in self.full_scans(sql) if t not in self.SCAN_ALLOWED]
+            self.assertEqual(scans, [], f'Full scan in: {sql}')
+
+    def test_detects_full_scans(self):
+        sql, params = Habit.objects.filter(name='Planned').query.sql_with_params()
+        with connection.cursor() as cursor:
+            sql = connection.ops.last_executed_query(cursor, sql, params)
+        self.assertEqual(self.full_scans(sql), ['lifetrack_habit'])
+
+    def test_dashboard(self):
+        self.assertNoFullScans(lambda: self.client.get(reverse('lifetrack:dashboard')))
+
+    def test_toggles(self):
+        self.assertNoFullScans(lambda: self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': self.habit.id}))
+        self.assertNoFullScans(lambda: self.client.post(
+            reverse('lifetrack:toggle_habits_batch'), json.dumps({'habit_ids': [self.habit.id]}),
+            content_type='application/json',
+        ))
+
+    def test_achievements(self):
+        self.assertNoFullScans(lambda: self.client.get(reverse('lifetrack:achievements')))
+        self.assertNoFullScans(lambda: check_achievements(self.user, self.habit, 1))
+
+    def test_history_reads(self):
+        Occurence.objects.create(habit=self.habit, date=date.today())
+        self.assertNoFullScans(lambda: b''.join(self.client.get(reverse('lifetrack:export_history')).streaming_content))
+        self.assertNoFullScans(lambda: self.client.get(reverse('lifetrack:activity_heatmap')))
+        self.assertNoFullScans(lambda: self.habit.rebuild_history())
+
+    def test_leaderboard(self):
+        leaderboard.refresh_leaderboard()
+        self.assertNoFullScans(lambda: self.client.get(reverse('lifetrack:leaderboard')))
+
+    def test_delete_habit(self):
+        self.assertNoFullScans(lambda: self.client.get(reverse('lifetrack:delete_habit', args=[self.habit.id])))
+
+    def test_compaction(self):
+        Occurence.objects.create(habit=self.habit, date=live_horizon() - timedelta(days=3))
+        self.assertNoFullScans(lambda: compact())
+
+    def test_rollover_candidates(self):
+        Habit.objects.filter(pk=self.habit.pk).update(current_streak=3)
+        sunday = date(2026, 10, 18)
+        for day in (sunday - timedelta(days=1), sunday):
+            self.assertNoFullScans(lambda: list(missed_habits(day)))
+
+    def test_reminder_dispatch(self):
+        Habit.objects.filter(pk=self.habit.pk).update(reminder_time=time(9, 0))
+        dispatcher = reminders.ReminderDispatcher(outbox=reminders.DatabaseOutbox())
+        self.assertNoFullScans(lambda: dispatcher.tick(timezone.make_aware(datetime(2026, 10, 18, 9, 0))))
+        # The re-check, which the database outbox only runs inside its INSERT ... SELECT
+        self.assertNoFullScans(lambda: [
+            list(habits) for habits in reminders.due_habits(date(2026, 10, 18), 9 * 60, [self.habit.id])
+        ])
+
+
+class RequestMetricsTests(TransactionTestCase):
+    # Transactional: the ASGI toggle runs on a pool thread with its own connection
+    def setUp(self):
+        cache.clear()
+        metrics.reset_metrics()
+        self.addCleanup(metrics.reset_metrics)
+        self.user = User.objects.create_user(username='metricsuser', password='password')
+        Habit.objects.create(user=self.user, name="Measured")
+
+    def client_for(self, user):
+        # The middleware chain is built per client, so create it under the settings under test
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_sampling_off_adds_nothing(self):
+        response = self.client_for(self.user).get(reverse('lifetrack:dashboard'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.REQUEST_SECONDS.snapshot(), {})
+
+    @override_settings(LIFETRACK_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request_reports_timings(self):
+        client = self.client_for(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('lifetrack:dashboard'))
+
+        timing = response['Server-Timing']
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+        self.assertRegex(timing, r'tpl;dur=\d+\.\d, total;dur=\d+\.\d')
+
+        counts, total = metrics.QUERIES.snapshot()['lifetrack:dashboard']
+        self.assertEqual(sum(counts), 1)
+        self.assertEqual(total, len(ctx.captured_queries))
+        self.assertGreater(metrics.TEMPLATE_SECONDS.snapshot()['lifetrack:dashboard'][1], 0)
+
+    @override_settings(LIFETRACK_METRICS_SAMPLE_RATE=1.0)
+    def test_asgi_toggle_counts_the_pool_threads_queries(self):
+        first, second = Habit.objects.filter(user=self.user).first(), Habit.objects.create(user=self.user, name="Also")
+        url = reverse('lifetrack:toggle_habit')
+        get_catalog()
+        wsgi = self.client_for(self.user).post(url, {'habit_id': first.id})
+        client = AsyncClient()
+        client.force_login(self.user)
+        asgi = async_to_sync(client.post)(url, {'habit_id': second.id})
+
+        # The same toggle, counted on the request's thread and on a pool thread
+        counted = [re.search(r'desc="(\d+) queries"', r['Server-Timing']).group(1) for r in (wsgi, asgi)]
+        self.assertEqual(counted[0], counted[1])
+        self.assertGreater(int(counted[1]), 5)
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe('v', value)
+        self.assertEqual(histogram.render()[2:], [
+            'test_seconds_bucket{view="v",le="0.1"} 1',
+            'test_seconds_bucket{view="v",le="1.0"} 3',
+            'test_seconds_bucket{view="v",le="+Inf"} 4',
+            'test_seconds_sum{view="v"} 4.050000',
+            'test_seconds_count{view="v"} 4',
+        ])
+
+    @override_settings(LIFETRACK_METRICS_SAMPLE_RATE=1.0)
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client_for(self.user).get(reverse('lifetrack:dashboard'))
+        self.assertEqual(self.client_for(self.user).get(reverse('lifetrack:metrics')).status_code, 403)
+
+        staff = User.objects.create_user(username='staffuser', password='password', is_staff=True)
+        response = self.client_for(staff).get(reverse('lifetrack:metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('lifetrack_request_duration_seconds_count{view="lifetrack:dashboard"} 1', body)
+        self.assertIn('lifetrack_dashboard_cache_misses_total', body)
+
+
+class WeeklyStreakTests(TestCase):
+    # A Wednesday; weeks run Monday to Sunday
+    TODAY = date(2026, 10, 14)
+    THIS_MONDAY = date(2026, 10, 12)
+
+    def week(self, weeks_ago, *weekdays):
+        monday = self.THIS_MONDAY - timedelta(weeks=weeks_ago)
+        return [monday + timedelta(days=d) for d in weekdays]
+
+    def history(self, *weeks):
+        return CompletionBitmap.from_dates([day for week in weeks for day in week])
+
+    def test_weeks_meeting_the_target_count(self):
+        history = self.history(self.week(3, 0, 2, 4), self.week(2, 1, 2, 6), self.week(1, 0, 3, 5))
+        # This week isn't over, so last week's streak is still alive
+        self.assertEqual(streaks_from_history(history, self.TODAY, frequency='WEEKLY', target=3), (3, 3))
+        # One short week breaks it
+        history = self.history(self.week(3, 0, 2, 4), self.week(2, 1, 2), self.week(1, 0, 3, 5))
+        self.assertEqual(streaks_from_history(history, self.TODAY, frequency='WEEKLY', target=3), (1, 1))
+        # A missed week ends the current streak
+        history = self.history(self.week(3, 0, 2, 4), self.week(2, 1, 2, 6))
+        self.assertEqual(streaks_from_history(history, self.TODAY, frequency='WEEKLY', target=3), (0, 2))
+
+    def test_current_week_counts_once_met(self):
+        history = self.history(self.week(1, 4), self.week(0, 0))
+        self.assertEqual(streaks_from_history(history, self.TODAY, frequency='WEEKLY', target=1), (2, 2))
+        self.assertEqual(streak_ending(history, self.TODAY, frequency='WEEKLY', target=1), 2)
+        # Still short of a target of 2: completions build on last week's streak
+        self.assertEqual(streak_ending(history, self.TODAY, frequency='WEEKLY', target=2), 0)
+
+    def test_frozen_week_bridges_without_counting(self):
+        history = self.history(self.week(3, 1), self.week(1, 1))
+        frozen = {self.week(2, 6)[0]}
+        self.assertEqual(streaks_from_history(history, self.TODAY, frequency='WEEKLY', target=1), (1, 1))
+        self.assertEqual(
+            streaks_from_history(history, self.TODAY, frozen, frequency='WEEKLY', target=1), (2, 2)
+        )
+
+    def test_daily_rule_matches_day_streaks(self):
+        days = [self.TODAY - timedelta(days=n) for n in (1, 2, 3, 5)]
+        self.assertEqual(
+            streaks_from_history(CompletionBitmap.from_dates(days), self.TODAY), compute_streaks(days, self.TODAY)
+        )
+
+    def test_long_weekly_history_reads_like_daily(self):
+        user = User.objects.create_user(username='weekly', password='password')
+        start = self.TODAY - timedelta(days=3650)
+        days = [start + timedelta(days=n) for n in range(3651) if n % 2 == 0]
+        weekly = Habit.objects.create(user=user, name="Weekly", frequency='WEEKLY', times_per_period=3, created_at=start)
+        daily = Habit.objects.create(user=user, name="Daily", created_at=start)
+        for habit in (weekly, daily):
+            habit.save_history(CompletionBitmap.from_dates(days, start=start))
+
+        with self.assertNumQueries(1):
+            current, longest = get_habit_streaks(weekly, self.TODAY)
+        self.assertEqual((current, longest), (521, 521))
+        with self.assertNumQueries(1):
+            self.assertEqual(get_habit_streaks(daily, self.TODAY), (1, 1))
+
+    def test_toggle_weekly_habit(self):
+        user = User.objects.create_user(username='toggler', password='password')
+        habit = Habit.objects.create(
+            user=user, name="Gym", frequency='WEEKLY', times_per_period=2, difficulty='EASY',
+            created_at=self.TODAY - timedelta(weeks=3),
+        )
+        from .toggles import apply_toggles, ToggleItem
+        apply_toggles(user, [ToggleItem(habit.id, day) for day in self.week(1, 1, 3)], self.TODAY)
+        self.assertEqual(Habit.objects.get(pk=habit.pk).current_streak, 1)
+
+        result = apply_toggles(user, [ToggleItem(habit.id, self.TODAY - timedelta(days=1))], self.TODAY)
+        self.assertEqual(result['results'][0]['streak'], 1)
+        result = apply_toggles(user, [ToggleItem(habit.id)], self.TODAY)
+        self.assertEqual(result['results'][0]['streak'], 2)
+        self.assertEqual(Habit.objects.get(pk=habit.pk).longest_streak, 2)
+
+    def test_create_weekly_habit(self):
+        user = User.objects.create_user(username='creator', password='password')
+        client = Client()
+        client.force_login(user)
+        client.post(reverse('lifetrack:create_habit'), {'name': "Swim", 'frequency': 'WEEKLY', 'times_per_period': '9'})
+        habit = Habit.objects.get(user=user)
+        self.assertEqual((habit.frequency, habit.times_per_period, habit.period_target), ('WEEKLY', 7, 7))
+
+    def test_rollover_breaks_weekly_habits_on_monday(self):
+        user = User.objects.create_user(username='weekroll', password='password')
+        monday = self.THIS_MONDAY
+        created = monday - timedelta(weeks=4)
+
+        def weekly(name, target, *weekdays):
+            habit = Habit.objects.create(
+                user=user, name=name, frequency='WEEKLY', times_per_period=target, created_at=created,
+            )
+            for day in self.week(1, *weekdays):
+                Occurence.objects.create(habit=habit, date=day)
+            Habit.objects.filter(pk=habit.pk).update(current_streak=2)
+            return habit
+
+        met = weekly("Met", 2, 0, 4)
+        short = weekly("Short", 3, 0, 4)
+        # Mid-week days don't close weekly periods
+        self.assertEqual(list(missed_habits(monday - timedelta(days=3))), [])
+        run = rollover(monday)
+        self.assertEqual(run.streaks_broken, 1)
+        streaks = dict(Habit.objects.values_list('id', 'current_streak'))
+        self.assertEqual((streaks[met.id], streaks[short.id]), (2, 0))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.horizon = live_horizon(self.today)
+        self.user = User.objects.create_user(username='archivist', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Old Habit", created_at=self.horizon - timedelta(days=500))
+        # Every 3rd day for ~2 years, straddling the horizon
+        self.days = [self.horizon - timedelta(days=n) for n in range(-200, 500, 3)]
+        Occurence.objects.bulk_create(
+            Occurence(habit=self.habit, date=day, xp_gained=10, notes=f"note {day}", token_earned=n % 10 == 0)
+            for n, day in enumerate(self.days)
+        )
+        self.habit.rebuild_history()
+        rebuild_activity(self.user)
+        self.old_days = [day for day in self.days if day < self.horizon]
+
+    def test_compact_moves_cold_rows_and_summarizes(self):
+        history_before = self.habit.get_history()
+        self.assertEqual(compact(self.today), len(self.old_days))
+
+        self.assertFalse(Occurence.objects.filter(date__lt=self.horizon).exists())
+        self.assertEqual(Occurence.objects.count(), len(self.days) - len(self.old_days))
+        self.assertEqual(OccurenceArchive.objects.count(), len(self.old_days))
+        self.assertEqual(OccurenceArchive.objects.get(date=self.old_days[0]).notes, f"note {self.old_days[0]}")
+
+        summaries = HabitYearSummary.objects.filter(habit=self.habit)
+        self.assertEqual(sorted(s.year for s in summaries), sorted({day.year for day in self.old_days}))
+        self.assertEqual(sum(s.completions for s in summaries), len(self.old_days))
+        self.assertEqual(sorted(day for s in summaries for day in s.get_days()), sorted(self.old_days))
+        self.assertEqual(habit_totals(self.habit), (len(self.days), 10 * len(self.days)))
+
+        # Reads merge both tables
+        self.habit.rebuild_history()
+        self.assertEqual(Habit.objects.get(pk=self.habit.pk).get_history(), history_before)
+        rollup_before = dict(DailyActivity.objects.values_list('date', 'completions'))
+        rebuild_activity(self.user)
+        self.assertEqual(dict(DailyActivity.objects.values_list('date', 'completions')), rollup_before)
+
+    def test_export_includes_archived_rows(self):
+        compact(self.today)
+        client = Client()
+        client.force_login(self.user)
+        lines = b''.join(client.get(reverse('lifetrack:export_history'), {'format': 'ndjson'}).streaming_content)
+        occurrences = [r for r in map(json.loads, lines.splitlines()) if r['type'] == 'occurrence']
+        self.assertEqual(len(occurrences), len(self.days))
+        self.assertEqual(
+            sorted(r['id'] for r in occurrences),
+            sorted([*Occurence.objects.values_list('id', flat=True), *OccurenceArchive.objects.values_list('id', flat=True)]),
+        )
+
+    def test_rerun_and_reimported_days(self):
+        compact(self.today)
+        self.assertEqual(compact(self.today), 0)
+
+        # A re-imported archived day lands in the live table again; the next run drops it
+        Occurence.objects.bulk_create([Occurence(habit=self.habit, date=self.old_days[0], xp_gained=99)])
+        self.assertEqual(compact(self.today), 1)
+        self.assertEqual(OccurenceArchive.objects.get(date=self.old_days[0]).xp_gained, 10)
+        self.assertEqual(sum(s.completions for s in HabitYearSummary.objects.all()), len(self.old_days))
+
+    def test_archived_dates_are_read_only(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(reverse('lifetrack:toggle_habits_batch'), json.dumps({'items': [
+            {'habit_id': self.habit.id, 'date': (self.horizon - timedelta(days=1)).isoformat()},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_compact_command_and_cascade(self):
+        out = StringIO()
+        call_command('compact_history', stdout=out)
+        self.assertIn(f"Archived {len(self.old_days)} completions", out.getvalue())
+        self.habit.delete()
+        self.assertFalse(OccurenceArchive.objects.exists())
+        self.assertFalse(HabitYearSummary.objects.exists())
+
+
+@override_settings(SESSION_ENGINE=CACHED_DB_SESSIONS)
+class AuthOverheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='authuser', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Auth")
+        self.client = Client()
+        self.client.login(username='authuser', password='password')
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx.captured_queries if 'django_session' in q['sql'] or 'auth_user' in q['sql']]
+
+    def test_one_query_for_session_user_and_profile(self):
+        queries = self.auth_queries(reverse('lifetrack:activity_heatmap'))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('lifetrack_userprofile', queries[0])
+
+    @override_settings(LIFETRACK_AUTH_CACHE_TTL=60)
+    def test_cached_user_is_dropped_on_writes(self):
+        url = reverse('lifetrack:dashboard')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': self.habit.id})
+        response = self.client.get(url)
+        self.assertEqual(response.context['user'].profile.xp, UserProfile.objects.get(user=self.user).xp)
+        self.assertGreater(response.context['user'].profile.xp, 0)
+
+    @override_settings(LIFETRACK_AUTH_CACHE_TTL=60)
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(reverse('lifetrack:dashboard'))
+        self.user.set_password('changed-password')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(reverse('lifetrack:dashboard')).status_code, 302)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        client = Client()
+        client.login(username='authuser', password='password')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(client.get(reverse('lifetrack:dashboard')).status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'django_session' in q['sql']])
+
+    def test_sessions_from_the_default_backend_still_work(self):
+        client = Client()
+        client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(client.get(reverse('lifetrack:dashboard')).status_code, 200)
+
+
+@override_settings(SESSION_ENGINE=CACHED_DB_SESSIONS)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset_metrics()
+        self.addCleanup(metrics.reset_metrics)
+        self.user = User.objects.create_user(username='asyncuser', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Async")
+        self.client = AsyncClient()
+        self.client.force_login(self.user)
+
+    # Query counting has to be set up outside the event loop
+    def test_dashboard(self):
+        with self.assertNumQueries(DashboardQueryBudgetTests.QUERY_BUDGET):
+            response = async_to_sync(self.client.get)(reverse('lifetrack:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([h['name'] for h in response.context['habits']], ["Async"])
+        self.assertEqual(response.context['user'], self.user)
+
+    async def test_dashboard_requires_login(self):
+        response = await AsyncClient().get(reverse('lifetrack:dashboard'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(LIFETRACK_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_async_request_counts_queries(self):
+        client = AsyncClient()
+        client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = async_to_sync(client.get)(reverse('lifetrack:dashboard'))
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', response['Server-Timing'])
+        self.assertIn('lifetrack:dashboard', metrics.QUERIES.snapshot())
+
+    def test_lifespan_runs_schema_check(self):
+        from lt.asgi import LifespanMiddleware, django_app
+
+        app = LifespanMiddleware(django_app)
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertTrue(app.schema_ready)
+
+
+class AsyncToggleTests(TransactionTestCase):
+    # The toggle runs on a pool thread with its own connection, so the test data has to be committed
+    def setUp(self):
+        self.user = User.objects.create_user(username='asynctoggler', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Async")
+        self.client = AsyncClient()
+        self.client.force_login(self.user)
+
+    async def test_toggle(self):
+        url = reverse('lifetrack:toggle_habit')
+        data = (await self.client.post(url, {'habit_id': self.habit.id})).json()
+        self.assertTrue(data['completed'])
+        self.assertEqual(data['streak'], 1)
+        self.assertTrue(await Occurence.objects.filter(habit=self.habit, date=date.today()).aexists())
+
+        self.assertEqual((await self.client.get(url)).status_code, 405)
+        self.assertEqual((await self.client.post(url, {'habit_id': 0})).status_code, 404)
+
+    async def test_concurrent_toggles_of_different_habits(self):
+        habits = [self.habit] + [await Habit.objects.acreate(user=self.user, name=f"Async {n}") for n in range(3)]
+        url = reverse('lifetrack:toggle_habit')
+        responses = await asyncio.gather(*(self.client.post(url, {'habit_id': h.id}) for h in habits))
+        self.assertTrue(all(r.json()['completed'] for r in responses))
+        profile = await UserProfile.objects.aget(user=self.user)
+        self.assertEqual(profile.total_habits_completed, 4)
+
+
+class ReminderTests(TestCase):
+    DAY = date(2026, 10, 18)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reminded', password='password')
+        self.nine = Habit.objects.create(user=self.user, name="Nine", reminder_time=time(9, 0))
+        self.done = Habit.objects.create(user=self.user, name="Done", reminder_time=time(9, 0, 30))
+        self.later = Habit.objects.create(user=self.user, name="Later", reminder_time=time(9, 1))
+        Habit.objects.create(user=self.user, name="Silent")
+        Occurence.objects.create(habit=self.done, date=self.DAY)
+        self.dispatcher = reminders.ReminderDispatcher(outbox=reminders.DatabaseOutbox())
+
+    def at(self, hour, minute, second=0, day=DAY):
+        return timezone.make_aware(datetime.combine(day, time(hour, minute, second)))
+
+    def reminded(self):
+        return sorted(ReminderMessage.objects.values_list('habit_name', 'date'))
+
+    def test_due_habits_are_reminded_once(self):
+        self.assertEqual(self.dispatcher.tick(self.at(8, 59)), 0)
+        self.assertEqual(self.dispatcher.tick(self.at(9, 0, 10)), 1)
+        self.assertEqual(self.dispatcher.tick(self.at(9, 0, 50)), 0)
+        self.assertEqual(self.reminded(), [("Nine", self.DAY)])
+
+        message = ReminderMessage.objects.get()
+        self.assertEqual((message.user, message.due_at), (self.user, self.at(9, 0)))
+
+        # A late tick catches up on the minutes it missed
+        self.assertEqual(self.dispatcher.tick(self.at(9, 3)), 1)
+        self.assertEqual(self.reminded(), [("Later", self.DAY), ("Nine", self.DAY)])
+
+    def test_changes_after_loading_are_rechecked(self):
+        self.dispatcher.tick(self.at(8, 58))
+        self.assertEqual(self.dispatcher.wheel.slots[9 * 60], [self.nine.id, self.done.id])
+
+        Occurence.objects.create(habit=self.nine, date=self.DAY)
+        Habit.objects.filter(pk=self.later.pk).update(reminder_time=time(11, 0))
+        self.assertEqual(self.dispatcher.tick(self.at(9, 1)), 0)
+        self.assertEqual(self.dispatcher.tick(self.at(11, 0)), 1)
+        self.assertEqual(self.reminded(), [("Later", self.DAY)])
+
+    def test_outbox_ignores_repeats(self):
+        reminders.ReminderDispatcher(catch_up=60).tick(self.at(9, 1))
+        reminders.ReminderDispatcher(catch_up=60).tick(self.at(9, 1))
+        self.assertEqual(self.reminded(), [("Later", self.DAY), ("Nine", self.DAY)])
+
+    def test_midnight(self):
+        Habit.objects.create(user=self.user, name="Late", reminder_time=time(23, 59))
+        Habit.objects.create(user=self.user, name="Early", reminder_time=time(0, 0))
+        next_day = self.DAY + timedelta(days=1)
+
+        self.dispatcher.tick(self.at(23, 58))
+        self.assertEqual(self.dispatcher.tick(self.at(0, 0, 5, day=next_day)), 2)
+        self.assertEqual(self.reminded(), [("Early", next_day), ("Late", self.DAY)])
+
+    def test_command_with_file_outbox(self):
+        Habit.objects.filter(pk=self.nine.pk).update(reminder_time=timezone.localtime().time())
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'outbox.jsonl')
+            out = StringIO()
+            with override_settings(
+                LIFETRACK_REMINDER_OUTBOX='lifetrack.reminders.FileOutbox', LIFETRACK_REMINDER_OUTBOX_PATH=path,
+            ):
+                # --catch-up so the test doesn't depend on staying within one minute
+                call_command('dispatch_reminders', '--once', '--catch-up', '1', stdout=out)
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertIn("1 reminders", out.getvalue())
+        self.assertEqual([(r['habit_id'], r['user_id'], r['habit_name']) for r in lines], [
+            (self.nine.id, self.user.id, "Nine"),
+        ])
+        self.assertFalse(ReminderMessage.objects.exists())
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='offline', password='password')
+
+    def collected_root(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        return root.name
+
+    def test_pages_only_load_own_static_files(self):
+        # Nothing collected: the pages link the plain names rather than failing
+        uncollected = override_settings(STATIC_ROOT=self.collected_root())
+        uncollected.enable()
+        self.addCleanup(uncollected.disable)
+
+        anonymous = self.client.get(reverse('lifetrack:index')).content.decode()
+        self.client.force_login(self.user)
+        dashboard = self.client.get(reverse('lifetrack:dashboard')).content.decode()
+
+        for page in (anonymous, dashboard):
+            assets = re.findall(r'<(?:script|link)\b[^>]*\b(?:src|href)="([^"]+)"', page)
+            self.assertEqual(len(assets), 3)
+            for url in assets:
+                self.assertTrue(url.startswith('/static/lifetrack/build/'), url)
+
+    def test_collected_files_are_hashed_and_compressed(self):
+        from django.core.files.storage import FileSystemStorage
+        from .storage import AssetStorage
+
+        root = self.collected_root()
+        with tempfile.TemporaryDirectory() as source:
+            os.makedirs(os.path.join(source, 'build', 'fonts'))
+            with open(os.path.join(source, 'build', 'app.css'), 'w') as f:
+                f.write("@font-face{src:url('fonts/outfit.woff2')}" + "body{color:red}" * 100)
+            with open(os.path.join(source, 'build', 'fonts', 'outfit.woff2'), 'wb') as f:
+                f.write(b'wOF2' * 100)
+            files = FileSystemStorage(location=source)
+            storage = AssetStorage(location=root, base_url='/static/')
+            for path in ('build/app.css', 'build/fonts/outfit.woff2'):
+                storage.save(path, files.open(path))
+            list(storage.post_process({path: (files, path) for path in ('build/app.css', 'build/fonts/outfit.woff2')}))
+
+            css = storage.stored_name('build/app.css')
+            font = storage.stored_name('build/fonts/outfit.woff2')
+            self.assertRegex(css, r'^build/app\.[0-9a-f]{12}\.css$')
+            # The stylesheet points at the font's hashed name
+            with storage.open(css) as f:
+                self.assertIn(font.split('/')[-1], f.read().decode())
+            self.assertTrue(storage.exists(css + '.gz'))
+            try:
+                import brotli  # noqa: F401
+            except ImportError:
+                pass
+            else:
+                self.assertTrue(storage.exists(css + '.br'))
+
+        # A new process reads the manifest; a file added since keeps its plain name
+        storage = AssetStorage(location=root, base_url='/static/')
+        self.assertEqual(storage.stored_name('build/app.css'), css)
+        self.assertEqual(storage.url('build/new.js'), '/static/build/new.js')
+
+        # Deployed (no fallback) the manifest is still read, and a name missing from it is an error
+        with override_settings(LIFETRACK_STATIC_FALLBACK=False):
+            storage = AssetStorage(location=root, base_url='/static/')
+            self.assertEqual(storage.stored_name('build/app.css'), css)
+            with self.assertRaises(ValueError):
+                storage.url('build/new.js')
+
+    def test_uncollected_files_keep_their_names(self):
+        from .storage import AssetStorage
+
+        storage = AssetStorage(location=self.collected_root(), base_url='/static/')
+        self.assertEqual(storage.url('lifetrack/build/app.css'), '/static/lifetrack/build/app.css')
+
+    @override_settings(LIFETRACK_STATIC_FALLBACK=False)
+    def test_missing_manifest_fails_without_the_fallback(self):
+        from .storage import AssetStorage
+
+        storage = AssetStorage(location=self.collected_root(), base_url='/static/')
+        with self.assertRaises(ValueError):
+            storage.url('lifetrack/build/app.css')
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', password='password')
+        self.client = Client()
+        self.client.login(username='syncer', password='password')
+        self.url = reverse('lifetrack:sync')
+        self.today = date.today()
+
+    def pull(self, token):
+        response = self.client.get(self.url, {'token': token})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def push(self, token, completions):
+        return self.client.post(
+            self.url, json.dumps({'token': token, 'completions': completions}), content_type='application/json',
+        )
+
+    def make_habit(self, name="Synced"):
+        self.client.post(reverse('lifetrack:create_habit'), {'name': name})
+        return Habit.objects.get(user=self.user, name=name)
+
+    def test_snapshot_then_only_changes(self):
+        habit = self.make_habit()
+        other = self.make_habit("Untouched")
+        data = self.pull(0)
+        self.assertEqual([h['name'] for h in data['habits']], ["Synced", "Untouched"])
+        self.assertEqual(data['profile']['xp'], 0)
+        token = data['token']
+
+        self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habit.id})
+        data = self.pull(token)
+        self.assertEqual([(h['id'], h['current_streak']) for h in data['habits']], [(habit.id, 1)])
+        self.assertEqual([(o['habit_id'], o['date']) for o in data['occurrences']], [
+            (habit.id, self.today.isoformat()),
+        ])
+        self.assertGreater(data['profile']['xp'], 0)
+        self.assertNotIn(other.id, [h['id'] for h in data['habits']])
+        self.assertGreater(data['token'], token)
+
+        # Nothing new since
+        again = self.pull(data['token'])
+        self.assertEqual((again['token'], again['habits'], again['profile']), (data['token'], [], None))
+
+    def test_snapshot_and_changes_include_archived_completions(self):
+        habit = self.make_habit()
+        old = live_horizon(self.today) - timedelta(days=10)
+        Habit.objects.filter(pk=habit.pk).update(created_at=old - timedelta(days=1))
+        Occurence.objects.create(habit=habit, date=old)
+        token = self.pull(0)['token']
+        self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habit.id})
+
+        # Today's change is read after it has been archived too (a client offline for a long time)
+        compact(self.today + timedelta(days=archive_after_days() + 1))
+        self.assertEqual(Occurence.objects.filter(habit=habit).count(), 0)
+        data = self.pull(token)
+        self.assertEqual([o['date'] for o in data['occurrences']], [self.today.isoformat()])
+        self.assertEqual(data['deleted']['occurrences'], [])
+        self.assertEqual([o['date'] for o in self.pull(0)['occurrences']], [old.isoformat(), self.today.isoformat()])
+
+    def test_deletions_come_back_as_tombstones(self):
+        habit = self.make_habit()
+        kept = self.make_habit("Kept")
+        token = self.pull(0)['token']
+
+        toggle = reverse('lifetrack:toggle_habit')
+        self.client.post(toggle, {'habit_id': kept.id})
+        self.client.post(toggle, {'habit_id': kept.id})
+        self.client.post(toggle, {'habit_id': habit.id})
+        self.client.get(reverse('lifetrack:delete_habit', args=[habit.id]))
+
+        data = self.pull(token)
+        self.assertEqual(data['occurrences'], [])
+        self.assertEqual(data['deleted'], {
+            'habits': [habit.id],
+            # The deleted habit's completions go with its tombstone
+            'occurrences': [{'habit_id': kept.id, 'date': self.today.isoformat()}],
+            'achievements': [],
+        })
+
+    def test_offline_completions(self):
+        habit = self.make_habit()
+        gone = self.make_habit("Gone")
+        token = self.pull(0)['token']
+        self.client.get(reverse('lifetrack:delete_habit', args=[gone.id]))
+
+        completions = [
+            {'habit_id': habit.id, 'date': (self.today - timedelta(days=1)).isoformat()},
+            {'habit_id': habit.id, 'date': self.today.isoformat()},
+            {'habit_id': gone.id},
+        ]
+        data = self.push(token, completions).json()
+        self.assertEqual([r['completed'] for r in data['applied']], [True, True])
+        self.assertEqual(data['skipped'], [gone.id])
+        self.assertEqual(data['habits'][0]['current_streak'], 2)
+        self.assertEqual(len(data['occurrences']), 2)
+        self.assertEqual(data['deleted']['habits'], [gone.id])
+
+        # A resend after a lost response changes nothing
+        data = self.push(data['token'], completions).json()
+        self.assertEqual([r['changed'] for r in data['applied']], [False, False])
+        self.assertEqual(data['occurrences'], [])
+        self.assertEqual(Occurence.objects.filter(habit=habit).count(), 2)
+
+    def test_work_follows_the_changes_not_the_history(self):
+        def sync_queries(history_days):
+            habit = self.make_habit(f"History {history_days}")
+            Occurence.objects.bulk_create(
+                Occurence(habit=habit, date=self.today - timedelta(days=n)) for n in range(1, history_days + 1)
+            )
+            habit.rebuild_history()
+            token = sync.latest_token(self.user)
+            self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': habit.id})
+            with CaptureQueriesContext(connection) as ctx:
+                data = self.pull(token)
+            self.assertEqual(len(data['occurrences']), 1)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(sync_queries(3), sync_queries(300))
+
+    def test_pages_through_a_long_log(self):
+        self.make_habit("First")
+        token = sync.latest_token(self.user)
+        habits = [self.make_habit(f"Habit {n}") for n in range(5)]
+        first = sync.changes_since(self.user, token, page=3)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['habits']), 3)
+        rest = sync.changes_since(self.user, first['token'], page=3)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([h['id'] for h in first['habits'] + rest['habits']], [h.id for h in habits])
+
+    def test_rollover_and_import_are_logged(self):
+        habit = self.make_habit()
+        Occurence.objects.create(habit=habit, date=self.today - timedelta(days=2))
+        Habit.objects.filter(pk=habit.pk).update(current_streak=1, created_at=self.today - timedelta(days=30))
+        token = self.pull(0)['token']
+
+        rollover(self.today)
+        data = self.pull(token)
+        self.assertEqual([h['current_streak'] for h in data['habits']], [0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.csv')
+            with open(path, 'w') as f:
+                f.write(f"habit_id,date\n{habit.id},{self.today - timedelta(days=5)}\n")
+            call_command('import_history', path, stdout=StringIO())
+        data = self.pull(data['token'])
+        self.assertEqual([o['date'] for o in data['occurrences']], [(self.today - timedelta(days=5)).isoformat()])
+        self.assertIsNotNone(data['profile'])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(self.url, {'token': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'token': -1}).status_code, 400)
+        tomorrow = (self.today + timedelta(days=1)).isoformat()
+        self.assertEqual(self.push(0, [{'habit_id': 1, 'date': tomorrow}]).status_code, 400)
+        self.assertEqual(self.push(0, [{'habit_id': 'x'}]).status_code, 400)
+
+
+class XpLedgerTests(TestCase):
+    def setUp(self):
+        invalidate_catalog()
+        self.addCleanup(invalidate_catalog)
+        self.user = User.objects.create_user(username='ledgered', password='password')
+        self.client = Client()
+        self.client.login(username='ledgered', password='password')
+        self.habit = Habit.objects.create(user=self.user, name="Counted")
+
+    def toggle(self):
+        return self.client.post(reverse('lifetrack:toggle_habit'), {'habit_id': self.habit.id}).json()
+
+    def profile_xp(self):
+        return UserProfile.objects.get(user=self.user).xp
+
+    def entries(self):
+        return list(XpLedgerEntry.objects.filter(user=self.user).order_by('id').values_list('source', 'amount'))
+
+    def snapshot(self):
+        return ledger.take_snapshots(now=timezone.now() + timedelta(seconds=1), lag=timedelta(0))
+
+    def test_every_xp_change_is_in_the_ledger(self):
+        Achievement.objects.create(name="First Step", description="", condition_type='STREAK', threshold=1, xp_reward=50)
+        gained = self.toggle()['xp_gained']
+        self.toggle()
+        self.assertEqual(self.entries(), [
+            (XpLedgerEntry.COMPLETION, gained), (XpLedgerEntry.ACHIEVEMENT, 50), (XpLedgerEntry.UNDO, -gained),
+        ])
+        self.assertEqual(ledger.xp_total(self.user), self.profile_xp())
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_total_is_snapshot_plus_tail(self):
+        self.toggle()
+        self.assertEqual(self.snapshot(), 1)
+        snapshot = XpSnapshot.objects.get(user=self.user)
+        self.assertEqual(snapshot.total, self.profile_xp())
+
+        self.toggle()
+        self.toggle()
+        with self.assertNumQueries(1):
+            total = ledger.xp_total(self.user)
+        self.assertEqual(total, self.profile_xp())
+
+        # The next run only adds the entries since the last one
+        other = User.objects.create_user(username='quiet', password='password')
+        XpLedgerEntry.objects.create(user=other, source=XpLedgerEntry.ADJUSTMENT, amount=5)
+        self.assertEqual(self.snapshot(), 2)
+        self.assertEqual(self.snapshot(), 0)
+        self.assertEqual(XpSnapshot.objects.get(user=self.user).total, self.profile_xp())
+        self.assertEqual(ledger.xp_total(other), 5)
+
+    def test_snapshots_leave_out_recent_entries(self):
+        self.toggle()
+        self.assertEqual(ledger.take_snapshots(), 0)
+        self.assertFalse(XpSnapshot.objects.exists())
+        self.assertEqual(ledger.xp_total(self.user), self.profile_xp())
+
+    def test_time_windows(self):
+        now = timezone.make_aware(datetime(2026, 10, 14, 12, 0))  # a Wednesday
+        for days_ago, amount in ((0, 10), (2, 20), (5, 40), (20, 80)):
+            XpLedgerEntry.objects.create(
+                user=self.user, source=XpLedgerEntry.ADJUSTMENT, amount=amount, created_at=now - timedelta(days=days_ago),
+            )
+        self.assertEqual(ledger.xp_this_week(self.user, now), 30)
+        self.assertEqual(ledger.xp_this_month(self.user, now), 70)
+        self.assertEqual(ledger.xp_between(self.user, now - timedelta(days=30), now - timedelta(days=1)), 140)
+
+    def test_reconcile_command(self):
+        self.toggle()
+        UserProfile.objects.filter(user=self.user).update(xp=F('xp') + 7)
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('snapshot_xp', '--reconcile', stdout=out)
+        self.assertIn(f"user {self.user.id}:", out.getvalue())
+
+        call_command('snapshot_xp', '--reconcile', '--fix', stdout=StringIO())
+        self.assertEqual(self.entries()[-1], (XpLedgerEntry.ADJUSTMENT, 7))
+        self.assertEqual(list(ledger.reconcile()), [])
+
@@ -0,0 +1,228 @@
+"""
+Toggle write path.
+
+Toggles run in one transaction with the user's profile and the habits locked,
+so concurrent clicks on the same habit are serialized. A batch of toggles is
+applied with one query per table, and XP, level-ups and achievements are
+computed once for the whole batch.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import Http404
+
+from .models import Habit, Occurence, UserProfile, StreakFreeze, ChangeLogEntry, XpLedgerEntry
+from .streaks import streaks_from_history, streak_ending, period_bounds
+from .utils import calculate_xp_gain, check_level_up
+from .achievements import evaluate_achievements, award_achievements
+from .activity import apply_activity_deltas
+from .sync import record_changes
+from . import dashboard_cache
+
+# day=None means today; completed=None means flip the current state
+ToggleItem = namedtuple('ToggleItem', ['habit_id', 'day', 'completed'], defaults=[None, None])
+
+MAX_BATCH_SIZE = 100
+
+
+def reaches_target(history, day, habit):
+    """
+    True if `day` is the completion that brings its period to exactly the
+    habit's target (always true for daily habits).
+    """
+    first, last = period_bounds(day, habit.frequency)
+    return (
+        history.count_between(first, last) == habit.period_target
+        and not history.count_between(day + timedelta(days=1), last)
+    )
+
+
+def apply_toggles(user, items, today=None):
+    """
+    Apply a list of ToggleItems for one user in a single transaction.
+    Returns the data for the batch JSON response. Raises Http404 if any habit
+    doesn't belong to the user.
+    """
+    today = today or date.today()
+    try:
+        items = [ToggleItem(int(i.habit_id), i.day or today, i.completed) for i in items]
+    except (TypeError, ValueError):
+        raise Http404("No Habit matches the given query.")
+    habit_ids = {i.habit_id for i in items}
+
+    with transaction.atomic():
+        # Lock order: profile first, then habits by id (same order for every writer)
+        profile, _ = UserProfile.objects.select_for_update().get_or_create(user=user)
+        habits = {
+            h.id: h for h in Habit.objects.select_for_update().filter(user=user, id__in=habit_ids).order_by('id')
+        }
+        if len(habits) != len(habit_ids):
+            raise Http404("No Habit matches the given query.")
+
+        existing = {
+            (o.habit_id, o.date): o
+            for o in Occurence.objects.filter(habit__in=habits.values(), date__in={i.day for i in items})
+        }
+        histories = {h.id: h.get_history() for h in habits.values()}
+        freezes = {h_id: set() for h_id in habits}
+        for habit_id, day in StreakFreeze.objects.filter(habit__in=habits.values()).values_list('habit_id', 'date'):
+            freezes[habit_id].add(day)
+
+        results = []
+        for item in items:
+            habit = habits[item.habit_id]
+            history = histories[item.habit_id]
+            was_completed = item.day in history
+            completed = not was_completed if item.completed is None else item.completed
+
+            if completed != was_completed:
+                if completed:
+                    history.add(item.day)
+                    # Created below, unless an earlier item in the batch removed this row
+                    existing.setdefault((habit.id, item.day), None)
+                else:
+                    history.discard(item.day)
+                    if item.day == today:
+                        habit.last_completed_date = today - timedelta(days=1)
+                if completed and (habit.last_completed_date is None or item.day > habit.last_completed_date):
+                    habit.last_completed_date = item.day
+            results.append((item, completed, completed != was_completed))
+
+        # Occurrence rows: XP is based on the streak reached on that day
+        xp_delta = token_delta = completions_delta = 0
+        to_create = []
+        to_delete = []
+        changed_days = []
+        ledger = []
+        activity = defaultdict(int)
+        for (habit_id, day), occurrence in existing.items():
+            completed = day in histories[habit_id]
+            if occurrence is None and completed:
+                habit = habits[habit_id]
+                history = histories[habit_id]
+                run = streak_ending(history, day, freezes[habit_id], habit.frequency, habit.period_target)
+                xp = calculate_xp_gain(habit, run)
+                # A token every 7th period, earned by the completion that meets the period's target
+                token = run > 0 and run % 7 == 0 and reaches_target(history, day, habit)
+                to_create.append(Occurence(habit=habit, date=day, xp_gained=xp, token_earned=token))
+                activity[day] += 1
+                xp_delta += xp
+                token_delta += 1 if token else 0
+                completions_delta += 1
+                changed_days.append((habit_id, day))
+                ledger.append(XpLedgerEntry(
+                    user_id=user.id, source=XpLedgerEntry.COMPLETION, amount=xp, habit_id=habit_id, date=day,
+                ))
+            elif occurrence is not None and not completed:
+                to_delete.append(occurrence.id)
+                changed_days.append((habit_id, day))
+                ledger.append(XpLedgerEntry(
+                    user_id=user.id, source=XpLedgerEntry.UNDO, amount=-occurrence.xp_gained, habit_id=habit_id, date=day,
+                ))
+                activity[day] -= 1
+                xp_delta -= occurrence.xp_gained
+                token_delta -= 1 if occurrence.token_earned else 0
+                completions_delta -= 1
+        if to_create:
+            Occurence.objects.bulk_create(to_create)
+        if to_delete:
+            Occurence.objects.filter(id__in=to_delete).delete()
+        apply_activity_deltas(user.id, activity)
+
+        xp_by_occurrence = {(o.habit_id, o.date): o.xp_gained for o in to_create}
+        streaks = {}
+        for habit_id, habit in habits.items():
+            habit.set_history(histories[habit_id])
+            streak, longest = streaks_from_history(
+                histories[habit_id], today, freezes[habit_id], habit.frequency, habit.period_target,
+            )
+            habit.current_streak = streak
+            if longest > habit.longest_streak:
+                habit.longest_streak = longest
+            streaks[habit_id] = streak
+        Habit.objects.bulk_update(habits.values(), [
+            'current_streak', 'longest_streak', 'last_completed_date',
+            'completion_bitmap', 'bitmap_start',
+        ])
+
+        profile.xp = max(0, profile.xp + xp_delta)
+        profile.freeze_tokens = max(0, profile.freeze_tokens + token_delta)
+        profile.total_habits_completed = max(0, profile.total_habits_completed + completions_delta)
+
+        leveled_up = False
+        unlocked = []
+        if to_create:
+            leveled_up, _ = check_level_up(profile)
+            best_streak = max(streaks[o.habit_id] for o in to_create)
+            unlocked = award_achievements(
+                user, profile, evaluate_achievements(user, profile, best_streak), update_profile=False
+            )
+            reward = sum(a.xp_reward for a in unlocked)
+            if reward:
+                xp_delta += reward
+                leveled_up = check_level_up(profile)[0] or leveled_up
+            ledger += [
+                XpLedgerEntry(user_id=user.id, source=XpLedgerEntry.ACHIEVEMENT, amount=a.xp_reward, achievement=a)
+                for a in unlocked
+            ]
+
+        # One write for every profile change made by this batch
+        UserProfile.objects.filter(pk=profile.pk).update(
+            xp=Greatest(F('xp') + xp_delta, 0),
+            freeze_tokens=Greatest(F('freeze_tokens') + token_delta, 0),
+            total_habits_completed=Greatest(F('total_habits_completed') + completions_delta, 0),
+            level=profile.level,
+        )
+        # The XP audit trail (see ledger.py), with the same delta as the update
+        XpLedgerEntry.objects.bulk_create(entry for entry in ledger if entry.amount)
+        # Same transaction and profile lock as the changes (see sync.py)
+        if changed_days:
+            record_changes(user.id, [
+                *((ChangeLogEntry.OCCURENCE, habit_id, day) for habit_id, day in changed_days),
+                *((ChangeLogEntry.HABIT, habit_id, None) for habit_id in sorted({h for h, _ in changed_days})),
+                (ChangeLogEntry.PROFILE, user.id, None),
+                *((ChangeLogEntry.ACHIEVEMENT, a.id, None) for a in unlocked),
+            ])
+        dashboard_cache.invalidate_user(user.id)
+
+    return {
+        'status': 'ok',
+        'results': [
+            {
+                'habit_id': item.habit_id,
+                'date': item.day.isoformat(),
+                'completed': completed,
+                'changed': changed,
+                'streak': habits[item.habit_id].current_streak,
+                'longest_streak': habits[item.habit_id].longest_streak,
+                'xp_gained': xp_by_occurrence.get((item.habit_id, item.day), 0) if completed and changed else 0,
+            }
+            for item, completed, changed in results
+        ],
+        'xp_gained': sum(xp_by_occurrence.values()),
+        'leveled_up': leveled_up,
+        'new_level': profile.level,
+        'unlocked_achievements': [a.name for a in unlocked],
+    }
+
+
+def toggle_habit_for_user(user, habit_id, today=None):
+    """
+    Toggle today's completion of one habit. Returns the data for the toggle
+    JSON response.
+    """
+    batch = apply_toggles(user, [ToggleItem(habit_id)], today)
+    result = batch['results'][0]
+    return {
+        'status': 'ok',
+        'completed': result['completed'],
+        'streak': result['streak'],
+        'longest_streak': result['longest_streak'],
+        'xp_gained': result['xp_gained'],
+        'leveled_up': batch['leveled_up'],
+        'new_level': batch['new_level'],
+        'unlocked_achievements': batch['unlocked_achievements'],
+    }
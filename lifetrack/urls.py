@@ -12,5 +12,11 @@ urlpatterns = [
     path('create/', views.create_habit, name='create_habit'),
     path('delete/<int:habit_id>/', views.delete_habit, name='delete_habit'),
     path('toggle/', views.toggle_habit, name='toggle_habit'),
+    path('toggle/batch/', views.toggle_habits_batch, name='toggle_habits_batch'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('achievements/', views.achievements, name='achievements'),
+    path('export/', views.export_history, name='export_history'),
+    path('sync/', views.sync, name='sync'),
+    path('heatmap/', views.activity_heatmap, name='activity_heatmap'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
@@ -1,12 +1,27 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login as auth_login, logout as auth_logout, authenticate
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from .models import Habit, Occurence, UserProfile, Achievement, UserAchievement
-from .utils import calculate_xp_gain, check_level_up, check_achievements
+from django.contrib.auth.models import User
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import require_POST, require_http_methods
+from django.db import transaction, close_old_connections
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+from .models import Habit, Occurence, UserProfile, Achievement, UserAchievement, ChangeLogEntry
 from .forms import UserForm
-from datetime import date, timedelta
+from .leveling import level_progress
+from .activity import apply_activity_deltas, heatmap
+from . import dashboard_cache, leaderboard as ranks
+from .export import stream_csv, stream_ndjson
+from .metrics import render_prometheus, measure_pool_queries
+from .archive import live_horizon
+from .toggles import toggle_habit_for_user, apply_toggles, ToggleItem, MAX_BATCH_SIZE
+from . import sync as delta_sync
+from datetime import date
+import json
 
 def index(request):
     if request.user.is_authenticated:
@@ -43,122 +58,233 @@ def logout_view(request):
     return redirect('lifetrack:index')
 
 @login_required
-def dashboard(request):
-    habits = Habit.objects.filter(user=request.user).order_by('-created_at')
-    # Pre-calculate completion status for today to pass to template
-    today = date.today()
-    for h in habits:
-        h.completed_today = Occurence.objects.filter(habit=h, date=today).exists()
-    
-    return render(request, 'lifetrack/dashboard.html', {'habits': habits})
+async def dashboard(request):
+    user = await request.auser()
+
+    async def build():
+        today = date.today()
+        # Completion status for today is annotated in the same query as the habits
+        completed_today = Occurence.objects.filter(habit=OuterRef('pk'), date=today)
+        habits = (
+            Habit.objects.filter(user=user)
+            .annotate(completed_today=Exists(completed_today))
+            .order_by('-created_at')
+            .values(*dashboard_cache.HABIT_FIELDS)
+        )
+        profile = await _aprofile(user)
+        return {
+            'habits': [habit async for habit in habits],
+            'profile': {field: getattr(profile, field) for field in dashboard_cache.PROFILE_FIELDS},
+        }
+
+    data = await dashboard_cache.aget_dashboard_data(user.id, build)
+    # Attach the (possibly cached) profile so the templates don't query it again,
+    # and hand the loaded user to them (request.user would load it synchronously)
+    profile = UserProfile(user=user, **data['profile'])
+    user.profile = profile
+    request.user = user
+
+    context = {
+        'habits': data['habits'],
+        'profile': profile,
+        'progress': level_progress(profile.xp, profile.level),
+    }
+    return render(request, 'lifetrack/dashboard.html', context)
+
+async def _aprofile(user):
+    # Usually loaded along with the user (see auth.py)
+    if User.profile.related.is_cached(user):
+        try:
+            return user.profile
+        except UserProfile.DoesNotExist:
+            pass
+    profile, _ = await UserProfile.objects.aget_or_create(user=user)
+    return profile
 
 @login_required
 def create_habit(request):
     if request.method == 'POST':
         name = request.POST.get('name')
+        frequency = request.POST.get('frequency', 'DAILY')
+        if frequency not in dict(Habit.FREQUENCY_CHOICES):
+            frequency = 'DAILY'
+        try:
+            times_per_period = min(max(int(request.POST.get('times_per_period', 1)), 1), 7)
+        except ValueError:
+            times_per_period = 1
         if name:
-            Habit.objects.create(user=request.user, name=name)
+            with transaction.atomic():
+                # The change log is written under the profile lock (see sync.py)
+                UserProfile.objects.select_for_update().filter(user=request.user).first()
+                habit = Habit.objects.create(
+                    user=request.user, name=name, frequency=frequency, times_per_period=times_per_period,
+                )
+                delta_sync.record_changes(request.user.id, [(ChangeLogEntry.HABIT, habit.id, None)])
+                dashboard_cache.invalidate_user(request.user.id)
         return redirect('lifetrack:dashboard')
     return render(request, 'lifetrack/create_habit.html')
 
 @login_required
 def delete_habit(request, habit_id):
-    habit = get_object_or_404(Habit, id=habit_id, user=request.user)
-    habit.delete()
+    with transaction.atomic():
+        # Same lock as the toggle path, so the rollup isn't updated concurrently
+        UserProfile.objects.select_for_update().filter(user=request.user).first()
+        habit = get_object_or_404(Habit, id=habit_id, user=request.user)
+        # Take the habit's completions back out of the daily rollup
+        apply_activity_deltas(request.user.id, {day: -1 for day in habit.get_history()})
+        # One tombstone for the habit; clients drop its completions with it
+        delta_sync.record_changes(request.user.id, [(ChangeLogEntry.HABIT, habit.id, None)])
+        habit.delete()
+        dashboard_cache.invalidate_user(request.user.id)
     return redirect('lifetrack:dashboard')
 
+def _toggle_in_pool(user, habit_id):
+    # Runs on a pool thread, outside the request's connection cleanup and query metrics
+    try:
+        with measure_pool_queries():
+            return toggle_habit_for_user(user, habit_id)
+    finally:
+        close_old_connections()
+
+
 @login_required
 @require_POST
-def toggle_habit(request):
+async def toggle_habit(request):
+    user = await request.auser()
     habit_id = request.POST.get('habit_id')
-    habit = get_object_or_404(Habit, id=habit_id, user=request.user)
-    today = date.today()
-    
-    occurrence, created = Occurence.objects.get_or_create(habit=habit, date=today)
-    
-    xp_gained = 0
-    leveled_up = False
-    new_level = request.user.profile.level
-    unlocked_achievements = []
-    
-    if not created:
-        # If it already existed, we are toggling OFF
-        # Revoke XP and Tokens
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        profile.xp = max(0, profile.xp - occurrence.xp_gained) # Prevent negative XP?
-        
-        if occurrence.token_earned:
-             profile.freeze_tokens = max(0, profile.freeze_tokens - 1)
-             
-        profile.save()
-        
-        occurrence.delete()
-        completed = False
+    # The write path locks rows in a transaction, which the async ORM can't do,
+    # so it runs as one call in a worker thread and leaves the event loop free.
+    # Under ASGI thread_sensitive calls all queue on one shared thread, so use
+    # the pool; under WSGI that thread is this request's own.
+    if isinstance(request, ASGIRequest):
+        toggle = sync_to_async(_toggle_in_pool, thread_sensitive=False)
     else:
-        # Toggled ON
-        completed = True
-        
-    # Recalculate Streak (Existing Logic)
-    streak = 0
-    check_date = today
-    
-    if Occurence.objects.filter(habit=habit, date=today).exists():
-        streak += 1
-        check_date -= timedelta(days=1)
-    elif Occurence.objects.filter(habit=habit, date=today - timedelta(days=1)).exists():
-        check_date = today - timedelta(days=1)
-    else:
-        streak = 0
-        
-    while True:
-        if Occurence.objects.filter(habit=habit, date=check_date).exists():
-             if check_date != today: 
-                streak += 1
-             check_date -= timedelta(days=1)
+        toggle = sync_to_async(toggle_habit_for_user)
+    return JsonResponse(await toggle(user, habit_id))
+
+@login_required
+@require_POST
+def toggle_habits_batch(request):
+    """
+    Apply several toggles in one request.
+    Body: {"habit_ids": [1, 2]} or {"items": [{"habit_id": 1, "date": "2024-01-31", "completed": true}]}
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+        raw_items = payload.get('items') or [{'habit_id': h} for h in payload.get('habit_ids', [])]
+        items = _toggle_items(raw_items)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'error': str(e) or 'Malformed request'}, status=400)
+
+    if not items:
+        return JsonResponse({'status': 'error', 'error': 'No habits given'}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return JsonResponse({'status': 'error', 'error': f'At most {MAX_BATCH_SIZE} toggles per request'}, status=400)
+
+    return JsonResponse(apply_toggles(request.user, items))
+
+def _toggle_items(raw_items, completed_default=None):
+    """
+    ToggleItems from a list of {"habit_id", "date", "completed"} dicts.
+    Raises ValueError (or KeyError, TypeError) on a malformed item.
+    """
+    items = []
+    for raw in raw_items:
+        day = parse_date(raw['date']) if raw.get('date') else None
+        if raw.get('date') and (day is None or day > date.today()):
+            raise ValueError(f"Invalid date: {raw['date']}")
+        if day is not None and day < live_horizon():
+            raise ValueError(f"Archived dates can't be changed: {raw['date']}")
+        completed = raw.get('completed', completed_default)
+        if completed is not None and not isinstance(completed, bool):
+            raise ValueError("'completed' must be true, false or omitted")
+        items.append(ToggleItem(raw['habit_id'], day, completed))
+    return items
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def sync(request):
+    """
+    Rows changed since a change token (see sync.py).
+    GET ?token=123, or POST {"token": 123, "completions": [{"habit_id": 1, "date": "2024-01-31"}]}
+    to apply completions queued offline first ("completed" defaults to true).
+    Returns the changes and the token to send next time; token 0 or none gets everything.
+    """
+    try:
+        if request.method == 'POST':
+            payload = json.loads(request.body or b'{}')
+            token = int(payload.get('token') or 0)
+            completions = _toggle_items(payload.get('completions', []), completed_default=True)
+            completions = [item._replace(habit_id=int(item.habit_id)) for item in completions]
         else:
-            break
-            
-    habit.current_streak = streak
-    if streak > habit.longest_streak:
-        habit.longest_streak = streak
-    
-    habit.last_completed_date = today if completed else (today - timedelta(days=1))
-    habit.save()
-
-    # --- Gamification Logic ---
-    if completed:
-        # Ensure profile exists (safeguard for existing users)
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        
-        xp_gained = calculate_xp_gain(habit, streak)
-        profile.xp += xp_gained
-        
-        # Check for Freeze Token (Every 7 days)
-        if streak > 0 and streak % 7 == 0:
-             profile.freeze_tokens += 1
-             occurrence.token_earned = True
-        
-        # Log it in occurrence
-        occurrence.xp_gained = xp_gained
-        occurrence.save()
-        
-        leveled_up, new_level = check_level_up(profile)
-        profile.save() # check_level_up saves, but ensure XP is saved
-        
-        unlocked_achievements_objs = check_achievements(request.user, habit, streak)
-        unlocked_achievements = [a.name for a in unlocked_achievements_objs]
+            token = int(request.GET.get('token') or 0)
+            completions = []
+        if token < 0:
+            raise ValueError("Invalid token")
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'error': str(e) or 'Malformed request'}, status=400)
+    if len(completions) > MAX_BATCH_SIZE:
+        return JsonResponse({'status': 'error', 'error': f'At most {MAX_BATCH_SIZE} completions per request'}, status=400)
+
+    response = {'status': 'ok'}
+    if completions:
+        response['applied'], response['skipped'] = delta_sync.apply_completions(request.user, completions)
+    response.update(delta_sync.changes_since(request.user, token))
+    return JsonResponse(response)
 
+@login_required
+def export_history(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt == 'ndjson':
+        response = StreamingHttpResponse(stream_ndjson(request.user), content_type='application/x-ndjson')
+    elif fmt == 'csv':
+        response = StreamingHttpResponse(stream_csv(request.user), content_type='text/csv')
+    else:
+        return JsonResponse({'status': 'error', 'error': f'Unknown format: {fmt}'}, status=400)
+    response['Content-Disposition'] = f'attachment; filename="lifetrack-{request.user.username}.{fmt}"'
+    return response
+
+@login_required
+def activity_heatmap(request):
+    start, end, days = heatmap(request.user)
     return JsonResponse({
-        'status': 'ok', 
-        'completed': completed, 
-        'streak': streak,
-        'longest_streak': habit.longest_streak,
-        'xp_gained': xp_gained,
-        'leveled_up': leveled_up,
-        'new_level': new_level,
-        'unlocked_achievements': unlocked_achievements
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': {day.isoformat(): count for day, count in days.items()},
     })
 
+@login_required
+def leaderboard(request):
+    try:
+        after = max(int(request.GET.get('after', 0)), 0)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'error': 'after must be a rank'}, status=400)
+
+    page = ranks.top(after=after)
+    me = ranks.entry_for(request.user)
+    around_me = ranks.neighbours(me) if me else []
+
+    if request.GET.get('format') == 'json':
+        def row(entry):
+            return {'rank': entry.rank, 'username': entry.username, 'xp': entry.xp, 'level': entry.level}
+        return JsonResponse({
+            'entries': [row(e) for e in page.entries],
+            'next_after': page.next_after,
+            'me': row(me) if me else None,
+            'neighbours': [row(e) for e in around_me],
+        })
+
+    context = {
+        'entries': page.entries,
+        'next_after': page.next_after,
+        'after': after,
+        'me': me,
+        'around_me': around_me,
+        'total': ranks.ranked_count(),
+        'refreshed_at': page.entries[0].refreshed_at if page.entries else (me.refreshed_at if me else None),
+    }
+    return render(request, 'lifetrack/leaderboard.html', context)
+
 @login_required
 def achievements(request):
     all_achievements = Achievement.objects.all().order_by('xp_reward')
@@ -170,3 +296,9 @@ def achievements(request):
         'earned_ids': set(earned_ids) # Set for O(1) lookup in template
     }
     return render(request, 'lifetrack/achievements.html', context)
+
+@login_required
+def metrics(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,91 @@
+"""
+ASGI config for lt project.
+
+The same app as index.py, for an ASGI server where one worker serves many
+requests at once (the dashboard and toggle views are async):
+
+    uvicorn lt.asgi:application --workers 2
+
+The schema handling from lt/startup.py runs on the lifespan startup event, so
+it is done before the first request is accepted. Servers without lifespan
+support get it on the first request instead, like index.py.
+"""
+import time
+_started = time.perf_counter()
+
+import os
+import sys
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lt.settings')
+# Connections don't outlive a request's worker thread (see DATABASES in settings)
+os.environ.setdefault('LIFETRACK_CONN_MAX_AGE', '0')
+
+from asgiref.sync import sync_to_async
+
+from lt.startup import StartupTimer, ensure_schema
+
+timer = StartupTimer(_started)
+
+from django.core.asgi import get_asgi_application
+timer.mark('import')
+
+django_app = get_asgi_application()
+timer.mark('django_setup')
+
+
+class LifespanMiddleware:
+    """
+    ASGI middleware that answers lifespan events (running the schema check on
+    startup) and passes everything else to Django, or answers 503 while the
+    schema isn't up to date.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.schema_ready = False
+
+    async def ensure_schema(self):
+        try:
+            await sync_to_async(ensure_schema)(timer)
+            self.schema_ready = True
+        except Exception as e:
+            # Already logged; requests get a 503 and retry it
+            sys.stderr.write(f"STARTUP MIDDLEWARE ERROR: {e}\n")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.ensure_schema()
+                timer.report()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def unavailable(self, send):
+        await send({
+            'type': 'http.response.start', 'status': 503,
+            'headers': [(b'content-type', b'text/plain'), (b'retry-after', b'5')],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': b"The database schema is not up to date yet. Please try again shortly.\n",
+        })
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if not self.schema_ready:
+            await self.ensure_schema()
+            if not self.schema_ready and scope['type'] == 'http':
+                return await self.unavailable(send)
+        await self.app(scope, receive, send)
+        if not timer.reported:
+            timer.mark('first_request')
+            timer.report()
+
+
+application = LifespanMiddleware(django_app)
+app = application
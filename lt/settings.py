@@ -15,7 +15,8 @@ import os
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEMPLATE_DIR=os.path.join(BASE_DIR,'templates')
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# build_files.sh collects into the deploy's static output (see vercel.json)
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles_build', 'static')
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers the rest of the stack (see lifetrack/metrics.py)
+    'lifetrack.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -55,7 +58,8 @@ ROOT_URLCONF = 'lt.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for sampled requests
+        'BACKEND': 'lifetrack.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR,],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +74,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'lt.wsgi.application'
+ASGI_APPLICATION = 'lt.asgi.application'
 
 
 # Database
@@ -77,13 +82,111 @@ WSGI_APPLICATION = 'lt.wsgi.application'
 
 import dj_database_url
 
+# Persistent connections are per thread. Under ASGI every request runs its ORM
+# calls in a fresh thread, so lt/asgi.py defaults this to 0 (close after each
+# request) to avoid leaking a connection per request.
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + os.path.join(BASE_DIR, 'db.sqlite3'),
-        conn_max_age=600
+        conn_max_age=int(os.environ.get('LIFETRACK_CONN_MAX_AGE', '600'))
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Take the write lock when a transaction starts so concurrent toggles
+    # queue up instead of failing on a read->write lock upgrade.
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    })
+    # A file-backed test database, so threads in the concurrency tests get
+    # real connections instead of sharing one in-memory cache.
+    DATABASES['default']['TEST'] = {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')}
+
+
+# Cache
+# LIFETRACK_CACHE_BACKEND picks local memory (default, per process), a shared
+# file cache, or Redis (needs the `redis` package; LIFETRACK_CACHE_LOCATION is
+# the redis:// URL). Run more than one process (several serverless instances,
+# `uvicorn --workers 2`) with file or redis: invalidations are cache writes, and
+# a per-process cache only sees its own.
+
+_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+_cache_backend = os.environ.get('LIFETRACK_CACHE_BACKEND', 'locmem')
+# Whether every process sees the same entries. Anything cached across
+# requests that a write elsewhere must revoke depends on it.
+_shared_cache = _cache_backend in ('file', 'redis')
+
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[_cache_backend],
+        'LOCATION': os.environ.get(
+            'LIFETRACK_CACHE_LOCATION',
+            os.path.join(BASE_DIR, '.cache') if _cache_backend == 'file' else 'lifetrack',
+        ),
+    }
+}
+
+
+# How long a user's dashboard stays cached (dashboard_cache.py). Writes
+# invalidate it by bumping a version in the cache, which other processes only
+# see with a shared cache; with the per-process default a worker that didn't
+# handle the write serves its old copy until it expires, so keep that short.
+
+LIFETRACK_DASHBOARD_CACHE_TIMEOUT = int(os.environ.get(
+    'LIFETRACK_DASHBOARD_CACHE_TIMEOUT', '3600' if _shared_cache else '5',
+))
+
+
+# Request metrics
+# Fraction of requests (0.0 - 1.0) that get Server-Timing headers and feed the
+# /metrics/ histograms. 0 disables the middleware entirely.
+
+LIFETRACK_METRICS_SAMPLE_RATE = float(os.environ.get('LIFETRACK_METRICS_SAMPLE_RATE', '0'))
+
+
+# Cold history
+# Completions older than this many days are moved out of the live Occurence
+# table by `manage.py compact_history` and become read-only.
+
+LIFETRACK_ARCHIVE_AFTER_DAYS = int(os.environ.get('LIFETRACK_ARCHIVE_AFTER_DAYS', '365'))
+
+
+# Sessions and auth
+# LIFETRACK_SESSION_ENGINE: cached_db (sessions are read from the cache and
+# written through to the database), signed_cookies (no server-side storage at
+# all) or db (Django's default). cached_db is the default only with a shared
+# cache: with a per-process one, a logout on one worker would leave the
+# session cached, and accepted, on the others.
+# The auth backend loads the user with its profile in one query; with
+# LIFETRACK_AUTH_CACHE_TTL > 0 it is cached for that many seconds too, which
+# likewise needs a shared cache and is ignored without one.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'LIFETRACK_SESSION_ENGINE', 'cached_db' if _shared_cache else 'db',
+)
+
+AUTHENTICATION_BACKENDS = [
+    'lifetrack.auth.ProfileModelBackend',
+    # Sessions created before ProfileModelBackend still name this one
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+LIFETRACK_AUTH_CACHE_TTL = int(os.environ.get('LIFETRACK_AUTH_CACHE_TTL', '0')) if _shared_cache else 0
+
+
+# Reminders
+# Where `manage.py dispatch_reminders` hands due reminders: the database
+# outbox (ReminderMessage rows) or FileOutbox, which appends JSON lines to
+# LIFETRACK_REMINDER_OUTBOX_PATH.
+
+LIFETRACK_REMINDER_OUTBOX = os.environ.get('LIFETRACK_REMINDER_OUTBOX', 'lifetrack.reminders.DatabaseOutbox')
+LIFETRACK_REMINDER_OUTBOX_PATH = os.environ.get('LIFETRACK_REMINDER_OUTBOX_PATH', os.path.join(BASE_DIR, 'reminders.jsonl'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -122,5 +225,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
+# The CSS, icons, jQuery and fonts under lifetrack/static/lifetrack/build/ come
+# from `npm run build` (see package.json and assets/). collectstatic gives
+# every file a content-hashed name and writes gzip and brotli copies next to
+# it; WhiteNoise serves those with far-future cache headers. The manifest
+# (STATIC_ROOT/staticfiles.json) ships with the lambda (vercel.json), and a
+# page that can't find it fails rather than linking uncacheable names.
+# LIFETRACK_STATIC_FALLBACK links the plain names where nothing was collected
+# (DEBUG, tests, benchmarks, `runserver`; see lifetrack/storage.py).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'lifetrack.storage.AssetStorage'},
+}
 WHITENOISE_USE_FINDERS = True
+LIFETRACK_STATIC_FALLBACK = os.environ.get('LIFETRACK_STATIC_FALLBACK', '1' if DEBUG else '0') == '1'
+
+TEST_RUNNER = 'lifetrack.test_runner.LifetrackTestRunner'
@@ -0,0 +1,117 @@
+"""
+Serverless cold-start handling for the app entry points.
+
+Migrations belong in the deploy step (build_files.sh, which vercel.json runs
+on every deploy). On the first request of an instance we only check that the
+database has every migration this code ships, which is a single query.
+LIFETRACK_STARTUP_MODE selects:
+
+    check   (default) compare applied migrations to the ones on disk
+    migrate run `migrate` on the first request (slow, opt-in for setups
+            without a deploy step)
+    off     skip schema handling entirely
+
+While migrations are missing (or `migrate` failed), requests get a 503 and
+the check is repeated on the next one (see index.py and lt/asgi.py), rather
+than pages failing on a missing column.
+
+Startup timings are written to stderr as one JSON line so they show up in the
+Vercel logs.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+
+class StartupTimer:
+    """Records the time between successive startup phases."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self._last = self.started
+        self.timings = {}
+        self.reported = False
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.timings[f'{phase}_ms'] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        self.timings['total_ms'] = round((time.perf_counter() - self.started) * 1000, 1)
+        sys.stderr.write(f"STARTUP: {json.dumps(self.timings)}\n")
+
+
+class SchemaError(Exception):
+    """The database is missing migrations this code needs."""
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def check_schema():
+    from django.core.exceptions import ImproperlyConfigured
+    from django.db import connection
+    from lifetrack.schema import missing_migrations
+
+    db_config = connection.settings_dict
+    if not db_config.get('NAME') and 'sqlite' not in db_config.get('ENGINE', ''):
+        raise ImproperlyConfigured(
+            "Database not properly configured. Check DATABASE_URL environment variable."
+        )
+
+    missing = missing_migrations()
+    if missing:
+        # Not migrated here: many instances may cold-start at once. The deploy step has to do it
+        raise SchemaError(
+            f"database is missing {len(missing)} migrations for this build "
+            f"(first: {', '.join(missing[:5])}). Run `python manage.py migrate` in the deploy step."
+        )
+
+
+def run_migrations():
+    from django.core.management import call_command
+
+    sys.stderr.write("MIGRATION: Starting database migrations...\n")
+    call_command('migrate', verbosity=1, interactive=False)
+    sys.stderr.write("MIGRATION: Completed successfully\n")
+
+
+def ensure_schema(timer=None):
+    """
+    Run the configured schema handling once per process. A failure is logged
+    and re-raised, and retried on the next request rather than being recorded
+    as done.
+    """
+    global _schema_ready
+
+    if _schema_ready:
+        return
+
+    with _schema_lock:
+        if _schema_ready:
+            return
+
+        mode = os.environ.get('LIFETRACK_STARTUP_MODE', 'check')
+        from django.db import close_old_connections
+        close_old_connections()
+        try:
+            if mode == 'migrate':
+                run_migrations()
+            elif mode == 'check':
+                check_schema()
+            _schema_ready = True
+        except Exception as e:
+            sys.stderr.write(f"STARTUP ERROR ({mode}): {e}\n")
+            sys.stderr.write(traceback.format_exc())
+            raise
+        finally:
+            if timer is not None:
+                timer.mark(f'schema_{mode}')